@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ai.services import results
+
+
+class Command(BaseCommand):
+    help = "Copy successful caption jobs that were not applied yet onto their photos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="Jobs applied per transaction.")
+
+    def handle(self, *args, **options):
+        applied = results.apply_pending_results(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Applied {applied} caption result(s)."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ai.services import caption_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete cached captions. Without filters, only entries produced by a prompt "
+        "version other than the current one are removed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", help="Only entries for this model.")
+        parser.add_argument("--prompt-version", help="Only entries for this prompt version.")
+        parser.add_argument("--all", action="store_true", help="Also delete current entries.")
+
+    def handle(self, *args, **options):
+        stale_only = not (options["all"] or options["model"] or options["prompt_version"])
+        deleted = caption_cache.invalidate(
+            model=options["model"], version=options["prompt_version"], stale_only=stale_only
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} cached caption(s)."))
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from ai.tasks.worker import CaptionWorker
+
+
+class Command(BaseCommand):
+    help = "Claim pending AI caption jobs and run them until stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=settings.AI_WORKER_CONCURRENCY)
+        parser.add_argument("--batch-size", type=int, default=settings.AI_WORKER_BATCH_SIZE)
+        parser.add_argument(
+            "--lease-seconds", type=int, default=settings.AI_WORKER_LEASE_SECONDS
+        )
+        parser.add_argument(
+            "--handler",
+            default=settings.AI_CAPTION_HANDLER,
+            help="Dotted path to the caption handler callable.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once the queue is empty."
+        )
+
+    def handle(self, *args, **options):
+        if not options["handler"]:
+            raise CommandError("No caption handler configured (AI_CAPTION_HANDLER).")
+        worker = CaptionWorker(
+            import_string(options["handler"]),
+            concurrency=options["concurrency"],
+            batch_size=options["batch_size"],
+            lease_seconds=options["lease_seconds"],
+        )
+        processed = worker.run(once=options["once"])
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} caption job(s)."))
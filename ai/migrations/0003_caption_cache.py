@@ -0,0 +1,47 @@
+# Generated by Django 5.1.1 on 2026-10-17 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai", "0002_caption_job_leases"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aicaptionjob",
+            name="prompt_version",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.CreateModel(
+            name="CaptionCacheEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("checksum", models.CharField(max_length=64)),
+                ("model", models.CharField(max_length=100)),
+                ("prompt_version", models.CharField(max_length=64)),
+                ("caption_ko", models.TextField(blank=True)),
+                ("raw_response", models.JSONField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("checksum", "model", "prompt_version"),
+                        name="caption_cache_key_unique",
+                    )
+                ],
+            },
+        ),
+    ]
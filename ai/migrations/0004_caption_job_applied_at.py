@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-17 01:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai", "0003_caption_cache"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aicaptionjob",
+            name="applied_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
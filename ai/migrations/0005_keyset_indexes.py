@@ -0,0 +1,20 @@
+# Generated by Django 5.1.1 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai", "0004_caption_job_applied_at"),
+        ("photos", "0005_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="aicaptionjob",
+            index=models.Index(
+                fields=["created_at", "id"], name="captionjob_created_id_idx"
+            ),
+        ),
+    ]
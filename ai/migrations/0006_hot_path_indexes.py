@@ -0,0 +1,52 @@
+# Generated by Django 5.1.1 on 2026-10-17 02:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai", "0005_keyset_indexes"),
+        ("photos", "0007_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="aicaptionjob",
+            index=models.Index(
+                fields=["photo", "model", "status"], name="captionjob_photo_model_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="aicaptionjob",
+            index=models.Index(
+                condition=models.Q(("status", "pending")),
+                fields=["created_at", "id"],
+                name="captionjob_pending_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="aicaptionjob",
+            index=models.Index(
+                condition=models.Q(("status", "running")),
+                fields=["lease_expires_at"],
+                name="captionjob_running_lease_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="aicaptionjob",
+            index=models.Index(
+                condition=models.Q(("status", "running")),
+                fields=["lease_owner"],
+                name="captionjob_running_owner_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="aicaptionjob",
+            index=models.Index(
+                condition=models.Q(("applied_at__isnull", True), ("status", "success")),
+                fields=["finished_at", "id"],
+                name="captionjob_unapplied_idx",
+            ),
+        ),
+    ]
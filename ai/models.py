@@ -18,15 +18,66 @@ class AICaptionJob(models.Model):
         max_length=20, choices=CaptionJobStatus.choices, default=CaptionJobStatus.PENDING
     )
     model = models.CharField(max_length=100)
+    prompt_version = models.CharField(max_length=64, blank=True)
     caption_ko = models.TextField(blank=True)
     raw_response = models.JSONField(null=True, blank=True)
     error_message = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    lease_owner = models.CharField(max_length=64, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
     started_at = models.DateTimeField(null=True, blank=True)
     finished_at = models.DateTimeField(null=True, blank=True)
+    applied_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="captionjob_created_id_idx"),
+            models.Index(fields=["photo", "model", "status"], name="captionjob_photo_model_idx"),
+            # Partial indexes stay small: each covers only the rows one worker
+            # query is looking for.
+            models.Index(
+                fields=["created_at", "id"],
+                name="captionjob_pending_idx",
+                condition=models.Q(status="pending"),
+            ),
+            models.Index(
+                fields=["lease_expires_at"],
+                name="captionjob_running_lease_idx",
+                condition=models.Q(status="running"),
+            ),
+            models.Index(
+                fields=["lease_owner"],
+                name="captionjob_running_owner_idx",
+                condition=models.Q(status="running"),
+            ),
+            models.Index(
+                fields=["finished_at", "id"],
+                name="captionjob_unapplied_idx",
+                condition=models.Q(status="success", applied_at__isnull=True),
+            ),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover - simple representation
         return f"Caption job {self.pk} for photo {self.photo_id}"
+
+
+class CaptionCacheEntry(models.Model):
+    checksum = models.CharField(max_length=64)
+    model = models.CharField(max_length=100)
+    prompt_version = models.CharField(max_length=64)
+    caption_ko = models.TextField(blank=True)
+    raw_response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["checksum", "model", "prompt_version"], name="caption_cache_key_unique"
+            ),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover - simple representation
+        return f"{self.model}/{self.prompt_version} caption for {self.checksum}"
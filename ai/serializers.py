@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+from django.conf import settings
+from django.db.models import Exists, OuterRef, QuerySet
 from rest_framework import serializers
 
 from ai.models import AICaptionJob, CaptionJobStatus
-from photos.models import Photo, PhotoVisibility
+from photos.models import Photo, PhotoVisibility, Tag
+from photos.selectors.visibility import with_tags
 
 
 class AICaptionJobSerializer(serializers.ModelSerializer):
@@ -50,3 +53,51 @@ class AICaptionJobSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data.setdefault("status", CaptionJobStatus.PENDING)
         return super().create(validated_data)
+
+
+class BulkCaptionJobSerializer(serializers.Serializer):
+    model = serializers.CharField(max_length=100)
+    photos = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+        max_length=settings.AI_BULK_MAX_PHOTO_IDS,
+    )
+    tag = serializers.CharField(max_length=Tag._meta.get_field("name").max_length, required=False)
+    uncaptioned = serializers.BooleanField(required=False, default=False)
+
+    def validate_photos(self, value: list[int]) -> list[int]:
+        photo_ids = set(value)
+        owned = set(
+            Photo.objects.filter(owner=self.context["request"].user, id__in=photo_ids).values_list(
+                "id", flat=True
+            )
+        )
+        missing = sorted(photo_ids - owned)
+        if missing:
+            raise serializers.ValidationError(
+                f"Photos must belong to the requesting user: {missing[:20]}"
+            )
+        return sorted(photo_ids)
+
+    def validate(self, attrs):
+        if not (attrs.get("photos") or attrs.get("tag") or attrs["uncaptioned"]):
+            raise serializers.ValidationError("Provide photos, tag or uncaptioned to select photos.")
+        return attrs
+
+    def get_photos(self) -> QuerySet[Photo]:
+        data = self.validated_data
+        queryset = Photo.objects.filter(owner=self.context["request"].user)
+        if data.get("photos"):
+            queryset = queryset.filter(id__in=data["photos"])
+        if data.get("tag"):
+            queryset = with_tags(queryset, [data["tag"]])
+        if data["uncaptioned"]:
+            queryset = queryset.exclude(
+                Exists(
+                    AICaptionJob.objects.filter(
+                        photo=OuterRef("pk"), status=CaptionJobStatus.SUCCESS
+                    )
+                )
+            )
+        return queryset
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import hashlib
+
+from django.conf import settings
+from django.db.models import Q
+
+from ai.models import AICaptionJob, CaptionCacheEntry
+
+CacheKey = tuple[str, str, str]
+
+
+def prompt_version() -> str:
+    """The configured prompt version, or a digest of the prompt text.
+
+    Deriving it from the prompt means editing AI_CAPTION_PROMPT invalidates
+    earlier captions without anyone having to remember to bump a version.
+    """
+    if settings.AI_CAPTION_PROMPT_VERSION:
+        return settings.AI_CAPTION_PROMPT_VERSION
+    return hashlib.sha256(settings.AI_CAPTION_PROMPT.encode()).hexdigest()[:12]
+
+
+def cache_key(job: AICaptionJob) -> CacheKey:
+    return job.photo.checksum, job.model, job.prompt_version or prompt_version()
+
+
+def lookup(keys) -> dict[CacheKey, CaptionCacheEntry]:
+    keys = set(keys)
+    if not keys:
+        return {}
+    condition = Q()
+    for checksum, model, version in keys:
+        condition |= Q(checksum=checksum, model=model, prompt_version=version)
+    entries = CaptionCacheEntry.objects.filter(condition)
+    return {(entry.checksum, entry.model, entry.prompt_version): entry for entry in entries}
+
+
+def store(key: CacheKey, caption: str, raw_response) -> None:
+    checksum, model, version = key
+    CaptionCacheEntry.objects.bulk_create(
+        [
+            CaptionCacheEntry(
+                checksum=checksum,
+                model=model,
+                prompt_version=version,
+                caption_ko=caption,
+                raw_response=raw_response,
+            )
+        ],
+        update_conflicts=True,
+        unique_fields=["checksum", "model", "prompt_version"],
+        update_fields=["caption_ko", "raw_response"],
+    )
+
+
+def invalidate(model: str | None = None, version: str | None = None, stale_only: bool = False) -> int:
+    entries = CaptionCacheEntry.objects.all()
+    if model:
+        entries = entries.filter(model=model)
+    if version:
+        entries = entries.filter(prompt_version=version)
+    if stale_only:
+        entries = entries.exclude(prompt_version=prompt_version())
+    deleted, _ = entries.delete()
+    return deleted
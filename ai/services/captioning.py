@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from ai.models import AICaptionJob
+from ai.services.ollama import OllamaClient
+from ai.services.preprocessing import prepare_model_input
+
+
+class _ClientLoop:
+    """Runs one OllamaClient on a background event loop shared by worker threads.
+
+    Sharing a single loop and client is what lets connections be reused and
+    the per-model in-flight limit hold across all of a worker's threads.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.client: OllamaClient | None = None
+        threading.Thread(target=self.loop.run_forever, name="ollama-client", daemon=True).start()
+
+    def run(self, coroutine_factory):
+        async def call():
+            base_url = settings.OLLAMA_BASE_URL
+            if self.client is None or self.client.base_url != base_url:
+                if self.client is not None:
+                    await self.client.aclose()
+                self.client = OllamaClient(
+                    base_url,
+                    max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+                    max_inflight_per_model=settings.OLLAMA_MAX_INFLIGHT_PER_MODEL,
+                    timeout=settings.OLLAMA_TIMEOUT,
+                    max_retries=settings.OLLAMA_MAX_RETRIES,
+                    retry_backoff=settings.OLLAMA_RETRY_BACKOFF,
+                )
+            return await coroutine_factory(self.client)
+
+        return asyncio.run_coroutine_threadsafe(call(), self.loop).result()
+
+
+_client_loop: _ClientLoop | None = None
+_client_loop_lock = threading.Lock()
+
+
+def run_with_client(coroutine_factory):
+    global _client_loop
+    with _client_loop_lock:
+        if _client_loop is None:
+            _client_loop = _ClientLoop()
+    return _client_loop.run(coroutine_factory)
+
+
+def parse_caption_response(raw_response: dict | None) -> tuple[str, list[str]]:
+    """Split a generate reply into ``(caption, tags)``.
+
+    The prompt asks for ``{"caption": ..., "tags": [...]}``; models that
+    answer in plain text still yield that text as the caption.
+    """
+    text = ((raw_response or {}).get("response") or "").strip()
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        return text, []
+    if not isinstance(parsed, dict):
+        return text, []
+    tags = parsed.get("tags") or []
+    return (
+        str(parsed.get("caption") or "").strip(),
+        [str(tag) for tag in tags if isinstance(tag, (str, int))] if isinstance(tags, list) else [],
+    )
+
+
+def caption_job(job: AICaptionJob) -> tuple[str, dict]:
+    """Caption handler for the worker: send the photo to Ollama, return the caption."""
+    if not job.photo.file:
+        raise ValueError("Photo has no file to caption")
+    model_input = prepare_model_input(job.photo, job.model)
+    open_image = partial(default_storage.open, model_input, "rb")
+    raw_response = run_with_client(
+        lambda client: client.generate(
+            job.model, settings.AI_CAPTION_PROMPT, open_image, format="json"
+        )
+    )
+    caption, _ = parse_caption_response(raw_response)
+    return caption, raw_response
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, QuerySet
+
+from ai.models import AICaptionJob, CaptionJobStatus
+from photos.models import Photo
+
+# A photo with one of these jobs for the model is already captioned or queued.
+ACTIVE_STATUSES = (CaptionJobStatus.PENDING, CaptionJobStatus.RUNNING, CaptionJobStatus.SUCCESS)
+
+
+def has_active_job(model: str) -> Exists:
+    return Exists(
+        AICaptionJob.objects.filter(photo=OuterRef("pk"), model=model, status__in=ACTIVE_STATUSES)
+    )
+
+
+def enqueue_caption_jobs(
+    photos: QuerySet[Photo], model: str, batch_size: int | None = None
+) -> tuple[int, int]:
+    """Queue a pending job for every photo in ``photos`` without an active one.
+
+    Returns ``(matched, created)``.
+    """
+    batch_size = batch_size or settings.AI_BULK_ENQUEUE_BATCH_SIZE
+    with transaction.atomic():
+        matched = photos.count()
+        photo_ids = list(
+            photos.exclude(has_active_job(model)).order_by("pk").values_list("pk", flat=True)
+        )
+        for start in range(0, len(photo_ids), batch_size):
+            AICaptionJob.objects.bulk_create(
+                AICaptionJob(photo_id=photo_id, model=model)
+                for photo_id in photo_ids[start : start + batch_size]
+            )
+    return matched, len(photo_ids)
@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import random
+import ssl
+from contextlib import asynccontextmanager
+from typing import BinaryIO, Callable
+from urllib.parse import urlsplit
+
+# Base64 turns every 3 input bytes into 4 output bytes, so reading in
+# multiples of 3 lets each chunk be encoded independently.
+IMAGE_READ_SIZE = 3 * 64 * 1024
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class OllamaError(Exception):
+    def __init__(self, message: str, status: int | None = None, retryable: bool = False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @property
+    def usable(self) -> bool:
+        return not self.writer.is_closing() and not self.reader.at_eof()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class OllamaClient:
+    """Minimal asyncio HTTP/1.1 client for the Ollama generate API.
+
+    Connections are kept alive and reused across requests, at most
+    ``max_inflight_per_model`` requests run against one model at a time, and
+    image bodies are base64-encoded while they stream from their file, so an
+    image is never held in memory as a whole.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        max_connections: int = 8,
+        max_inflight_per_model: int = 2,
+        timeout: float = 120,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+    ):
+        parts = urlsplit(base_url)
+        self.base_url = base_url
+        self.host = parts.hostname or "localhost"
+        self.ssl = ssl.create_default_context() if parts.scheme == "https" else None
+        self.port = parts.port or (443 if self.ssl else 80)
+        self.base_path = parts.path.rstrip("/")
+        self.max_inflight_per_model = max_inflight_per_model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._connection_slots = asyncio.Semaphore(max_connections)
+        self._idle: list[_Connection] = []
+        self._model_slots: dict[str, asyncio.Semaphore] = {}
+
+    async def __aenter__(self) -> OllamaClient:
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        while self._idle:
+            self._idle.pop().close()
+
+    @asynccontextmanager
+    async def _connection(self):
+        async with self._connection_slots:
+            connection = None
+            while self._idle and connection is None:
+                candidate = self._idle.pop()
+                if candidate.usable:
+                    connection = candidate
+                else:
+                    candidate.close()
+            if connection is None:
+                reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+                connection = _Connection(reader, writer)
+            keep = False
+            try:
+                yield connection
+                keep = connection.usable
+            finally:
+                if keep:
+                    self._idle.append(connection)
+                else:
+                    connection.close()
+
+    async def _send(self, connection: _Connection, path: str, body) -> tuple[int, bytes, bool]:
+        header_lines = [
+            f"POST {self.base_path}{path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            "Content-Type: application/json",
+            f"Content-Length: {body.length}",
+            "Connection: keep-alive",
+        ]
+        writer = connection.writer
+        writer.write(("\r\n".join(header_lines) + "\r\n\r\n").encode("latin-1"))
+        async for part in body.parts():
+            writer.write(part)
+            await writer.drain()
+
+        reader = connection.reader
+        status_line = (await reader.readline()).decode("latin-1")
+        if not status_line:
+            raise ConnectionResetError("Connection closed before a response was received")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        reusable = headers.get("connection", "").lower() != "close"
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            payload = b"".join(chunks)
+        elif "content-length" in headers:
+            payload = await reader.readexactly(int(headers["content-length"]))
+        else:
+            payload = await reader.read()
+            reusable = False
+        if not reusable:
+            connection.close()
+        return status, payload, reusable
+
+    async def _post(self, path: str, body) -> dict:
+        attempt = 0
+        while True:
+            try:
+                async with self._connection() as connection:
+                    status, payload, _ = await asyncio.wait_for(
+                        self._send(connection, path, body), self.timeout
+                    )
+                if status >= 400:
+                    raise OllamaError(
+                        f"Ollama returned HTTP {status}: {payload[:200]!r}",
+                        status=status,
+                        retryable=status in RETRYABLE_STATUSES,
+                    )
+                return json.loads(payload)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as exc:
+                error = OllamaError(f"Ollama request failed: {exc!r}", retryable=True)
+            except OllamaError as exc:
+                error = exc
+            except ValueError as exc:
+                raise OllamaError(f"Ollama returned an invalid response: {exc}") from exc
+            if not error.retryable or attempt >= self.max_retries:
+                raise error
+            await asyncio.sleep(self.retry_backoff * 2**attempt * (1 + random.random()))
+            attempt += 1
+
+    def _model_slot(self, model: str) -> asyncio.Semaphore:
+        if model not in self._model_slots:
+            self._model_slots[model] = asyncio.Semaphore(self.max_inflight_per_model)
+        return self._model_slots[model]
+
+    async def generate(
+        self,
+        model: str,
+        prompt: str,
+        open_image: Callable[[], BinaryIO] | None = None,
+        **options,
+    ) -> dict:
+        """Call ``/api/generate`` without streaming and return its JSON reply.
+
+        ``open_image`` returns a fresh binary file object; it is called again
+        for every retry so the body can be re-streamed from the start.
+        """
+        payload = {"model": model, "prompt": prompt, "stream": False, **options}
+        async with self._model_slot(model):
+            return await self._post("/api/generate", _GenerateBody(payload, open_image))
+
+
+class _GenerateBody:
+    def __init__(self, payload: dict, open_image: Callable[[], BinaryIO] | None):
+        self.open_image = open_image
+        if open_image is None:
+            self.prefix, self.suffix, self.image_size = json.dumps(payload).encode(), b"", 0
+            return
+        # '{..., "images": ["' + base64 + '"]}', with the image spliced in as it streams
+        encoded = json.dumps({**payload, "images": [""]}).encode()
+        split = encoded.rindex(b'""') + 1
+        self.prefix, self.suffix = encoded[:split], encoded[split:]
+        with open_image() as image:
+            image.seek(0, 2)
+            self.image_size = image.tell()
+
+    @property
+    def length(self) -> int:
+        return len(self.prefix) + 4 * -(-self.image_size // 3) + len(self.suffix)
+
+    async def parts(self):
+        yield self.prefix
+        if self.open_image is not None:
+            image = await asyncio.to_thread(self.open_image)
+            remainder = b""
+            try:
+                while True:
+                    chunk = await asyncio.to_thread(image.read, IMAGE_READ_SIZE)
+                    if not chunk:
+                        break
+                    chunk = remainder + chunk
+                    cut = len(chunk) - len(chunk) % 3
+                    remainder = chunk[cut:]
+                    if cut:
+                        yield base64.b64encode(chunk[:cut])
+            finally:
+                image.close()
+            if remainder:
+                yield base64.b64encode(remainder)
+        yield self.suffix
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from photos.models import Photo
+from photos.services.imaging import render_variant
+from photos.services.pool import submit
+from photos.services.thumbnails import render_source
+
+MODEL_INPUTS_DIR = os.path.join("ai", "inputs")
+
+
+def model_input_size(model: str) -> int:
+    sizes = settings.AI_MODEL_INPUT_SIZES
+    # Ollama tags ("llava:13b") share the input resolution of their base model.
+    return (
+        sizes.get(model) or sizes.get(model.split(":")[0]) or settings.AI_MODEL_INPUT_DEFAULT_SIZE
+    )
+
+
+def model_input_name(checksum: str, edge: int) -> str:
+    return os.path.join(MODEL_INPUTS_DIR, str(edge), checksum[:2], f"{checksum}.jpg")
+
+
+def prepare_model_input(photo: Photo, model: str) -> str:
+    """Return the storage name of ``photo`` downscaled for ``model``, rendering it once.
+
+    Inputs are keyed by checksum and edge length, so models with the same input
+    size and duplicate uploads of the same bytes share one file. Workers that
+    render the same input at once both end up with that one name.
+    """
+    edge = model_input_size(model)
+    name = model_input_name(photo.checksum, edge)
+    if default_storage.exists(name):
+        return name
+    content = submit(
+        render_variant,
+        render_source(photo),
+        (edge, edge),
+        "JPEG",
+        settings.AI_MODEL_INPUT_QUALITY,
+    ).result()
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        saved = default_storage.save(name, ContentFile(content))
+        if saved != name:
+            # Another worker stored the same input first; keep theirs.
+            default_storage.delete(saved)
+        return name
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".")
+    with os.fdopen(fd, "wb") as temp_file:
+        temp_file.write(content)
+    os.replace(temp_path, path)
+    return name
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, TextField, Value, When
+from django.utils import timezone
+
+from ai.models import AICaptionJob, CaptionJobStatus
+from ai.services.captioning import parse_caption_response
+from photos.models import Photo, TagSource
+from photos.services.tags import sync_photo_tags
+from photos.signals import photos_changed
+
+
+def unapplied_jobs():
+    return AICaptionJob.objects.filter(status=CaptionJobStatus.SUCCESS, applied_at__isnull=True)
+
+
+def apply_results(jobs: Sequence[AICaptionJob]) -> int:
+    """Copy successful captions onto their photos in one transaction.
+
+    Captions only fill blank descriptions, so text a user wrote is never
+    replaced. Applying the same job twice is harmless.
+    """
+    described = {}
+    tag_names = {}
+    for job in jobs:
+        _, tags = parse_caption_response(job.raw_response)
+        tag_names.setdefault(job.photo_id, []).extend(tags)
+        photo = described.get(job.photo_id, job.photo)
+        if job.caption_ko and not photo.description:
+            photo.description = job.caption_ko
+            described[job.photo_id] = photo
+    with transaction.atomic():
+        sync_photo_tags(tag_names, source=TagSource.AI, replace=False)
+        if described:
+            # Conditional on the stored row, not the snapshot above: a description
+            # the user writes meanwhile must win.
+            Photo.objects.filter(pk__in=described, description="").update(
+                description=Case(
+                    *(
+                        When(pk=photo_id, then=Value(photo.description))
+                        for photo_id, photo in described.items()
+                    ),
+                    output_field=TextField(),
+                )
+            )
+        AICaptionJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            applied_at=timezone.now()
+        )
+        photos_changed.send(sender=AICaptionJob, photo_ids={job.photo_id for job in jobs})
+    return len(jobs)
+
+
+def apply_pending_results(batch_size: int | None = None) -> int:
+    batch_size = batch_size or settings.AI_RESULT_BATCH_SIZE
+    applied = 0
+    while True:
+        jobs = list(
+            unapplied_jobs()
+            .select_related("photo")
+            .only("photo_id", "caption_ko", "raw_response", "photo__id", "photo__description")
+            .order_by("finished_at", "id")[:batch_size]
+        )
+        if jobs:
+            applied += apply_results(jobs)
+        if len(jobs) < batch_size:
+            return applied
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import logging
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from typing import Callable
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from ai.models import AICaptionJob, CaptionJobStatus
+from ai.services import caption_cache, results
+
+logger = logging.getLogger(__name__)
+
+# A handler receives a claimed job (with ``photo`` loaded) and returns
+# ``(caption_ko, raw_response)``. Handlers run on worker threads and must not
+# query the database; all job bookkeeping happens on the worker's main thread.
+CaptionHandler = Callable[[AICaptionJob], "tuple[str, dict]"]
+
+
+def requeue_expired_leases(now=None) -> int:
+    """Return jobs held by dead workers to the queue, or fail them after too many tries."""
+    now = now or timezone.now()
+    expired = AICaptionJob.objects.filter(
+        status=CaptionJobStatus.RUNNING, lease_expires_at__lt=now
+    )
+    requeued = expired.filter(attempts__lt=settings.AI_WORKER_MAX_ATTEMPTS).update(
+        status=CaptionJobStatus.PENDING, lease_owner="", lease_expires_at=None
+    )
+    expired.update(
+        status=CaptionJobStatus.FAILED,
+        error_message="Worker lease expired too many times",
+        finished_at=now,
+        lease_owner="",
+        lease_expires_at=None,
+    )
+    return requeued
+
+
+def claim_jobs(batch_size: int, lease_seconds: int) -> tuple[str, list[AICaptionJob]]:
+    """Lease up to ``batch_size`` pending jobs, oldest first.
+
+    The conditional UPDATE is the claim: a row only changes hands while it is
+    still pending, so concurrent workers (even on SQLite, which has no
+    SELECT ... FOR UPDATE SKIP LOCKED) never lease the same job twice.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    candidates = list(
+        AICaptionJob.objects.filter(status=CaptionJobStatus.PENDING)
+        .order_by("created_at", "id")
+        .values_list("id", flat=True)[:batch_size]
+    )
+    if not candidates:
+        return token, []
+    AICaptionJob.objects.filter(id__in=candidates, status=CaptionJobStatus.PENDING).update(
+        status=CaptionJobStatus.RUNNING,
+        lease_owner=token,
+        lease_expires_at=now + timedelta(seconds=lease_seconds),
+        attempts=F("attempts") + 1,
+        prompt_version=caption_cache.prompt_version(),
+        started_at=None,
+        finished_at=None,
+    )
+    jobs = AICaptionJob.objects.select_related("photo").filter(
+        lease_owner=token, status=CaptionJobStatus.RUNNING
+    )
+    return token, list(jobs.order_by("created_at", "id"))
+
+
+def renew_lease(token: str, lease_seconds: int) -> int:
+    return AICaptionJob.objects.filter(
+        lease_owner=token, status=CaptionJobStatus.RUNNING
+    ).update(lease_expires_at=timezone.now() + timedelta(seconds=lease_seconds))
+
+
+def _finish(job: AICaptionJob, token: str, **fields) -> bool:
+    # Only the current lease holder may record a result; a worker whose lease
+    # expired and was re-claimed elsewhere silently loses.
+    now = timezone.now()
+    return bool(
+        AICaptionJob.objects.filter(
+            pk=job.pk, lease_owner=token, status=CaptionJobStatus.RUNNING
+        ).update(
+            started_at=job.started_at or now,
+            finished_at=now,
+            lease_owner="",
+            lease_expires_at=None,
+            **fields,
+        )
+    )
+
+
+def complete_job(job: AICaptionJob, token: str, caption: str, raw_response) -> bool:
+    return _finish(
+        job,
+        token,
+        status=CaptionJobStatus.SUCCESS,
+        caption_ko=caption,
+        raw_response=raw_response,
+        error_message="",
+    )
+
+
+def fail_job(job: AICaptionJob, token: str, error: str) -> bool:
+    return _finish(job, token, status=CaptionJobStatus.FAILED, error_message=error)
+
+
+class CaptionWorker:
+    def __init__(
+        self,
+        handler: CaptionHandler,
+        concurrency: int | None = None,
+        batch_size: int | None = None,
+        lease_seconds: int | None = None,
+        poll_interval: float | None = None,
+    ):
+        self.handler = handler
+        self.concurrency = concurrency or settings.AI_WORKER_CONCURRENCY
+        self.batch_size = batch_size or settings.AI_WORKER_BATCH_SIZE
+        self.lease_seconds = lease_seconds or settings.AI_WORKER_LEASE_SECONDS
+        self.poll_interval = (
+            settings.AI_WORKER_POLL_INTERVAL if poll_interval is None else poll_interval
+        )
+
+    def run_batch(self, executor: ThreadPoolExecutor) -> int:
+        requeue_expired_leases()
+        token, jobs = claim_jobs(self.batch_size, self.lease_seconds)
+
+        # Jobs for the same bytes, model and prompt share one model call, and
+        # are answered from the cache when an earlier job already made it.
+        groups: dict[caption_cache.CacheKey, list[AICaptionJob]] = {}
+        for job in jobs:
+            groups.setdefault(caption_cache.cache_key(job), []).append(job)
+        cached = caption_cache.lookup(groups)
+
+        pending = {}
+        for key, group in groups.items():
+            entry = cached.get(key)
+            if entry is not None:
+                for job in group:
+                    complete_job(job, token, entry.caption_ko, entry.raw_response)
+            else:
+                pending[executor.submit(self._call_handler, group[0])] = (key, group)
+
+        # Renew on a clock rather than only on idle waits: a batch whose jobs
+        # finish steadily can still outlast the lease as a whole.
+        renewed_at = time.monotonic()
+        while pending:
+            done, _ = wait(pending, timeout=self.lease_seconds / 3, return_when=FIRST_COMPLETED)
+            if time.monotonic() - renewed_at >= self.lease_seconds / 3:
+                renew_lease(token, self.lease_seconds)
+                renewed_at = time.monotonic()
+            for future in done:
+                key, group = pending.pop(future)
+                for job in group[1:]:
+                    job.started_at = group[0].started_at
+                try:
+                    caption, raw_response = future.result()
+                except Exception as exc:
+                    logger.warning("Caption job %s failed: %r", group[0].pk, exc)
+                    for job in group:
+                        fail_job(job, token, str(exc) or exc.__class__.__name__)
+                else:
+                    caption_cache.store(key, caption, raw_response)
+                    for job in group:
+                        complete_job(job, token, caption, raw_response)
+        if jobs:
+            results.apply_pending_results()
+        return len(jobs)
+
+    def _call_handler(self, job: AICaptionJob):
+        # Runs on a worker thread; the start time is written with the result.
+        job.started_at = timezone.now()
+        return self.handler(job)
+
+    def run(self, once: bool = False) -> int:
+        processed = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                claimed = self.run_batch(executor)
+                processed += claimed
+                if not claimed:
+                    if once:
+                        return processed
+                    time.sleep(self.poll_interval)
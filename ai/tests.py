@@ -1,3 +1,576 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from ai.models import AICaptionJob, CaptionCacheEntry, CaptionJobStatus
+from ai.services import caption_cache, preprocessing, results
+from ai.services.captioning import caption_job
+from ai.services.jobs import has_active_job
+from ai.services.ollama import OllamaClient, OllamaError
+from ai.services.preprocessing import model_input_name, prepare_model_input
+from ai.tasks.worker import (
+    CaptionWorker,
+    claim_jobs,
+    complete_job,
+    renew_lease,
+    requeue_expired_leases,
+)
+from photos.models import Photo, PhotoTag, Tag, TagSource
+from users.models import User
+
+
+class FakeOllamaServer:
+    """A local stand-in for the Ollama ``/api/generate`` endpoint.
+
+    Speaks keep-alive HTTP/1.1, records every request, can fail the first
+    ``fail_first`` requests with 503 and can delay replies to expose how many
+    requests the client has in flight at once.
+    """
+
+    def __init__(self, fail_first: int = 0, delay: float = 0.0, caption: str = "바닷가의 노을"):
+        self.fail_first = fail_first
+        self.delay = delay
+        self.caption = caption
+        self.requests: list[dict] = []
+        self.connections: set = set()
+        self.inflight = 0
+        self.max_inflight = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server.lock:
+                    server.connections.add(self.client_address)
+                    server.requests.append(payload)
+                    failing = len(server.requests) <= server.fail_first
+                    server.inflight += 1
+                    server.max_inflight = max(server.max_inflight, server.inflight)
+                time.sleep(server.delay)
+                with server.lock:
+                    server.inflight -= 1
+                if failing:
+                    status, reply = 503, {"error": "model is loading"}
+                else:
+                    answer = {"caption": server.caption, "tags": ["바다", "노을"]}
+                    reply = {
+                        "model": payload["model"],
+                        "response": json.dumps(answer, ensure_ascii=False),
+                        "done": True,
+                    }
+                body = json.dumps(reply).encode()
+                self.send_response(status if failing else 200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class OllamaClientTests(TestCase):
+    def test_streams_image_reuses_connections_and_retries(self):
+        image = os.urandom(200_001)
+
+        async def run(url):
+            async with OllamaClient(url, retry_backoff=0) as client:
+                return [
+                    await client.generate("llava", "describe", lambda: io.BytesIO(image))
+                    for _ in range(3)
+                ]
+
+        with FakeOllamaServer(fail_first=1) as server:
+            replies = asyncio.run(run(server.url))
+
+        self.assertEqual(len(replies), 3)
+        self.assertEqual(len(server.requests), 4)
+        self.assertEqual(base64.b64decode(server.requests[-1]["images"][0]), image)
+        self.assertEqual(len(server.connections), 1)
+
+    def test_limits_inflight_requests_per_model_and_gives_up_on_errors(self):
+        async def run(url):
+            async with OllamaClient(url, max_inflight_per_model=2) as client:
+                await asyncio.gather(*(client.generate("llava", "hi") for _ in range(6)))
+
+        with FakeOllamaServer(delay=0.05) as server:
+            asyncio.run(run(server.url))
+        self.assertEqual(server.max_inflight, 2)
+
+        async def failing(url):
+            async with OllamaClient(url, max_retries=1, retry_backoff=0) as client:
+                await client.generate("llava", "hi")
+
+        with FakeOllamaServer(fail_first=5) as server:
+            with self.assertRaises(OllamaError) as raised:
+                asyncio.run(failing(server.url))
+        self.assertEqual(raised.exception.status, 503)
+        self.assertEqual(len(server.requests), 2)
+
+
+class CaptionWorkerTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="testpass", name="Owner"
+        )
+        self.photos = [
+            Photo.objects.create(owner=self.owner, checksum=f"checksum-{index}", title=f"P{index}")
+            for index in range(3)
+        ]
+        self.jobs = [
+            AICaptionJob.objects.create(photo=photo, model="llava") for photo in self.photos
+        ]
+
+    def test_claims_never_overlap(self):
+        first_token, first = claim_jobs(batch_size=2, lease_seconds=60)
+        second_token, second = claim_jobs(batch_size=2, lease_seconds=60)
+        _, third = claim_jobs(batch_size=2, lease_seconds=60)
+
+        self.assertEqual([job.pk for job in first], [job.pk for job in self.jobs[:2]])
+        self.assertEqual([job.pk for job in second], [self.jobs[2].pk])
+        self.assertEqual(third, [])
+        self.assertNotEqual(first_token, second_token)
+        job = AICaptionJob.objects.get(pk=first[0].pk)
+        self.assertEqual((job.status, job.attempts), (CaptionJobStatus.RUNNING, 1))
+        # Stamped when a handler picks the job up, not when it is claimed.
+        self.assertIsNone(job.started_at)
+
+    @override_settings(AI_WORKER_MAX_ATTEMPTS=2)
+    def test_expired_leases_are_requeued_until_attempts_run_out(self):
+        token, jobs = claim_jobs(batch_size=3, lease_seconds=60)
+        AICaptionJob.objects.filter(pk=jobs[1].pk).update(attempts=2)
+        AICaptionJob.objects.filter(pk__in=[jobs[0].pk, jobs[1].pk]).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(requeue_expired_leases(), 1)
+
+        statuses = dict(AICaptionJob.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[jobs[0].pk], CaptionJobStatus.PENDING)
+        self.assertEqual(statuses[jobs[1].pk], CaptionJobStatus.FAILED)
+        self.assertEqual(statuses[jobs[2].pk], CaptionJobStatus.RUNNING)
+        # The worker that lost job 0 can no longer record a result for it
+        self.assertFalse(complete_job(jobs[0], token, "late", {}))
+
+    def test_worker_records_results_and_failures(self):
+        def handler(job):
+            if job.photo.title == "P1":
+                raise RuntimeError("model unavailable")
+            return f"caption for {job.photo.title}", {"response": job.photo.title}
+
+        with self.assertLogs("ai.tasks.worker", "WARNING"):
+            processed = CaptionWorker(handler, concurrency=2, batch_size=2).run(once=True)
+
+        self.assertEqual(processed, 3)
+        jobs = {job.photo.title: job for job in AICaptionJob.objects.select_related("photo")}
+        self.assertEqual(jobs["P0"].status, CaptionJobStatus.SUCCESS)
+        self.assertEqual(jobs["P0"].caption_ko, "caption for P0")
+        self.assertEqual(jobs["P0"].raw_response, {"response": "P0"})
+        self.assertEqual(jobs["P1"].status, CaptionJobStatus.FAILED)
+        self.assertEqual(jobs["P1"].error_message, "model unavailable")
+        for job in jobs.values():
+            self.assertIsNotNone(job.started_at)
+            self.assertIsNotNone(job.finished_at)
+            self.assertEqual(job.lease_owner, "")
+
+    def test_lease_is_renewed_while_a_long_batch_keeps_finishing_jobs(self):
+        for index in range(3, 6):
+            photo = Photo.objects.create(owner=self.owner, checksum=f"checksum-{index}")
+            AICaptionJob.objects.create(photo=photo, model="llava")
+
+        def handler(job):
+            time.sleep(0.25)
+            return "caption", {}
+
+        worker = CaptionWorker(handler, concurrency=1, batch_size=6, lease_seconds=1)
+        with mock.patch("ai.tasks.worker.renew_lease", wraps=renew_lease) as renew:
+            self.assertEqual(worker.run(once=True), 6)
+
+        self.assertGreaterEqual(renew.call_count, 2)
+        started = sorted(AICaptionJob.objects.values_list("started_at", flat=True))
+        self.assertGreaterEqual(started[-1] - started[0], timedelta(seconds=1))
+
+
+class CaptionCacheTests(TestCase):
+    def setUp(self):
+        self.photos = []
+        for index in range(2):
+            owner = User.objects.create_user(
+                email=f"user{index}@example.com", password="testpass", name=f"User {index}"
+            )
+            self.photos.append(Photo.objects.create(owner=owner, checksum="same-bytes"))
+        self.calls = []
+
+    def handler(self, job):
+        self.calls.append(job.pk)
+        return "해변", {"response": "해변"}
+
+    def run_worker(self):
+        CaptionWorker(self.handler, concurrency=2).run(once=True)
+
+    def test_same_bytes_are_captioned_once_and_then_served_from_cache(self):
+        first_jobs = [
+            AICaptionJob.objects.create(photo=photo, model="llava") for photo in self.photos
+        ]
+        self.run_worker()
+        self.assertEqual(len(self.calls), 1)
+
+        repeat = AICaptionJob.objects.create(photo=self.photos[0], model="llava")
+        other_model = AICaptionJob.objects.create(photo=self.photos[0], model="qwen2.5-vl")
+        self.run_worker()
+
+        self.assertEqual(self.calls, [first_jobs[0].pk, other_model.pk])
+        for job in AICaptionJob.objects.filter(pk__in=[*[j.pk for j in first_jobs], repeat.pk]):
+            self.assertEqual((job.status, job.caption_ko), (CaptionJobStatus.SUCCESS, "해변"))
+            self.assertEqual(job.prompt_version, caption_cache.prompt_version())
+
+    def test_prompt_change_and_explicit_invalidation_bypass_the_cache(self):
+        AICaptionJob.objects.create(photo=self.photos[0], model="llava")
+        self.run_worker()
+
+        with override_settings(AI_CAPTION_PROMPT="Describe the photo in English."):
+            AICaptionJob.objects.create(photo=self.photos[0], model="llava")
+            self.run_worker()
+            self.assertEqual(len(self.calls), 2)
+            self.assertEqual(caption_cache.invalidate(stale_only=True), 1)
+
+        self.assertEqual(CaptionCacheEntry.objects.count(), 1)
+        self.assertEqual(caption_cache.invalidate(model="qwen2.5-vl"), 0)
+        self.assertEqual(caption_cache.invalidate(model="llava"), 1)
+
+
+class CaptionResultTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="testpass", name="Owner"
+        )
+        Tag.objects.create(name="바다")
+
+    def make_finished_job(self, index, caption, tags, description=""):
+        photo = Photo.objects.create(
+            owner=self.owner, file=f"p{index}.jpg", checksum=f"c{index}", description=description
+        )
+        return AICaptionJob.objects.create(
+            photo=photo,
+            model="llava",
+            status=CaptionJobStatus.SUCCESS,
+            caption_ko=caption,
+            raw_response={"response": json.dumps({"caption": caption, "tags": tags})},
+            finished_at=timezone.now(),
+        )
+
+    def test_results_fill_blank_descriptions_and_add_ai_tags(self):
+        blank = self.make_finished_job(1, "해변의 노을", ["바다", " #노을 ", "바다"])
+        written = self.make_finished_job(2, "산책로", ["공원"], description="My walk")
+
+        self.assertEqual(results.apply_pending_results(), 2)
+
+        blank.photo.refresh_from_db()
+        written.photo.refresh_from_db()
+        self.assertEqual(blank.photo.description, "해변의 노을")
+        self.assertEqual(written.photo.description, "My walk")
+        self.assertCountEqual(
+            PhotoTag.objects.filter(source=TagSource.AI).values_list("photo_id", "tag__name"),
+            [(blank.photo_id, "바다"), (blank.photo_id, "노을"), (written.photo_id, "공원")],
+        )
+        self.assertFalse(results.unapplied_jobs().exists())
+        self.assertEqual(results.apply_pending_results(), 0)
+
+    def test_descriptions_written_after_loading_the_batch_are_kept(self):
+        job = self.make_finished_job(1, "해변의 노을", [])
+        jobs = list(results.unapplied_jobs().select_related("photo"))
+        Photo.objects.filter(pk=job.photo_id).update(description="Written meanwhile")
+
+        results.apply_results(jobs)
+
+        job.photo.refresh_from_db()
+        self.assertEqual(job.photo.description, "Written meanwhile")
+
+    def test_query_count_does_not_grow_with_batch(self):
+        for index in range(3):
+            self.make_finished_job(index, f"caption {index}", [f"tag {index}", "바다"])
+        with self.assertNumQueries(10):
+            results.apply_pending_results()
+
+        for index in range(3, 30):
+            self.make_finished_job(index, f"caption {index}", [f"tag {index}", "바다"])
+        with self.assertNumQueries(10):
+            self.assertEqual(results.apply_pending_results(), 27)
+
+
+class CaptionJobQueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(
+            email="owner@example.com", password="testpass", name="Owner"
+        )
+        photo = Photo.objects.create(owner=owner, file="p.jpg", checksum="p")
+        # A realistic mix (mostly finished jobs) plus fresh statistics, so the
+        # planner prefers the partial indexes the way it would in production.
+        finished = timezone.now()
+        AICaptionJob.objects.bulk_create(
+            AICaptionJob(
+                photo=photo,
+                model="llava",
+                status=CaptionJobStatus.SUCCESS,
+                finished_at=finished,
+                applied_at=finished,
+            )
+            for _ in range(200)
+        )
+        AICaptionJob.objects.create(photo=photo, model="llava")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, index_name):
+        self.assertIn(index_name, queryset.explain())
+
+    def test_worker_queries_use_partial_indexes(self):
+        now = timezone.now()
+        running = AICaptionJob.objects.filter(status=CaptionJobStatus.RUNNING)
+        self.assertUsesIndex(
+            AICaptionJob.objects.filter(status=CaptionJobStatus.PENDING).order_by(
+                "created_at", "id"
+            )[:8],
+            "captionjob_pending_idx",
+        )
+        self.assertUsesIndex(
+            running.filter(lease_expires_at__lt=now).order_by(), "captionjob_running_lease_idx"
+        )
+        self.assertUsesIndex(
+            running.filter(lease_owner="token").order_by(), "captionjob_running_owner_idx"
+        )
+        self.assertUsesIndex(
+            results.unapplied_jobs().order_by("finished_at", "id")[:200], "captionjob_unapplied_idx"
+        )
+
+    def test_active_job_check_is_an_index_search(self):
+        self.assertUsesIndex(
+            Photo.objects.filter(has_active_job("llava")), "captionjob_photo_model_idx"
+        )
+
+
+class OllamaCaptionHandlerTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root.name,
+            PHOTO_PROCESS_POOL_WORKERS=0,
+            AI_MODEL_INPUT_SIZES={"llava": 320},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        owner = User.objects.create_user(
+            email="owner@example.com", password="testpass", name="Owner"
+        )
+        original = io.BytesIO()
+        Image.new("RGB", (2000, 1000), (20, 80, 160)).save(original, "JPEG")
+        self.photo = Photo.objects.create(
+            owner=owner,
+            file=default_storage.save("photos/originals/beach.jpg", original),
+            checksum="beach",
+        )
+        self.job = AICaptionJob.objects.create(photo=self.photo, model="llava:13b")
+
+    def test_worker_sends_model_sized_image_and_writes_caption(self):
+        with FakeOllamaServer() as server, override_settings(OLLAMA_BASE_URL=server.url):
+            CaptionWorker(caption_job, concurrency=2).run(once=True)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, CaptionJobStatus.SUCCESS)
+        self.assertEqual(self.job.caption_ko, "바닷가의 노을")
+        self.assertEqual(self.job.raw_response["model"], "llava:13b")
+        self.photo.refresh_from_db()
+        self.assertEqual(self.photo.description, "바닷가의 노을")
+        request = server.requests[0]
+        self.assertEqual(request["format"], "json")
+        sent = Image.open(io.BytesIO(base64.b64decode(request["images"][0])))
+        self.assertEqual((sent.format, sent.size), ("JPEG", (320, 160)))
+
+    def test_model_input_is_rendered_once_per_size(self):
+        first = prepare_model_input(self.photo, "llava")
+        modified = default_storage.get_modified_time(first)
+
+        self.assertEqual(first, model_input_name("beach", 320))
+        self.assertEqual(prepare_model_input(self.photo, "llava:7b"), first)
+        self.assertEqual(default_storage.get_modified_time(first), modified)
+        self.assertEqual(
+            prepare_model_input(self.photo, "bakllava"), model_input_name("beach", 768)
+        )
+
+    def test_concurrent_model_input_renders_share_one_name(self):
+        name = model_input_name("beach", 320)
+        checked = threading.Barrier(4)
+        submit = preprocessing.submit
+
+        def submit_after_every_check(*args):
+            checked.wait(timeout=5)
+            return submit(*args)
+
+        with mock.patch.object(preprocessing, "submit", submit_after_every_check):
+            results = []
+            threads = [
+                threading.Thread(
+                    target=lambda: results.append(prepare_model_input(self.photo, "llava"))
+                )
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results, [name] * 4)
+        self.assertEqual(default_storage.listdir(os.path.dirname(name)), ([], ["beach.jpg"]))
+        with default_storage.open(name) as model_input:
+            self.assertEqual(Image.open(model_input).size, (320, 160))
+
+
+class BulkCaptionJobAPITests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="testpass", name="Owner"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", password="testpass", name="Other"
+        )
+        self.photos = [
+            Photo.objects.create(owner=self.owner, file=f"p{i}.jpg", checksum=f"c{i}")
+            for i in range(5)
+        ]
+        self.foreign = Photo.objects.create(owner=self.other, file="x.jpg", checksum="x")
+        self.url = reverse("ai:captionjob-bulk")
+        self.client.force_authenticate(self.owner)
+
+    def test_queues_selected_photos_and_skips_active_jobs(self):
+        AICaptionJob.objects.create(photo=self.photos[0], model="llava")
+        AICaptionJob.objects.create(
+            photo=self.photos[1], model="llava", status=CaptionJobStatus.SUCCESS
+        )
+        AICaptionJob.objects.create(
+            photo=self.photos[2], model="llava", status=CaptionJobStatus.FAILED
+        )
+        AICaptionJob.objects.create(photo=self.photos[3], model="moondream")
+
+        with self.settings(AI_BULK_ENQUEUE_BATCH_SIZE=2):
+            response = self.client.post(
+                self.url,
+                {"model": "llava", "photos": [p.id for p in self.photos]},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.data, {"model": "llava", "matched": 5, "created": 3, "skipped": 2}
+        )
+        queued = AICaptionJob.objects.filter(model="llava", status=CaptionJobStatus.PENDING)
+        self.assertCountEqual(
+            queued.values_list("photo_id", flat=True),
+            [self.photos[0].id, self.photos[2].id, self.photos[3].id, self.photos[4].id],
+        )
+
+        response = self.client.post(
+            self.url, {"model": "llava", "photos": [p.id for p in self.photos]}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 0)
+
+    def test_rejects_photos_of_other_users(self):
+        response = self.client.post(
+            self.url,
+            {"model": "llava", "photos": [self.photos[0].id, self.foreign.id]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(self.foreign.id), str(response.data["photos"]))
+        self.assertFalse(AICaptionJob.objects.exists())
+
+    def test_selects_by_tag_and_uncaptioned(self):
+        tag = Tag.objects.create(name="Beach")
+        for photo in self.photos[:3]:
+            PhotoTag.objects.create(photo=photo, tag=tag)
+        AICaptionJob.objects.create(
+            photo=self.photos[0], model="moondream", status=CaptionJobStatus.SUCCESS
+        )
+
+        response = self.client.post(
+            self.url, {"model": "llava", "tag": "beach", "uncaptioned": True}, format="json"
+        )
+
+        self.assertEqual(response.data["matched"], 2)
+        self.assertCountEqual(
+            AICaptionJob.objects.filter(model="llava").values_list("photo_id", flat=True),
+            [self.photos[1].id, self.photos[2].id],
+        )
+
+    def test_selects_by_any_tag_name_the_model_accepts(self):
+        tag = Tag.objects.create(name="b" * Tag._meta.get_field("name").max_length)
+        PhotoTag.objects.create(photo=self.photos[0], tag=tag)
+
+        response = self.client.post(self.url, {"model": "llava", "tag": tag.name}, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["matched"], 1)
+
+    def test_bulk_insert_query_count_is_independent_of_selection_size(self):
+        with self.assertNumQueries(5):
+            self.client.post(self.url, {"model": "llava", "uncaptioned": True}, format="json")
+        extra = [
+            Photo.objects.create(owner=self.owner, file=f"e{i}.jpg", checksum=f"e{i}")
+            for i in range(20)
+        ]
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                self.url, {"model": "moondream", "uncaptioned": True}, format="json"
+            )
+        self.assertEqual(response.data["created"], len(self.photos) + len(extra))
+
+    def test_list_runs_a_fixed_number_of_queries(self):
+        list_url = reverse("ai:captionjob-list")
+        for photos in (self.photos[:2], self.photos[2:]):
+            for photo in photos:
+                AICaptionJob.objects.create(photo=photo, model="llava")
+            with self.assertNumQueries(1):
+                response = self.client.get(list_url, {"page_size": 100})
+            self.assertEqual(len(response.data["results"]), AICaptionJob.objects.count())
+
+    def test_requires_a_selection(self):
+        response = self.client.post(self.url, {"model": "llava"}, format="json")
+
+        self.assertEqual(response.status_code, 400)
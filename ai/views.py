@@ -1,24 +1,21 @@
 from __future__ import annotations
 
 from django.db.models import Q
-from rest_framework import permissions, viewsets
-from rest_framework.pagination import PageNumberPagination
+from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
 from ai.models import AICaptionJob
-from ai.serializers import AICaptionJobSerializer
+from ai.serializers import AICaptionJobSerializer, BulkCaptionJobSerializer
+from ai.services.jobs import enqueue_caption_jobs
+from config.pagination import KeysetPagination
 from photos.models import PhotoVisibility
 
 
-class StandardPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = "page_size"
-    max_page_size = 100
-
-
 class AICaptionJobViewSet(viewsets.ModelViewSet):
     serializer_class = AICaptionJobSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = StandardPagination
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -29,3 +26,14 @@ class AICaptionJobViewSet(viewsets.ModelViewSet):
         if photo_filter:
             queryset = queryset.filter(photo_id=photo_filter)
         return queryset
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        serializer = BulkCaptionJobSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        model = serializer.validated_data["model"]
+        matched, created = enqueue_caption_jobs(serializer.get_photos(), model)
+        return Response(
+            {"model": model, "matched": matched, "created": created, "skipped": matched - created},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import base64
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import F, Q, QuerySet
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination on a unique ordering such as ``(-created_at, -id)``.
+
+    Each page is a range scan starting right after the last row of the
+    previous one, so deep pages cost the same as the first. The total is
+    only counted when the client asks for it with ``?count=true``.
+
+    Views may offer several orderings through ``keyset_orderings``; the last
+    field of each must be unique and only the first may be nullable.
+    """
+
+    orderings = {"created": ("-created_at", "-id")}
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    ordering_query_param = "sort"
+    count_query_param = "count"
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        orderings = getattr(view, "keyset_orderings", None) or self.orderings
+        self.ordering_key = request.query_params.get(self.ordering_query_param) or next(
+            iter(orderings)
+        )
+        if self.ordering_key not in orderings:
+            raise ValidationError({self.ordering_query_param: f"Choose one of {sorted(orderings)}"})
+        self.ordering = orderings[self.ordering_key]
+        self.page_size = self.get_page_size(request)
+        self.count = queryset.count() if self.wants_count(request) else None
+
+        model = queryset.model
+        values, reverse = self.decode_cursor(request, model)
+        ordering = [_flip(field) for field in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*(_order_expression(field) for field in ordering))
+        if values is not None:
+            queryset = queryset.filter(self.after(model, ordering, values))
+
+        rows = list(queryset[: self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = values is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        payload = {"next": self.get_next_link(), "previous": self.get_previous_link()}
+        if self.count is not None:
+            payload["count"] = self.count
+        payload["results"] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "count": {"type": "integer"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def wants_count(self, request) -> bool:
+        return request.query_params.get(self.count_query_param, "").lower() in {"1", "true"}
+
+    def get_next_link(self) -> str | None:
+        if not self.has_next or not self.page:
+            return None
+        return self.link(self.page[-1], reverse=False)
+
+    def get_previous_link(self) -> str | None:
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.link(self.page[0], reverse=True)
+
+    def link(self, row, reverse: bool) -> str:
+        values = [_json_value(getattr(row, field.lstrip("-"))) for field in self.ordering]
+        payload = json.dumps({"o": self.ordering_key, "v": values, "r": reverse})
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model) -> tuple[list | None, bool]:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)))
+            if payload["o"] != self.ordering_key or len(payload["v"]) != len(self.ordering):
+                raise ValueError
+            values = [
+                None if value is None else model._meta.get_field(field.lstrip("-")).to_python(value)
+                for field, value in zip(self.ordering, payload["v"])
+            ]
+            return values, bool(payload["r"])
+        except (ValueError, TypeError, KeyError, DjangoValidationError):
+            raise NotFound("Invalid cursor")
+
+    def after(self, model, ordering, values) -> Q:
+        """Rows strictly after ``values`` in ``ordering`` (NULLs sort lowest)."""
+        condition = None
+        for field, value in reversed(list(zip(ordering, values))):
+            name, descending = field.lstrip("-"), field.startswith("-")
+            nullable = model._meta.get_field(name).null
+            if value is None:
+                step = None if descending else Q(**{f"{name}__isnull": False})
+                tie = Q(**{f"{name}__isnull": True})
+            else:
+                step = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+                if descending and nullable:
+                    step |= Q(**{f"{name}__isnull": True})
+                tie = Q(**{name: value})
+            if condition is not None:
+                step = tie & condition if step is None else step | (tie & condition)
+            condition = step
+        # The OR chain alone does not bound an index range scan; an inclusive
+        # bound on the leading column does.
+        if value is not None:
+            bound = Q(**{f"{name}__{'lte' if descending else 'gte'}": value})
+            if descending and nullable:
+                bound |= Q(**{f"{name}__isnull": True})
+            condition &= bound
+        return condition
+
+
+def _flip(field: str) -> str:
+    return field[1:] if field.startswith("-") else f"-{field}"
+
+
+def _order_expression(field: str):
+    name = field.lstrip("-")
+    if field.startswith("-"):
+        return F(name).desc(nulls_last=True)
+    return F(name).asc(nulls_first=True)
+
+
+def _json_value(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
@@ -82,6 +82,9 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Caption workers run as separate processes; wait for the write lock
+        # instead of failing fast with "database is locked".
+        "OPTIONS": {"timeout": 20},
     }
 }
 
@@ -124,6 +127,75 @@ STATIC_URL = "static/"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Photo uploads are hashed and written to storage in chunks of this many bytes.
+PHOTO_UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# Resumable upload sessions stage their bytes here until they are completed,
+# and are purged once they have been idle for PHOTO_UPLOAD_SESSION_TTL seconds.
+PHOTO_UPLOAD_STAGING_DIR = BASE_DIR / "var" / "upload_sessions"
+PHOTO_UPLOAD_SESSION_TTL = 60 * 60 * 24
+
+# Thumbnail renditions (name -> longest edge in pixels). The smallest one is
+# stored on Photo.thumbnail. CPU-heavy image work runs in a pool of this many
+# worker processes; 0 renders inline on the calling thread.
+PHOTO_THUMBNAIL_SIZES = {"grid": 320, "preview": 1280, "fullscreen": 2560}
+PHOTO_THUMBNAIL_QUALITY = 85
+PHOTO_PROCESS_POOL_WORKERS = 2
+
+# On-demand renditions (api/photos/photos/<id>/render) are cached on disk and
+# evicted least-recently-used once the cache grows past the byte limit.
+PHOTO_RENDER_CACHE_DIR = BASE_DIR / "var" / "renditions"
+PHOTO_RENDER_CACHE_MAX_BYTES = 512 * 1024 * 1024
+PHOTO_RENDER_MAX_DIMENSION = 4096
+
+# Near-duplicate search: photos whose 64-bit dHashes differ in at most this
+# many bits are reported, and this many owners' hash indexes stay in memory.
+PHOTO_DUPLICATE_MAX_DISTANCE = 10
+PHOTO_DUPLICATE_CACHED_LIBRARIES = 32
+# The library-wide duplicates report is built on a background thread; a request
+# waits this many seconds for it before answering 202 with Retry-After.
+PHOTO_DUPLICATE_REPORT_WAIT = 1.0
+PHOTO_DUPLICATE_REPORT_RETRY_AFTER = 5
+
+# Caption worker (manage.py run_caption_worker). Jobs are leased in batches;
+# a job whose lease lapses (its worker died) is re-queued until it has been
+# attempted AI_WORKER_MAX_ATTEMPTS times.
+AI_CAPTION_HANDLER = "ai.services.captioning.caption_job"
+AI_WORKER_CONCURRENCY = 4
+AI_WORKER_BATCH_SIZE = 8
+AI_WORKER_LEASE_SECONDS = 300
+AI_WORKER_POLL_INTERVAL = 5
+AI_WORKER_MAX_ATTEMPTS = 3
+# Successful captions are copied onto photos (description, AI tags) in
+# batches of this many jobs.
+AI_RESULT_BATCH_SIZE = 200
+
+# Bulk caption requests: explicit id lists are capped, filters are not.
+AI_BULK_MAX_PHOTO_IDS = 5000
+AI_BULK_ENQUEUE_BATCH_SIZE = 1000
+
+# Ollama vision models used by the caption handler.
+OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_MAX_CONNECTIONS = 8
+OLLAMA_MAX_INFLIGHT_PER_MODEL = 2
+OLLAMA_TIMEOUT = 120
+OLLAMA_MAX_RETRIES = 3
+OLLAMA_RETRY_BACKOFF = 0.5
+# Photos are downscaled once per model input size (longest edge, in pixels)
+# before they are sent to a vision model.
+AI_MODEL_INPUT_SIZES = {"llava": 672, "llava-phi3": 672, "qwen2.5-vl": 1024}
+AI_MODEL_INPUT_DEFAULT_SIZE = 768
+AI_MODEL_INPUT_QUALITY = 85
+
+# Captions are cached per (image checksum, model, prompt version). Leave the
+# version empty to derive it from the prompt text, so editing the prompt
+# invalidates earlier captions automatically.
+AI_CAPTION_PROMPT_VERSION = ""
+AI_CAPTION_PROMPT = (
+    "이 사진을 한국어 한두 문장으로 설명하고, 사진의 핵심 대상을 나타내는 한국어 태그를 "
+    '최대 10개 붙여 주세요. {"caption": "...", "tags": ["..."]} 형식의 JSON으로만 답하세요.'
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -131,6 +203,26 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "users.User"
 
+# Photo search index: search.backends.sqlite_fts.SQLiteFTSBackend (FTS5, needs
+# SQLite) or search.backends.memory.InMemoryBackend (loaded from the database
+# on first use; it only sees writes made by its own process, so it suits tests
+# and single-process servers).
+SEARCH_BACKEND = "search.backends.sqlite_fts.SQLiteFTSBackend"
+# Autocomplete indexes live in each process and check the database for rows
+# written by other processes at most this often.
+SEARCH_AUTOCOMPLETE_RECHECK_SECONDS = 5
+# Facet counts on search results cover at most this many of the best hits.
+SEARCH_FACET_MAX_HITS = 1000
+# "More like this": colour/texture descriptors of every photo in a float16
+# matrix under this directory, bucketed by random-hyperplane LSH (tables x bits
+# per table). Saving a photo does not index it: new photos only show up once
+# update_similarity_index has run, so schedule that command (e.g. from cron).
+SEARCH_SIMILARITY_DIR = BASE_DIR / "var" / "similarity"
+SEARCH_SIMILARITY_TABLES = 8
+SEARCH_SIMILARITY_BITS = 12
+# Most vectors reranked exactly per query.
+SEARCH_SIMILARITY_MAX_CANDIDATES = 2000
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.SessionAuthentication",
@@ -139,6 +231,6 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+    "DEFAULT_PAGINATION_CLASS": "config.pagination.KeysetPagination",
     "PAGE_SIZE": 20,
 }
@@ -25,6 +25,7 @@ urlpatterns = [
     path("api/photos/", include(("photos.urls", "photos"), namespace="photos")),
     path("api/ai/", include(("ai.urls", "ai"), namespace="ai")),
     path("api/users/", include(("users.urls", "users"), namespace="users")),
+    path("api/search/", include(("search.urls", "search"), namespace="search")),
     path("api-auth/", include("rest_framework.urls")),
 ]
 
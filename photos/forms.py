@@ -1,12 +1,9 @@
 from __future__ import annotations
 
-import hashlib
-import os
-
 from django import forms
-from django.core.files.storage import default_storage
 
 from photos.models import Album, AlbumPermission, AlbumShare, Photo, PhotoVisibility, StorageBackend, Tag
+from photos.services.uploads import store_upload
 
 
 class PhotoForm(forms.ModelForm):
@@ -15,8 +12,6 @@ class PhotoForm(forms.ModelForm):
     class Meta:
         model = Photo
         fields = [
-            "file_path",
-            "thumbnail_path",
             "title",
             "description",
             "width",
@@ -44,11 +39,8 @@ class PhotoForm(forms.ModelForm):
     def save(self, commit: bool = True):
         uploaded_file = self.cleaned_data.pop("uploaded_file", None)
         if uploaded_file:
-            content = uploaded_file.read()
-            checksum = hashlib.sha256(content).hexdigest()
-            uploaded_file.seek(0)
-            path = default_storage.save(os.path.join("photos", uploaded_file.name), uploaded_file)
-            self.instance.file_path = path
+            path, checksum = store_upload(uploaded_file)
+            self.instance.file = path
             self.instance.checksum = checksum
         return super().save(commit=commit)
 
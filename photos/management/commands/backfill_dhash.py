@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from photos.models import Photo
+from photos.services import duplicates
+from photos.services.batching import iter_batches
+from photos.services.perceptual import read_dhash
+from photos.services.pool import create_process_pool
+from photos.services.thumbnails import render_source
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute perceptual hashes for photos that lack one. Workers decode, shrink and hash "
+        "the images; photos that cannot be decoded are marked and left alone by later runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.PHOTO_PROCESS_POOL_WORKERS or 1,
+            help="Number of worker processes used for decoding.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--force", action="store_true", help="Rehash every photo, undecodable ones included."
+        )
+
+    def handle(self, *args, **options):
+        queryset = Photo.objects.exclude(Q(file="") | Q(file__isnull=True)).only("id", "file")
+        if not options["force"]:
+            queryset = queryset.filter(dhash__isnull=True, dhash_failed=False)
+
+        hashed = skipped = 0
+        with create_process_pool(options["workers"]) as pool:
+            for batch in iter_batches(queryset, options["batch_size"]):
+                sources = [render_source(photo) for photo in batch]
+                for photo, value in zip(batch, pool.map(read_dhash, sources, chunksize=32)):
+                    photo.dhash, photo.dhash_failed = value, value is None
+                    if value is None:
+                        skipped += 1
+                    else:
+                        hashed += 1
+                Photo.objects.bulk_update(batch, ["dhash", "dhash_failed"])
+
+        # bulk_update sends no signals; drop any cached libraries in this process.
+        duplicates.reset()
+        self.stdout.write(
+            self.style.SUCCESS(f"Hashed {hashed} photo(s); {skipped} could not be decoded.")
+        )
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from photos.models import Photo
+from photos.services.batching import iter_batches
+from photos.services.exif import METADATA_FIELDS, extract_metadata, localize
+from photos.services.pool import create_process_pool
+from photos.services.thumbnails import render_source
+
+
+class Command(BaseCommand):
+    help = "Fill photo capture metadata (camera, exposure, GPS, dimensions) from EXIF headers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.PHOTO_PROCESS_POOL_WORKERS or 1,
+            help="Number of worker processes reading headers in parallel.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Overwrite fields that already have a value and revisit every photo.",
+        )
+
+    def handle(self, *args, **options):
+        force = options["force"]
+        queryset = Photo.objects.exclude(Q(file="") | Q(file__isnull=True)).only(
+            "id", "file", *METADATA_FIELDS
+        )
+        if not force:
+            queryset = queryset.filter(width__isnull=True)
+
+        updated = 0
+        with create_process_pool(options["workers"]) as pool:
+            for batch in iter_batches(queryset, options["batch_size"]):
+                sources = [render_source(photo) for photo in batch]
+                results = pool.map(extract_metadata, sources, chunksize=32)
+                changed = []
+                for photo, metadata in zip(batch, results):
+                    for field, value in localize(metadata).items():
+                        if force or getattr(photo, field) in (None, ""):
+                            setattr(photo, field, value)
+                    photo.update_geohash()
+                    changed.append(photo)
+                Photo.objects.bulk_update(changed, [*METADATA_FIELDS, "geohash"])
+                updated += len(changed)
+
+        self.stdout.write(self.style.SUCCESS(f"Read EXIF metadata for {updated} photo(s)."))
@@ -0,0 +1,58 @@
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from photos.models import Photo
+from photos.services.batching import iter_batches
+from photos.services.imaging import render_thumbnails
+from photos.services.pool import create_process_pool
+from photos.services.thumbnails import render_args, save_thumbnails, thumbnails_exist
+
+
+class Command(BaseCommand):
+    help = "Render the configured thumbnail sizes for photos that do not have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.PHOTO_PROCESS_POOL_WORKERS or 1,
+            help="Number of worker processes used for decoding and resizing.",
+        )
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument(
+            "--force", action="store_true", help="Re-render photos that already have thumbnails."
+        )
+
+    def handle(self, *args, **options):
+        queryset = Photo.objects.exclude(Q(file="") | Q(file__isnull=True)).only(
+            "id", "file", "checksum"
+        )
+        if not options["force"]:
+            queryset = queryset.filter(Q(thumbnail="") | Q(thumbnail__isnull=True))
+
+        rendered = failed = 0
+        with create_process_pool(options["workers"]) as pool:
+            for batch in iter_batches(queryset, options["batch_size"]):
+                futures = {}
+                for photo in batch:
+                    if not options["force"] and thumbnails_exist(photo.checksum):
+                        save_thumbnails(photo)
+                        rendered += 1
+                        continue
+                    futures[pool.submit(render_thumbnails, *render_args(photo))] = photo
+                for future in as_completed(futures):
+                    photo = futures[future]
+                    try:
+                        save_thumbnails(photo, future.result())
+                    except Exception as exc:
+                        failed += 1
+                        self.stderr.write(f"Photo {photo.pk}: {exc}")
+                    else:
+                        rendered += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rendered thumbnails for {rendered} photo(s); {failed} failed.")
+        )
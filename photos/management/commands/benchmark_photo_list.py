@@ -0,0 +1,95 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from photos.models import Photo, PhotoTag, PhotoVisibility, Tag
+from photos.selectors.visibility import visible_photos, with_tags
+from users.models import User
+
+VISIBILITY_CYCLE = (
+    [PhotoVisibility.PRIVATE] * 6 + [PhotoVisibility.PUBLIC] * 3 + [PhotoVisibility.SHARED]
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic photos inside a transaction that is rolled back, then print the "
+        "query plan and timing of the photo list query with and without DISTINCT."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--photos", type=int, default=1_000_000)
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument(
+            "--tagged-every", type=int, default=10, help="Tag one photo in this many."
+        )
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            viewer, tag = self.seed(options)
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            for label, queryset in self.shapes(viewer, tag.name):
+                self.report(label, queryset, options["repeat"])
+            transaction.set_rollback(True)
+
+    def seed(self, options):
+        users = User.objects.bulk_create(
+            User(email=f"bench-{index}@example.invalid", name=f"Bench {index}", password="!")
+            for index in range(options["users"])
+        )
+        tag = Tag.objects.create(name="benchmark-tag")
+        total, batch_size = options["photos"], options["batch_size"]
+        started = time.perf_counter()
+        for start in range(0, total, batch_size):
+            photos = Photo.objects.bulk_create(
+                Photo(
+                    owner=users[index % len(users)],
+                    file=f"bench/{index}.jpg",
+                    checksum=f"{index:064x}",
+                    visibility=VISIBILITY_CYCLE[index % len(VISIBILITY_CYCLE)],
+                )
+                for index in range(start, min(start + batch_size, total))
+            )
+            PhotoTag.objects.bulk_create(
+                PhotoTag(photo=photo, tag=tag) for photo in photos[:: options["tagged_every"]]
+            )
+        self.stdout.write(f"Seeded {total} photos in {time.perf_counter() - started:.1f}s\n")
+        return users[0], tag
+
+    def shapes(self, viewer, tag_name):
+        ordering = ("-created_at", "-id")
+        legacy = Photo.objects.filter(
+            Q(owner=viewer)
+            | Q(visibility=PhotoVisibility.PUBLIC)
+            | Q(visibility=PhotoVisibility.SHARED)
+        )
+        current = visible_photos(viewer)
+        return [
+            ("OR + DISTINCT", legacy.distinct().order_by(*ordering)),
+            ("visibility predicate", current.order_by(*ordering)),
+            (
+                "OR + tag join + DISTINCT",
+                legacy.filter(photo_tags__tag__name__iexact=tag_name)
+                .distinct()
+                .order_by(*ordering),
+            ),
+            ("visibility predicate + tag EXISTS", with_tags(current, [tag_name]).order_by(*ordering)),
+        ]
+
+    def report(self, label, queryset, repeat):
+        page = queryset[:21]
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(page.all())
+            timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        self.stdout.write(f"  first page: {statistics.median(timings):.2f} ms (median of {repeat})")
+        for line in page.explain().splitlines():
+            self.stdout.write(f"  {line}")
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.1 on 2026-10-17 01:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0003_uploadsession"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="photo",
+            name="checksum",
+            field=models.CharField(db_index=True, max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name="photo",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "checksum"), name="photo_owner_checksum_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.1 on 2026-10-17 02:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0004_photo_checksum_per_owner"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="album",
+            index=models.Index(
+                fields=["created_at", "id"], name="album_created_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="photo",
+            index=models.Index(
+                fields=["created_at", "id"], name="photo_created_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="photo",
+            index=models.Index(fields=["taken_at", "id"], name="photo_taken_id_idx"),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2026-10-17 02:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0005_keyset_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="photo",
+            index=models.Index(
+                fields=["visibility", "created_at", "id"],
+                name="photo_visibility_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="photo",
+            index=models.Index(
+                fields=["owner", "created_at", "id"], name="photo_owner_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.1 on 2026-10-17 02:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0006_visibility_owner_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="phototag",
+            name="tag",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="tagged_photos",
+                to="photos.tag",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="uploadsession",
+            name="expires_at",
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name="album",
+            index=models.Index(
+                fields=["owner", "created_at", "id"], name="album_owner_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="albumshare",
+            index=models.Index(
+                fields=["shared_with", "created_at"], name="albumshare_recipient_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="albumshare",
+            index=models.Index(
+                fields=["album", "shared_with"], name="albumshare_album_recipient_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="phototag",
+            index=models.Index(fields=["tag", "photo"], name="phototag_tag_photo_idx"),
+        ),
+    ]
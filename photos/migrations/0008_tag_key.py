@@ -0,0 +1,58 @@
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _tag_key(name):
+    return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+
+def merge_case_duplicates(apps, schema_editor):
+    Tag = apps.get_model("photos", "Tag")
+    PhotoTag = apps.get_model("photos", "PhotoTag")
+    survivors = {}
+    duplicates = {}
+    for tag in Tag.objects.order_by("id"):
+        tag.key = _tag_key(tag.name)
+        if tag.key in survivors:
+            duplicates[tag.pk] = survivors[tag.key]
+        else:
+            survivors[tag.key] = tag.pk
+            tag.save(update_fields=["key"])
+    for duplicate_id, survivor_id in duplicates.items():
+        kept = PhotoTag.objects.filter(tag_id=survivor_id).values_list("photo_id", "source")
+        kept = set(kept)
+        for link in PhotoTag.objects.filter(tag_id=duplicate_id):
+            if (link.photo_id, link.source) in kept:
+                link.delete()
+            else:
+                link.tag_id = survivor_id
+                link.save(update_fields=["tag"])
+                kept.add((link.photo_id, link.source))
+    Tag.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0007_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tag",
+            name="key",
+            field=models.CharField(default="", editable=False, max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(merge_case_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="tag",
+            name="key",
+            field=models.CharField(editable=False, max_length=100, unique=True),
+        ),
+        migrations.AlterModelOptions(
+            name="tag",
+            options={"ordering": ["key"]},
+        ),
+    ]
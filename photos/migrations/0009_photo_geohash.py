@@ -0,0 +1,58 @@
+from django.db import migrations, models
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def _geohash(latitude, longitude, precision=12):
+    bounds = {True: [-180.0, 180.0], False: [-90.0, 90.0]}
+    values = {True: float(longitude), False: float(latitude)}
+    chars, value, even = [], 0, True
+    for position in range(precision * 5):
+        low, high = bounds[even]
+        middle = (low + high) / 2
+        bit = values[even] >= middle
+        bounds[even] = [middle, high] if bit else [low, middle]
+        value, even = value << 1 | bit, not even
+        if position % 5 == 4:
+            chars.append(GEOHASH_ALPHABET[value])
+            value = 0
+    return "".join(chars)
+
+
+def fill_geohash(apps, schema_editor):
+    Photo = apps.get_model("photos", "Photo")
+    photos = (
+        Photo.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        .only("latitude", "longitude")
+        .order_by("pk")
+    )
+    # Keyset batches: no cursor stays open on the table while it is updated.
+    last_pk = 0
+    while batch := list(photos.filter(pk__gt=last_pk)[:2000]):
+        for photo in batch:
+            photo.geohash = _geohash(photo.latitude, photo.longitude)
+        Photo.objects.bulk_update(batch, ["geohash"])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0008_tag_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="photo",
+            name="geohash",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=12
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="photo",
+            index=models.Index(fields=["geohash", "id"], name="photo_geohash_idx"),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-17 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0009_photo_geohash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="photo",
+            name="dhash",
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
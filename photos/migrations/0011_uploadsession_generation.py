@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-17 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0010_photo_dhash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadsession",
+            name="generation",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
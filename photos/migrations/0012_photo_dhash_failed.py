@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-17 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0011_uploadsession_generation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="photo",
+            name="dhash_failed",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-17 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("photos", "0012_photo_dhash_failed"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="tag",
+            name="key",
+            field=models.CharField(editable=False, max_length=255, unique=True),
+        ),
+    ]
@@ -1,6 +1,11 @@
+import unicodedata
+import uuid
+
 from django.conf import settings
 from django.db import models
 
+from photos.services.geo import encode_geohash
+
 
 class PhotoVisibility(models.TextChoices):
     PUBLIC = "public", "Public"
@@ -48,17 +53,49 @@ class Photo(models.Model):
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     location = models.CharField(max_length=255, blank=True)
+    # Derived from latitude/longitude in save(); indexed for map queries.
+    geohash = models.CharField(max_length=12, blank=True, editable=False)
     visibility = models.CharField(
         max_length=20, choices=PhotoVisibility.choices, default=PhotoVisibility.PRIVATE
     )
     storage_backend = models.CharField(
         max_length=20, choices=StorageBackend.choices, default=StorageBackend.LOCAL
     )
-    checksum = models.CharField(max_length=64, unique=True)
+    checksum = models.CharField(max_length=64, db_index=True)
+    # 64-bit difference hash of the image, stored signed; see services/perceptual.py.
+    dhash = models.BigIntegerField(null=True, blank=True, editable=False)
+    # Set when the file could not be decoded, so backfills stop retrying it.
+    dhash_failed = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "checksum"], name="photo_owner_checksum_unique"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="photo_created_id_idx"),
+            models.Index(fields=["taken_at", "id"], name="photo_taken_id_idx"),
+            models.Index(
+                fields=["visibility", "created_at", "id"], name="photo_visibility_created_idx"
+            ),
+            models.Index(fields=["owner", "created_at", "id"], name="photo_owner_created_idx"),
+            models.Index(fields=["geohash", "id"], name="photo_geohash_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.update_geohash()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "geohash"}
+        super().save(*args, **kwargs)
+
+    def update_geohash(self) -> None:
+        """Derive ``geohash`` from the coordinates; bulk writers must call this themselves."""
+        has_position = self.latitude is not None and self.longitude is not None
+        self.geohash = encode_geohash(self.latitude, self.longitude) if has_position else ""
 
     def __str__(self) -> str:  # pragma: no cover - simple representation
         return self.title or f"Photo {self.pk}"
@@ -81,6 +118,10 @@ class Album(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="album_created_id_idx"),
+            models.Index(fields=["owner", "created_at", "id"], name="album_owner_created_idx"),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover - simple representation
         return self.title
@@ -106,17 +147,37 @@ class AlbumShare(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["shared_with", "created_at"], name="albumshare_recipient_idx"),
+            models.Index(fields=["album", "shared_with"], name="albumshare_album_recipient_idx"),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover - simple representation
         return f"Share for {self.album_id}"
 
 
+# NFKC and casefolding can make a key several times longer than its name
+# (U+FDFA alone expands to 18 characters), so keys are cut to their column.
+TAG_KEY_MAX_LENGTH = 255
+
+
+def tag_key(name: str) -> str:
+    """Case- and width-insensitive lookup key for a tag name."""
+    key = " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+    return key[:TAG_KEY_MAX_LENGTH]
+
+
 class Tag(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    key = models.CharField(max_length=TAG_KEY_MAX_LENGTH, unique=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = ["name"]
+        ordering = ["key"]
+
+    def save(self, *args, **kwargs):
+        self.key = tag_key(self.name)
+        super().save(*args, **kwargs)
 
     def __str__(self) -> str:  # pragma: no cover - simple representation
         return self.name
@@ -126,7 +187,10 @@ class PhotoTag(models.Model):
     photo = models.ForeignKey(
         Photo, on_delete=models.CASCADE, related_name="photo_tags"
     )
-    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name="tagged_photos")
+    # Served by phototag_tag_photo_idx, which also covers tag -> photo lookups.
+    tag = models.ForeignKey(
+        Tag, on_delete=models.CASCADE, related_name="tagged_photos", db_index=False
+    )
     source = models.CharField(
         max_length=20, choices=TagSource.choices, default=TagSource.MANUAL
     )
@@ -135,6 +199,27 @@ class PhotoTag(models.Model):
     class Meta:
         unique_together = ("photo", "tag", "source")
         ordering = ["-created_at"]
+        indexes = [models.Index(fields=["tag", "photo"], name="phototag_tag_photo_idx")]
 
     def __str__(self) -> str:  # pragma: no cover - simple representation
         return f"{self.tag.name} → {self.photo_id}"
+
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="upload_sessions"
+    )
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    received_size = models.PositiveBigIntegerField(default=0)
+    # Bumped by every write; a conditional update on it serialises writers.
+    generation = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self) -> str:  # pragma: no cover - simple representation
+        return f"Upload {self.pk} ({self.received_size}/{self.total_size})"
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from collections import Counter
+
+from django.db.models import CharField, Count, F, IntegerField, QuerySet, Value
+from django.db.models.functions import ExtractYear
+
+from photos.models import Photo, PhotoTag
+
+PHOTO_FACETS = ("camera_make", "camera_model", "lens_model", "year", "visibility")
+
+
+def facet_counts(queryset: QuerySet[Photo], limit: int = 10) -> dict[str, list[dict]]:
+    """Top values and photo counts per facet of ``queryset``, in one statement.
+
+    Photos are grouped once on every facet column together (the number of
+    distinct combinations stays small) and the groups are summed here; the
+    ``limit`` most used tags come from a second branch of the same UNION ALL.
+    """
+    combinations, tags = _branches(queryset, limit)
+    counters = {facet: Counter() for facet in PHOTO_FACETS}
+    tag_counts = Counter()
+    for row in combinations.union(tags, all=True):
+        if row[_column("tag_name")] is not None:
+            tag_counts[row[_column("tag_name")]] += row["count"]
+            continue
+        for facet in PHOTO_FACETS:
+            value = row[_column(facet)]
+            if value not in (None, ""):
+                counters[facet][value] += row["count"]
+    return {
+        "tags": _ranked(tag_counts, limit),
+        **{facet: _ranked(counter, limit) for facet, counter in counters.items()},
+    }
+
+
+def _branches(queryset: QuerySet[Photo], limit: int) -> tuple[QuerySet, QuerySet]:
+    """The two halves of the UNION ALL, with their columns in the same order."""
+    photos = queryset.select_related(None).prefetch_related(None).order_by()
+    combinations = photos.values(
+        **_columns(
+            camera_make=F("camera_make"),
+            camera_model=F("camera_model"),
+            lens_model=F("lens_model"),
+            year=ExtractYear("taken_at"),
+            visibility=F("visibility"),
+            tag_name=Value(None, output_field=CharField()),
+        )
+    ).annotate(count=Count("id"))
+    links = PhotoTag.objects.filter(photo__in=photos).order_by()
+    top_tag_ids = (
+        links.values("tag_id")
+        .annotate(photos=Count("photo_id", distinct=True))
+        .order_by("-photos", "tag__key")
+        .values("tag_id")[:limit]
+    )
+    blank = Value("", output_field=CharField())
+    tags = (
+        links.filter(tag_id__in=top_tag_ids)
+        .values(
+            **_columns(
+                camera_make=blank,
+                camera_model=blank,
+                lens_model=blank,
+                year=Value(None, output_field=IntegerField()),
+                visibility=blank,
+                tag_name=F("tag__name"),
+            )
+        )
+        .annotate(count=Count("photo_id", distinct=True))
+    )
+    return combinations, tags
+
+
+def _columns(**expressions) -> dict:
+    # UNION ALL matches columns by position and Django selects model fields
+    # ahead of annotations, so every column is an alias, in one fixed order.
+    return {_column(name): expressions[name] for name in (*PHOTO_FACETS, "tag_name")}
+
+
+def _column(name: str) -> str:
+    return f"facet_{name}"
+
+
+def _ranked(counter: Counter, limit: int) -> list[dict]:
+    ranked = sorted(counter.items(), key=lambda item: (-item[1], item[0]))
+    return [{"value": value, "count": count} for value, count in ranked[:limit]]
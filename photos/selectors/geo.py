@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from django.db.models import Avg, Count, FloatField, Max, Q, QuerySet, Value
+from django.db.models.functions import ASin, Cast, Cos, Least, Power, Radians, Sin, Sqrt, Substr
+
+from photos.models import Photo
+from photos.services.geo import (
+    EARTH_RADIUS_KM,
+    GEOHASH_ALPHABET,
+    BoundingBox,
+    cluster_precision,
+    covering_cells,
+    radius_box,
+    split_antimeridian,
+)
+
+
+def within_box(queryset: QuerySet[Photo], box: BoundingBox) -> QuerySet[Photo]:
+    """Photos positioned inside ``box``; a box with ``west > east`` crosses the antimeridian.
+
+    Each part of the box becomes a handful of range seeks on the geohash
+    index, refined by the exact coordinates.
+    """
+    condition = Q()
+    for part in split_antimeridian(box):
+        cells = Q()
+        for first, last in _cell_runs(covering_cells(part)):
+            # "~" sorts after every geohash character, so the upper bound
+            # takes in every longer hash under ``last``.
+            cells |= Q(geohash__gte=first, geohash__lt=last + "~")
+        condition |= cells & Q(
+            latitude__range=(part.south, part.north), longitude__range=(part.west, part.east)
+        )
+    return queryset.filter(condition)
+
+
+def within_radius(
+    queryset: QuerySet[Photo], latitude: float, longitude: float, radius_km: float
+) -> QuerySet[Photo]:
+    """Photos within ``radius_km`` great-circle distance, annotated with ``distance_km``."""
+    photo_latitude = Radians(Cast("latitude", FloatField()))
+    photo_longitude = Radians(Cast("longitude", FloatField()))
+    origin_latitude = Radians(Value(float(latitude)))
+    haversine = Power(Sin((photo_latitude - origin_latitude) / 2), 2) + Cos(
+        origin_latitude
+    ) * Cos(photo_latitude) * Power(
+        Sin((photo_longitude - Radians(Value(float(longitude)))) / 2), 2
+    )
+    distance = 2 * EARTH_RADIUS_KM * ASin(Least(Sqrt(haversine), Value(1.0)))
+    return (
+        within_box(queryset, radius_box(latitude, longitude, radius_km))
+        .annotate(distance_km=distance)
+        .filter(distance_km__lte=radius_km)
+    )
+
+
+def cluster_photos(queryset: QuerySet[Photo], zoom: int, limit: int = 1000) -> QuerySet:
+    """One row per geohash cell sized for map ``zoom``: photo count, centroid and newest photo."""
+    precision = cluster_precision(zoom)
+    return (
+        queryset.exclude(geohash="")
+        .order_by()
+        .annotate(cell=Substr("geohash", 1, precision))
+        .values("cell")
+        .annotate(
+            count=Count("id"),
+            center_latitude=Avg(Cast("latitude", FloatField())),
+            center_longitude=Avg(Cast("longitude", FloatField())),
+            photo_id=Max("id"),
+        )
+        .order_by("-count", "cell")[:limit]
+    )
+
+
+def _cell_runs(cells: list[str]) -> list[tuple[str, str]]:
+    """Group sorted same-length cells into ``(first, last)`` runs of consecutive hashes."""
+    runs: list[list[str]] = []
+    previous = None
+    for cell in cells:
+        value = 0
+        for char in cell:
+            value = value * 32 + GEOHASH_ALPHABET.index(char)
+        if runs and value == previous + 1:
+            runs[-1][1] = cell
+        else:
+            runs.append([cell, cell])
+        previous = value
+    return [(first, last) for first, last in runs]
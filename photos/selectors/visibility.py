@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+from django.db.models import Count, Exists, OuterRef, Q, QuerySet
+
+from photos.models import Album, AlbumShare, Photo, PhotoTag, PhotoVisibility, tag_key
+
+# Visibilities any signed-in user may browse, on top of their own photos.
+LISTED_VISIBILITIES = (PhotoVisibility.PUBLIC, PhotoVisibility.SHARED)
+
+
+def visible_photos(user) -> QuerySet[Photo]:
+    # Every predicate is on the photo row itself, so the result never holds
+    # duplicates and needs no DISTINCT.
+    if user is not None and user.is_authenticated:
+        return Photo.objects.filter(Q(owner=user) | Q(visibility__in=LISTED_VISIBILITIES))
+    return Photo.objects.filter(visibility=PhotoVisibility.PUBLIC)
+
+
+def with_tags(queryset: QuerySet[Photo], names: Iterable[str], match_all: bool = True):
+    """Photos tagged with all (or any) of ``names``, compared case-insensitively.
+
+    Tags are matched through the indexed ``Tag.key``. "any" is a single
+    EXISTS probe; "all" intersects the tag sets with one grouped subquery.
+    """
+    keys = {tag_key(name) for name in names} - {""}
+    if not keys:
+        return queryset
+    links = PhotoTag.objects.filter(tag__key__in=keys)
+    if not match_all or len(keys) == 1:
+        return queryset.filter(Exists(links.filter(photo=OuterRef("pk"))))
+    tagged_with_all = (
+        links.order_by()
+        .values("photo_id")
+        .annotate(matched=Count("tag_id", distinct=True))
+        .filter(matched=len(keys))
+        .values("photo_id")
+    )
+    return queryset.filter(pk__in=tagged_with_all)
+
+
+def visible_albums(user) -> QuerySet[Album]:
+    return Album.objects.filter(
+        Q(owner=user)
+        | Q(visibility=PhotoVisibility.PUBLIC)
+        | Exists(AlbumShare.objects.filter(album=OuterRef("pk"), shared_with=user))
+    )
@@ -1,12 +1,13 @@
 from __future__ import annotations
 
-import hashlib
 import os
 import secrets
+from functools import partial
 from typing import Iterable
 
+from django.conf import settings
 from django.core.files.storage import default_storage
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 
 from photos.models import (
@@ -19,7 +20,15 @@ from photos.models import (
     StorageBackend,
     Tag,
     TagSource,
+    UploadSession,
+    tag_key,
 )
+from photos.services.geo import BoundingBox
+from photos.services.renditions import RENDER_FORMATS
+from photos.services.tags import sync_photo_tags
+from photos.services.thumbnails import enqueue_thumbnails, thumbnail_name
+from photos.services.upload_sessions import open_session, promote_staged_file, staged_checksum
+from photos.services.uploads import InspectedUpload, inspect_upload, store_upload
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -28,6 +37,14 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "created_at"]
         read_only_fields = ["id", "created_at"]
 
+    def validate_name(self, value: str) -> str:
+        existing = Tag.objects.filter(key=tag_key(value))
+        if self.instance is not None:
+            existing = existing.exclude(pk=self.instance.pk)
+        if existing.exists():
+            raise serializers.ValidationError("A tag with this name already exists.")
+        return value
+
 
 class PhotoSerializer(serializers.ModelSerializer):
     owner = serializers.ReadOnlyField(source="owner.id")
@@ -36,6 +53,7 @@ class PhotoSerializer(serializers.ModelSerializer):
         child=serializers.CharField(), write_only=True, required=False, allow_empty=True
     )
     tag_names = serializers.SerializerMethodField(read_only=True)
+    thumbnails = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Photo
@@ -44,6 +62,7 @@ class PhotoSerializer(serializers.ModelSerializer):
             "owner",
             "file",
             "thumbnail",
+            "thumbnails",
             "title",
             "description",
             "width",
@@ -94,27 +113,20 @@ class PhotoSerializer(serializers.ModelSerializer):
             )
         return attrs
 
-    def _prepare_file(self, uploaded_file) -> tuple[str, str]:
-        content = uploaded_file.read()
-        checksum = hashlib.sha256(content).hexdigest()
-        uploaded_file.seek(0)
-        storage_path = default_storage.save(
-            os.path.join("photos", "originals", uploaded_file.name), uploaded_file
-        )
-        return storage_path, checksum
+    def _prepare_file(self, uploaded_file, upload: InspectedUpload) -> tuple[str, str]:
+        return store_upload(uploaded_file, checksum=upload.checksum())
 
     def _sync_tags(self, photo: Photo, tag_names: Iterable[str]) -> None:
-        normalized = [name.strip() for name in tag_names if name.strip()]
-        tags = []
-        for name in normalized:
-            tag, _ = Tag.objects.get_or_create(name=name)
-            tags.append(tag)
-        PhotoTag.objects.filter(photo=photo, source=TagSource.MANUAL).exclude(
-            tag__in=tags
-        ).delete()
-        for tag in tags:
-            PhotoTag.objects.get_or_create(
-                photo=photo, tag=tag, source=TagSource.MANUAL
+        sync_photo_tags({photo.pk: tag_names}, source=TagSource.MANUAL)
+
+    def _ensure_not_duplicate(self, owner, checksum: str, instance: Photo | None = None) -> None:
+        duplicates = Photo.objects.filter(owner=owner, checksum=checksum)
+        if instance is not None:
+            duplicates = duplicates.exclude(pk=instance.pk)
+        existing_id = duplicates.values_list("id", flat=True).first()
+        if existing_id is not None:
+            raise serializers.ValidationError(
+                {"checksum": f"This photo is already in your library (photo {existing_id})"}
             )
 
     def create(self, validated_data):
@@ -122,31 +134,158 @@ class PhotoSerializer(serializers.ModelSerializer):
         tag_names = validated_data.pop("tags", [])
         owner = self.context["request"].user
         if uploaded_file:
-            storage_path, checksum = self._prepare_file(uploaded_file)
+            upload = inspect_upload(uploaded_file)
+            for field, value in upload.metadata.items():
+                validated_data.setdefault(field, value)
+            validated_data["dhash"] = upload.dhash
+            validated_data["dhash_failed"] = upload.dhash is None
+            storage_path, checksum = self._prepare_file(uploaded_file, upload)
+            self._ensure_not_duplicate(owner, checksum)
             validated_data["file"] = storage_path
             validated_data["checksum"] = checksum
-        with transaction.atomic():
-            photo = Photo.objects.create(owner=owner, **validated_data)
-            if tag_names:
-                self._sync_tags(photo, tag_names)
+        try:
+            with transaction.atomic():
+                photo = Photo.objects.create(owner=owner, **validated_data)
+                if tag_names:
+                    self._sync_tags(photo, tag_names)
+                if photo.file:
+                    transaction.on_commit(partial(enqueue_thumbnails, photo.pk))
+        except IntegrityError:
+            self._ensure_not_duplicate(owner, validated_data.get("checksum", ""))
+            raise
         return photo
 
     def update(self, instance: Photo, validated_data):
         uploaded_file = validated_data.pop("uploaded_file", None)
         tag_names = validated_data.pop("tags", None)
         if uploaded_file:
-            storage_path, checksum = self._prepare_file(uploaded_file)
+            upload = inspect_upload(uploaded_file)
+            validated_data["dhash"] = upload.dhash
+            validated_data["dhash_failed"] = upload.dhash is None
+            storage_path, checksum = self._prepare_file(uploaded_file, upload)
+            self._ensure_not_duplicate(instance.owner, checksum, instance)
             validated_data["file"] = storage_path
             validated_data["checksum"] = checksum
+            validated_data["thumbnail"] = None
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
         if tag_names is not None:
             self._sync_tags(instance, tag_names)
+        if uploaded_file:
+            transaction.on_commit(partial(enqueue_thumbnails, instance.pk))
         return instance
 
     def get_tag_names(self, obj: Photo) -> list[str]:
-        return [pt.tag.name for pt in obj.photo_tags.select_related("tag")]
+        # Querysets from PhotoViewSet prefetch the links with their tags; a photo
+        # that was just created or updated falls back to one joined query.
+        photo_tags = obj.photo_tags.all()
+        if "photo_tags" not in getattr(obj, "_prefetched_objects_cache", {}):
+            photo_tags = photo_tags.select_related("tag")
+        return [pt.tag.name for pt in photo_tags]
+
+    def get_thumbnails(self, obj: Photo) -> dict[str, str]:
+        if not obj.thumbnail:
+            return {}
+        request = self.context.get("request")
+        urls = {}
+        for name in settings.PHOTO_THUMBNAIL_SIZES:
+            url = default_storage.url(thumbnail_name(obj.checksum, name))
+            urls[name] = request.build_absolute_uri(url) if request else url
+        return urls
+
+
+class StagedPhotoSerializer(PhotoSerializer):
+    """Creates a photo from a completed upload session (``context["upload_session"]``).
+
+    The checksum comes from the session and the staged file is moved into
+    place, so the upload is not hashed or copied a second time.
+    """
+
+    def _prepare_file(self, uploaded_file, upload: InspectedUpload) -> tuple[str, str]:
+        session = self.context["upload_session"]
+        checksum = staged_checksum(session)
+        # Checked before the move, so a rejected upload leaves the session intact.
+        self._ensure_not_duplicate(session.owner, checksum)
+        return promote_staged_file(session, checksum), checksum
+
+
+class ChecksumLookupSerializer(serializers.Serializer):
+    checksums = serializers.ListField(
+        child=serializers.RegexField(r"^[0-9a-fA-F]{64}$"),
+        allow_empty=False,
+        max_length=1000,
+    )
+
+    def validate_checksums(self, value: list[str]) -> list[str]:
+        return list(dict.fromkeys(checksum.lower() for checksum in value))
+
+
+class RenditionQuerySerializer(serializers.Serializer):
+    w = serializers.IntegerField(min_value=1, required=False, default=0)
+    h = serializers.IntegerField(min_value=1, required=False, default=0)
+    fmt = serializers.ChoiceField(choices=list(RENDER_FORMATS), default="jpeg")
+
+    def validate(self, attrs):
+        if not attrs["w"] and not attrs["h"]:
+            raise serializers.ValidationError("Provide a width (w), a height (h) or both")
+        limit = settings.PHOTO_RENDER_MAX_DIMENSION
+        if attrs["w"] > limit or attrs["h"] > limit:
+            raise serializers.ValidationError(f"Dimensions cannot exceed {limit} pixels")
+        return attrs
+
+
+class BoundingBoxField(serializers.Field):
+    default_error_messages = {"invalid": "Use south,west,north,east in decimal degrees."}
+
+    def to_internal_value(self, data) -> BoundingBox:
+        try:
+            box = BoundingBox(*(float(part) for part in str(data).split(",")))
+        except (TypeError, ValueError):
+            self.fail("invalid")
+        if not (
+            -90 <= box.south <= box.north <= 90
+            and -180 <= box.west <= 180
+            and -180 <= box.east <= 180
+        ):
+            self.fail("invalid")
+        return box
+
+    def to_representation(self, value) -> str:
+        return ",".join(str(part) for part in value)
+
+
+class PointField(serializers.Field):
+    default_error_messages = {"invalid": "Use latitude,longitude in decimal degrees."}
+
+    def to_internal_value(self, data) -> tuple[float, float]:
+        try:
+            latitude, longitude = (float(part) for part in str(data).split(","))
+        except ValueError:
+            self.fail("invalid")
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            self.fail("invalid")
+        return latitude, longitude
+
+    def to_representation(self, value) -> str:
+        return ",".join(str(part) for part in value)
+
+
+class GeoFilterSerializer(serializers.Serializer):
+    bbox = BoundingBoxField(required=False)
+    near = PointField(required=False)
+    radius_km = serializers.FloatField(min_value=0.01, max_value=2000, default=10)
+
+
+class NearDuplicateQuerySerializer(serializers.Serializer):
+    max_distance = serializers.IntegerField(
+        min_value=0, max_value=32, default=lambda: settings.PHOTO_DUPLICATE_MAX_DISTANCE
+    )
+
+
+class ClusterQuerySerializer(serializers.Serializer):
+    bbox = BoundingBoxField()
+    zoom = serializers.IntegerField(min_value=0, max_value=22)
 
 
 class AlbumSerializer(serializers.ModelSerializer):
@@ -238,3 +377,28 @@ class PhotoTagSerializer(serializers.ModelSerializer):
         if request and value.owner != request.user:
             raise serializers.ValidationError("You can only tag your own photos")
         return value
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    total_size = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            "id",
+            "filename",
+            "total_size",
+            "received_size",
+            "expires_at",
+            "created_at",
+        ]
+        read_only_fields = ["id", "received_size", "expires_at", "created_at"]
+
+    def validate_filename(self, value: str) -> str:
+        value = os.path.basename(value.replace("\\", "/"))
+        if not value:
+            raise serializers.ValidationError("Filename cannot be empty")
+        return value
+
+    def create(self, validated_data):
+        return open_session(self.context["request"].user, **validated_data)
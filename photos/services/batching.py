@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from typing import Iterator
+
+from django.db.models import QuerySet
+
+
+def iter_batches(queryset: QuerySet, batch_size: int) -> Iterator[list]:
+    """Yield lists of rows in primary-key order using keyset pagination.
+
+    Unlike ``QuerySet.iterator()``, this is safe on SQLite while the rows
+    being iterated over are updated between batches.
+    """
+    last_pk = None
+    queryset = queryset.order_by("pk")
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        batch = list(page[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from photos.models import Photo
+from photos.services.perceptual import MultiIndexHash
+
+
+class LibraryHashes:
+    """One owner's photo hashes in a multi-index, kept current by Photo signals.
+
+    A library replacing an outdated one starts from its reports, so the
+    duplicates report stays available while it is rebuilt.
+    """
+
+    def __init__(self, owner_id: int, previous: LibraryHashes | None = None):
+        self._lock = threading.Lock()
+        self._hashes = dict(hashed_photos(owner_id).values_list("id", "dhash").iterator())
+        self._index = MultiIndexHash((value, photo_id) for photo_id, value in self._hashes.items())
+        self._version = 0
+        self._reports: dict[int, tuple[int, list[list[int]]]] = {}
+        self._builds: dict[int, threading.Event] = {}
+        if previous is not None:
+            with previous._lock:
+                self._version = previous._version + 1
+                self._reports = dict(previous._reports)
+
+    def matches(self, rows: int, last_id: int) -> bool:
+        """Whether this library holds ``rows`` hashes, the newest of them ``last_id``."""
+        with self._lock:
+            return len(self._hashes) == rows and max(self._hashes, default=0) == last_id
+
+    def update(self, photo_id: int, value: int | None) -> None:
+        with self._lock:
+            self._hashes.pop(photo_id, None)
+            self._index.remove(photo_id)
+            if value is not None:
+                self._hashes[photo_id] = value
+                self._index.add(value, photo_id)
+            self._version += 1
+
+    def near(self, value: int, max_distance: int) -> list[tuple[int, int]]:
+        with self._lock:
+            hits = self._index.search(value, max_distance)
+        return sorted(hits, key=lambda hit: (hit[1], hit[0]))
+
+    def report(self, max_distance: int, wait: float = 0.0) -> list[list[int]] | None:
+        """Near-duplicate groups across the library, built off the request path.
+
+        A missing or outdated report is rebuilt on a background thread. The
+        caller waits up to ``wait`` seconds for it, and otherwise gets the
+        previous report trimmed to photos still in the library, or ``None``
+        when there is none yet.
+        """
+        with self._lock:
+            report = self._reports.get(max_distance)
+            build = self._builds.get(max_distance)
+            if build is None and (report is None or report[0] != self._version):
+                build = self._builds[max_distance] = threading.Event()
+                threading.Thread(
+                    target=self._build_report, args=(max_distance, build), daemon=True
+                ).start()
+        if build is not None:
+            build.wait(wait)
+        with self._lock:
+            report = self._reports.get(max_distance)
+            if report is None:
+                return None
+            groups = [
+                [photo_id for photo_id in group if photo_id in self._hashes] for group in report[1]
+            ]
+        return _ranked_groups(group for group in groups if len(group) > 1)
+
+    def _build_report(self, max_distance: int, done: threading.Event) -> None:
+        try:
+            with self._lock:
+                version, hashes = self._version, dict(self._hashes)
+            groups = duplicate_groups(hashes, max_distance)
+            with self._lock:
+                self._reports[max_distance] = (version, groups)
+        finally:
+            with self._lock:
+                del self._builds[max_distance]
+            done.set()
+
+
+def duplicate_groups(hashes: dict[int, int], max_distance: int) -> list[list[int]]:
+    """Photos linked by chains of near-duplicates, largest groups first."""
+    index = MultiIndexHash((value, photo_id) for photo_id, value in hashes.items())
+    parent: dict[int, int] = {}
+
+    def root(photo_id: int) -> int:
+        while parent.setdefault(photo_id, photo_id) != photo_id:
+            parent[photo_id] = parent[parent[photo_id]]
+            photo_id = parent[photo_id]
+        return photo_id
+
+    for photo_id, value in hashes.items():
+        for other_id, _ in index.search(value, max_distance):
+            if other_id != photo_id:
+                parent[root(other_id)] = root(photo_id)
+    groups: dict[int, list[int]] = {}
+    for photo_id in parent:
+        groups.setdefault(root(photo_id), []).append(photo_id)
+    return _ranked_groups(groups.values())
+
+
+def _ranked_groups(groups: Iterable[list[int]]) -> list[list[int]]:
+    return sorted((sorted(members) for members in groups), key=lambda g: (-len(g), g[0]))
+
+
+_libraries: OrderedDict[int, LibraryHashes] = OrderedDict()
+_libraries_lock = threading.Lock()
+
+
+def hashed_photos(owner_id: int):
+    return Photo.objects.filter(owner_id=owner_id, dhash__isnull=False).order_by()
+
+
+def library_hashes(owner_id: int) -> LibraryHashes:
+    """The owner's hash index, loaded on first use; the least recently used are evicted.
+
+    Signals only report changes made by this process, so every call also
+    compares the count and newest id of the owner's hashed photos with the
+    cached library and reloads it when they differ: uploads and deletes in
+    other processes and bulk backfills are picked up. A hash changed in
+    place by another process (a replaced file) is not.
+    """
+    rows, last_id = (
+        hashed_photos(owner_id).aggregate(rows=Count("pk"), last=Max("pk", default=0)).values()
+    )
+    with _libraries_lock:
+        library = _libraries.get(owner_id)
+        if library is None or not library.matches(rows, last_id):
+            library = _libraries[owner_id] = LibraryHashes(owner_id, previous=library)
+            while len(_libraries) > settings.PHOTO_DUPLICATE_CACHED_LIBRARIES:
+                _libraries.popitem(last=False)
+        _libraries.move_to_end(owner_id)
+        return library
+
+
+def reset() -> None:
+    with _libraries_lock:
+        _libraries.clear()
+
+
+def _apply(owner_id: int, photo_id: int, value: int | None) -> None:
+    library = _libraries.get(owner_id)
+    if library is not None:
+        library.update(photo_id, value)
+
+
+@receiver(post_save, sender=Photo)
+def photo_saved(sender, instance, **kwargs):
+    if instance.owner_id in _libraries:
+        transaction.on_commit(partial(_apply, instance.owner_id, instance.pk, instance.dhash))
+
+
+@receiver(post_delete, sender=Photo)
+def photo_deleted(sender, instance, **kwargs):
+    if instance.owner_id in _libraries:
+        transaction.on_commit(partial(_apply, instance.owner_id, instance.pk, None))
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import io
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.utils import timezone
+from PIL import ExifTags, Image, UnidentifiedImageError
+
+from photos.services.imaging import EXIF_ORIENTATION, TRANSPOSED_ORIENTATIONS
+
+METADATA_FIELDS = [
+    "width",
+    "height",
+    "taken_at",
+    "camera_make",
+    "camera_model",
+    "lens_model",
+    "aperture",
+    "shutter_speed",
+    "focal_length",
+    "iso",
+    "latitude",
+    "longitude",
+]
+
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_DATETIME = 0x0132
+TAG_EXPOSURE_TIME = 0x829A
+TAG_F_NUMBER = 0x829D
+TAG_ISO = 0x8827
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_OFFSET_TIME_ORIGINAL = 0x9011
+TAG_FOCAL_LENGTH = 0x920A
+TAG_LENS_MODEL = 0xA434
+
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+
+COORDINATE_PLACES = Decimal("0.000001")
+
+
+def _text(value, max_length: int = 255) -> str:
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "replace")
+    return str(value).strip().strip("\x00").strip()[:max_length]
+
+
+def _number(value) -> float | None:
+    try:
+        number = float(value[0] if isinstance(value, tuple) else value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return number if number == number else None  # NaN from 0/0 rationals
+
+
+def _datetime(value, offset) -> datetime | None:
+    try:
+        parsed = datetime.strptime(_text(value), "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+    if offset:
+        try:
+            sign = -1 if _text(offset).startswith("-") else 1
+            hours, minutes = _text(offset).lstrip("+-").split(":")
+            delta = timedelta(hours=int(hours), minutes=int(minutes))
+            parsed = parsed.replace(tzinfo=dt_timezone(sign * delta))
+        except ValueError:
+            pass
+    return parsed
+
+
+def _coordinate(dms, ref, limit: int) -> Decimal | None:
+    try:
+        degrees, minutes, seconds = (float(part) for part in dms)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    value = degrees + minutes / 60 + seconds / 3600
+    if _text(ref).upper() in ("S", "W"):
+        value = -value
+    if not -limit <= value <= limit:
+        return None
+    return Decimal(str(value)).quantize(COORDINATE_PLACES)
+
+
+def extract_metadata(source) -> dict:
+    """Read capture metadata from the image header and EXIF segment only.
+
+    ``Image.open`` parses headers lazily and never decodes pixel data here, so
+    this stays cheap for large originals. Returns only the fields it found;
+    unreadable or non-image files yield an empty dict. Safe to run in worker
+    processes.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    try:
+        with Image.open(source) as image:
+            return image_metadata(image)
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        return {}
+
+
+def image_metadata(image: Image.Image) -> dict:
+    """``extract_metadata`` for an image that is already open; pixels are not decoded."""
+    try:
+        width, height = image.size
+        exif = image.getexif()
+        exif_ifd = exif.get_ifd(ExifTags.IFD.Exif)
+        gps_ifd = exif.get_ifd(ExifTags.IFD.GPSInfo)
+    except (OSError, SyntaxError, ValueError):
+        return {}
+
+    if exif.get(EXIF_ORIENTATION) in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    metadata: dict = {"width": width, "height": height}
+
+    for field, tag in (("camera_make", TAG_MAKE), ("camera_model", TAG_MODEL)):
+        if exif.get(tag):
+            metadata[field] = _text(exif[tag])
+    if exif_ifd.get(TAG_LENS_MODEL):
+        metadata["lens_model"] = _text(exif_ifd[TAG_LENS_MODEL])
+
+    taken_at = _datetime(
+        exif_ifd.get(TAG_DATETIME_ORIGINAL) or exif.get(TAG_DATETIME, ""),
+        exif_ifd.get(TAG_OFFSET_TIME_ORIGINAL),
+    )
+    if taken_at:
+        metadata["taken_at"] = taken_at
+
+    f_number = _number(exif_ifd.get(TAG_F_NUMBER))
+    if f_number:
+        metadata["aperture"] = f"f/{round(f_number, 1):g}"
+    exposure = _number(exif_ifd.get(TAG_EXPOSURE_TIME))
+    if exposure:
+        metadata["shutter_speed"] = f"1/{round(1 / exposure)}" if exposure < 1 else f"{exposure:g}s"
+    focal_length = _number(exif_ifd.get(TAG_FOCAL_LENGTH))
+    if focal_length:
+        metadata["focal_length"] = f"{focal_length:g}mm"
+    iso = _number(exif_ifd.get(TAG_ISO))
+    if iso and iso > 0:
+        metadata["iso"] = int(iso)
+
+    if GPS_LATITUDE in gps_ifd and GPS_LONGITUDE in gps_ifd:
+        latitude = _coordinate(gps_ifd[GPS_LATITUDE], gps_ifd.get(GPS_LATITUDE_REF), 90)
+        longitude = _coordinate(gps_ifd[GPS_LONGITUDE], gps_ifd.get(GPS_LONGITUDE_REF), 180)
+        if latitude is not None and longitude is not None:
+            metadata["latitude"] = latitude
+            metadata["longitude"] = longitude
+    return metadata
+
+
+def localize(metadata: dict) -> dict:
+    """Attach the default time zone to capture times recorded without an offset."""
+    taken_at = metadata.get("taken_at")
+    if taken_at is not None and timezone.is_naive(taken_at):
+        metadata["taken_at"] = timezone.make_aware(taken_at)
+    return metadata
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import math
+from typing import NamedTuple
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12
+EARTH_RADIUS_KM = 6371.0088
+# Bounding boxes are covered by at most this many geohash cells; coarser
+# cells read a few extra rows, which the exact coordinate filter drops.
+MAX_COVER_CELLS = 32
+
+
+class BoundingBox(NamedTuple):
+    south: float
+    west: float
+    north: float
+    east: float
+
+
+def encode_geohash(latitude, longitude, precision: int = GEOHASH_PRECISION) -> str:
+    latitude = min(max(float(latitude), -90.0), 90.0)
+    longitude = min(max(float(longitude), -180.0), 180.0)
+    lat_low, lat_high, lon_low, lon_high = -90.0, 90.0, -180.0, 180.0
+    chars, value, bits, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            middle = (lon_low + lon_high) / 2
+            bit = longitude >= middle
+            lon_low, lon_high = (middle, lon_high) if bit else (lon_low, middle)
+        else:
+            middle = (lat_low + lat_high) / 2
+            bit = latitude >= middle
+            lat_low, lat_high = (middle, lat_high) if bit else (lat_low, middle)
+        value, bits, even = value << 1 | bit, bits + 1, not even
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            value, bits = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> tuple[float, float]:
+    """Height and width in degrees of a geohash cell of ``precision`` characters."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def cell_bounds(geohash: str) -> BoundingBox:
+    height, width = cell_size(len(geohash))
+    south, west = -90.0, -180.0
+    lat_step, lon_step, even = 90.0, 180.0, True
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bit = value >> shift & 1
+            if even:
+                west += lon_step * bit
+                lon_step /= 2
+            else:
+                south += lat_step * bit
+                lat_step /= 2
+            even = not even
+    return BoundingBox(south, west, south + height, west + width)
+
+
+def split_antimeridian(box: BoundingBox) -> list[BoundingBox]:
+    """``box`` as one or two boxes with ``west <= east``."""
+    if box.west <= box.east:
+        return [box]
+    return [box._replace(east=180.0), box._replace(west=-180.0)]
+
+
+def covering_cells(box: BoundingBox, max_cells: int = MAX_COVER_CELLS) -> list[str]:
+    """The finest geohash cells, at most ``max_cells`` of them, that cover ``box``."""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(_cell_index(box.south, -90, height), _cell_index(box.north, -90, height) + 1)
+        columns = range(_cell_index(box.west, -180, width), _cell_index(box.east, -180, width) + 1)
+        if len(rows) * len(columns) <= max_cells or precision == 1:
+            return sorted(
+                encode_geohash(-90 + (row + 0.5) * height, -180 + (column + 0.5) * width, precision)
+                for row in rows
+                for column in columns
+            )
+    return []
+
+
+def cluster_precision(zoom: int) -> int:
+    """Geohash length whose cells are about a quarter of a map tile at ``zoom``."""
+    tile_width = 360.0 / 2**zoom
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        if cell_size(precision)[1] <= tile_width / 4:
+            return precision
+    return GEOHASH_PRECISION
+
+
+def radius_box(latitude: float, longitude: float, radius_km: float) -> BoundingBox:
+    """A box that contains every point within ``radius_km`` of the centre."""
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = max(latitude - delta_lat, -90.0), min(latitude + delta_lat, 90.0)
+    if south == -90.0 or north == 90.0:
+        return BoundingBox(south, -180.0, north, 180.0)
+    ratio = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude))
+    if ratio >= 1.0:
+        return BoundingBox(south, -180.0, north, 180.0)
+    delta_lon = math.degrees(math.asin(ratio))
+    west, east = longitude - delta_lon, longitude + delta_lon
+    return BoundingBox(
+        south, west + 360 if west < -180 else west, north, east - 360 if east > 180 else east
+    )
+
+
+def _cell_index(value: float, origin: float, size: float) -> int:
+    return min(int((value - origin) // size), int(round(abs(origin) * 2 / size)) - 1)
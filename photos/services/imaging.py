@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import io
+
+from PIL import Image, ImageOps
+
+# Image.reduce() handles the bulk of a large downscale cheaply; the final
+# LANCZOS resize then only has to cover at most this factor.
+REDUCING_GAP = 2.0
+
+EXIF_ORIENTATION = 0x0112
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def fit_within(size: tuple[int, int], box: tuple[int, int]) -> tuple[int, int]:
+    width, height = size
+    scale = min(box[0] / width, box[1] / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def open_for_box(source, box: tuple[int, int]) -> Image.Image:
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    return decode_for_box(Image.open(source), box)
+
+
+def decode_for_box(image: Image.Image, box: tuple[int, int]) -> Image.Image:
+    """Decode an opened ``image`` at the smallest resolution that still covers ``box``.
+
+    For JPEGs ``draft()`` lets libjpeg decode at 1/2, 1/4 or 1/8 scale, which
+    is far cheaper than decoding the full image and shrinking it afterwards.
+    ``image`` must not have been loaded yet.
+    """
+    if image.getexif().get(EXIF_ORIENTATION) in TRANSPOSED_ORIENTATIONS:
+        box = (box[1], box[0])
+    image.draft("RGB", fit_within(image.size, box))
+    return ImageOps.exif_transpose(image)
+
+
+def downscale(image: Image.Image, box: tuple[int, int]) -> Image.Image:
+    target = fit_within(image.size, box)
+    if target == image.size:
+        return image
+    factor = int(min(image.width / target[0], image.height / target[1]) / REDUCING_GAP)
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image.resize(target, Image.Resampling.LANCZOS)
+
+
+def encode(image: Image.Image, image_format: str = "JPEG", quality: int = 85) -> bytes:
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=quality)
+    return buffer.getvalue()
+
+
+def render_thumbnails(source, sizes: dict[str, int], quality: int) -> dict[str, bytes]:
+    """Render every thumbnail size from a single decode, largest first.
+
+    Each size is derived from the previous (larger) rendition rather than from
+    the original, so the original is only decoded once. This function runs in
+    worker processes and must not touch Django models or settings.
+    """
+    largest = max(sizes.values())
+    image = open_for_box(source, (largest, largest))
+    rendered = {}
+    for name, edge in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+        image = downscale(image, (edge, edge))
+        rendered[name] = encode(image, "JPEG", quality)
+    return rendered
+
+
+def render_variant(source, box: tuple[int, int], image_format: str, quality: int) -> bytes:
+    return encode(downscale(open_for_box(source, box), box), image_format, quality)
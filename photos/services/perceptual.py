@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from functools import lru_cache
+from itertools import combinations
+
+from PIL import Image
+
+from photos.services.imaging import decode_for_box, open_for_box
+
+HASH_WIDTH, HASH_HEIGHT = 9, 8
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+HASH_DECODE_BOX = (HASH_WIDTH * 8, HASH_HEIGHT * 8)
+
+
+def hash_input(source) -> bytes:
+    """The 9x8 grayscale pixels a dHash compares.
+
+    Runs in worker processes during backfills, so it only touches Pillow.
+    """
+    return _shrink(open_for_box(source, HASH_DECODE_BOX))
+
+
+def _shrink(image: Image.Image) -> bytes:
+    image = image.convert("L").resize((HASH_WIDTH, HASH_HEIGHT), Image.Resampling.BOX)
+    return image.tobytes()
+
+
+def read_hash_input(source) -> bytes | None:
+    """``hash_input``, or ``None`` when ``source`` cannot be read as an image."""
+    try:
+        return hash_input(source)
+    except OSError:
+        return None
+
+
+def dhash_from_pixels(pixels: bytes) -> int:
+    """One bit per horizontally adjacent pixel pair: 1 where brightness increases."""
+    value = 0
+    for offset in range(0, HASH_WIDTH * HASH_HEIGHT, HASH_WIDTH):
+        for column in range(offset, offset + HASH_WIDTH - 1):
+            value = value << 1 | (pixels[column + 1] > pixels[column])
+    return value
+
+
+def dhash(source) -> int:
+    return dhash_from_pixels(hash_input(source))
+
+
+def read_dhash(source) -> int | None:
+    """The stored (signed) form of ``dhash``, or ``None`` when ``source`` is not an image.
+
+    Runs in worker processes during backfills.
+    """
+    pixels = read_hash_input(source)
+    return None if pixels is None else to_signed(dhash_from_pixels(pixels))
+
+
+def image_dhash(image: Image.Image) -> int | None:
+    """``read_dhash`` for an image that is already open but not yet decoded."""
+    try:
+        pixels = _shrink(decode_for_box(image, HASH_DECODE_BOX))
+    except OSError:
+        return None
+    return to_signed(dhash_from_pixels(pixels))
+
+
+def to_signed(value: int) -> int:
+    """Fold a 64-bit hash into the range of a signed BIGINT column."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming(a: int, b: int) -> int:
+    return ((a ^ b) & HASH_MASK).bit_count()
+
+
+class MultiIndexHash:
+    """Multi-index hashing over 64-bit hashes under Hamming distance.
+
+    Each hash is split into ``blocks`` substrings with an exact-match table
+    per substring. Two hashes within distance ``r`` differ in at most
+    ``r // blocks`` bits on at least one substring (pigeonhole), so a query
+    only looks up the keys that close to its own substrings and verifies
+    those candidates. Where that would probe more keys than there are items,
+    a linear scan is cheaper and is used instead.
+    """
+
+    def __init__(self, items: Iterable[tuple[int, int]] = (), blocks: int = 4):
+        self._blocks = blocks
+        self._width = HASH_BITS // blocks
+        self._tables: list[dict[int, set[int]]] = [{} for _ in range(blocks)]
+        self._values: dict[int, int] = {}
+        for value, item_id in items:
+            self.add(value, item_id)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, value: int, item_id: int) -> None:
+        self.remove(item_id)
+        value &= HASH_MASK
+        self._values[item_id] = value
+        for table, key in zip(self._tables, self._keys(value)):
+            table.setdefault(key, set()).add(item_id)
+
+    def remove(self, item_id: int) -> None:
+        value = self._values.pop(item_id, None)
+        if value is None:
+            return
+        for table, key in zip(self._tables, self._keys(value)):
+            bucket = table[key]
+            bucket.discard(item_id)
+            if not bucket:
+                del table[key]
+
+    def search(self, value: int, radius: int) -> list[tuple[int, int]]:
+        """``(item_id, distance)`` for every item within ``radius`` of ``value``."""
+        value &= HASH_MASK
+        masks = _flip_masks(self._width, radius // self._blocks)
+        if len(masks) * self._blocks >= len(self._values):
+            candidates = self._values.keys()
+        else:
+            candidates = set()
+            for table, key in zip(self._tables, self._keys(value)):
+                for mask in masks:
+                    candidates.update(table.get(key ^ mask, ()))
+        hits = []
+        for item_id in candidates:
+            distance = hamming(value, self._values[item_id])
+            if distance <= radius:
+                hits.append((item_id, distance))
+        return hits
+
+    def _keys(self, value: int) -> list[int]:
+        mask = (1 << self._width) - 1
+        return [value >> (block * self._width) & mask for block in range(self._blocks)]
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(width: int, radius: int) -> tuple[int, ...]:
+    """Every ``width``-bit mask with at most ``radius`` bits set."""
+    return tuple(
+        sum(1 << bit for bit in bits)
+        for count in range(min(radius, width) + 1)
+        for bits in combinations(range(width), count)
+    )
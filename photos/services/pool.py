@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def create_process_pool(workers: int) -> ProcessPoolExecutor:
+    # "spawn" keeps workers from inheriting the web server's threads and open
+    # database connections, which is unsafe with the default "fork" start method.
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def get_process_pool() -> ProcessPoolExecutor | None:
+    """Return the shared image-processing pool, or ``None`` to work inline."""
+    global _executor
+    workers = settings.PHOTO_PROCESS_POOL_WORKERS
+    if not workers:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = create_process_pool(workers)
+        return _executor
+
+
+def submit(fn, *args) -> Future:
+    pool = get_process_pool()
+    if pool is not None:
+        return pool.submit(fn, *args)
+    future: Future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as exc:
+        future.set_exception(exc)
+    return future
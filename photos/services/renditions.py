@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import BinaryIO
+
+from django.conf import settings
+
+from photos.models import Photo
+from photos.services.imaging import render_variant
+from photos.services.pool import submit
+from photos.services.thumbnails import render_source
+
+RENDER_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+    "png": ("PNG", "image/png"),
+}
+
+
+class UnrenderableImage(Exception):
+    """The original could not be read or decoded as an image."""
+
+
+class RenditionUnavailable(Exception):
+    """The rendition kept being evicted before it could be opened."""
+
+
+class DiskLRUCache:
+    """A directory of files bounded to ``max_bytes``, evicting least recently used.
+
+    Recency is tracked in memory and mirrored to file mtimes, so the order
+    survives restarts and is shared (approximately) between processes.
+    """
+
+    def __init__(self, directory, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, int] | None = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _index(self) -> OrderedDict[str, int]:
+        if self._entries is None:
+            files = []
+            for path in self.directory.rglob("*"):
+                if path.is_file() and not path.name.startswith("."):
+                    stat = path.stat()
+                    files.append(
+                        (stat.st_mtime, path.relative_to(self.directory).as_posix(), stat.st_size)
+                    )
+            files.sort()
+            self._entries = OrderedDict((key, size) for _, key, size in files)
+            self._size = sum(self._entries.values())
+        return self._entries
+
+    def get(self, key: str) -> Path | None:
+        path = self.directory / key
+        try:
+            size = path.stat().st_size
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._size -= self._index().pop(key, 0)
+            return None
+        with self._lock:
+            entries = self._index()
+            if key not in entries:
+                entries[key] = size
+                self._size += size
+            entries.move_to_end(key)
+        return path
+
+    def open(self, key: str) -> BinaryIO | None:
+        """Open a cached file for reading, or ``None`` on a miss.
+
+        The file is opened under the lock evictions take, so once this
+        returns the handle stays readable even if the entry is evicted.
+        """
+        path = self.directory / key
+        with self._lock:
+            entries = self._index()
+            try:
+                cached = open(path, "rb")
+            except FileNotFoundError:
+                self._size -= entries.pop(key, 0)
+                return None
+            os.utime(cached.fileno())
+            size = os.fstat(cached.fileno()).st_size
+            self._size += size - entries.pop(key, 0)
+            entries[key] = size
+        return cached
+
+    def put(self, key: str, content: bytes) -> Path:
+        path = self.directory / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".")
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(content)
+        os.replace(temp_path, path)
+        with self._lock:
+            entries = self._index()
+            self._size += len(content) - entries.pop(key, 0)
+            entries[key] = len(content)
+            self._evict(keep=key)
+        return path
+
+    def _evict(self, keep: str) -> None:
+        entries = self._entries
+        while self._size > self.max_bytes and len(entries) > 1:
+            key, size = entries.popitem(last=False)
+            if key == keep:
+                entries[key] = size
+                continue
+            self._size -= size
+            try:
+                os.remove(self.directory / key)
+            except FileNotFoundError:
+                pass
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            self._index()
+            return self._size
+
+
+_cache: DiskLRUCache | None = None
+_inflight: dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def get_render_cache() -> DiskLRUCache:
+    global _cache
+    directory = Path(settings.PHOTO_RENDER_CACHE_DIR)
+    max_bytes = settings.PHOTO_RENDER_CACHE_MAX_BYTES
+    if _cache is None or _cache.directory != directory or _cache.max_bytes != max_bytes:
+        _cache = DiskLRUCache(directory, max_bytes)
+    return _cache
+
+
+def rendition_key(checksum: str, width: int, height: int, fmt: str) -> str:
+    return f"{checksum[:2]}/{checksum}/{width}x{height}.{fmt}"
+
+
+def rendition_etag(checksum: str, width: int, height: int, fmt: str) -> str:
+    return f'"{checksum}-{width}x{height}-{fmt}"'
+
+
+def get_rendition(photo: Photo, width: int, height: int, fmt: str) -> Path:
+    """Return the cached rendition path, rendering it at most once per process.
+
+    ``width``/``height`` of 0 leave that dimension unconstrained. Concurrent
+    requests for the same variant wait on the render already in flight.
+    """
+    cache = get_render_cache()
+    key = rendition_key(photo.checksum, width, height, fmt)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    with _inflight_lock:
+        pending = _inflight.get(key)
+        if pending is None:
+            _inflight[key] = future = Future()
+    if pending is not None:
+        return pending.result()
+
+    try:
+        limit = settings.PHOTO_RENDER_MAX_DIMENSION
+        box = (width or limit, height or limit)
+        try:
+            content = submit(
+                render_variant,
+                render_source(photo),
+                box,
+                RENDER_FORMATS[fmt][0],
+                settings.PHOTO_THUMBNAIL_QUALITY,
+            ).result()
+        except OSError as exc:
+            # Covers UnidentifiedImageError; cache I/O below is not the image's fault.
+            raise UnrenderableImage(str(exc)) from exc
+        path = cache.put(key, content)
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    else:
+        future.set_result(path)
+        return path
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def open_rendition(photo: Photo, width: int, height: int, fmt: str) -> BinaryIO:
+    """``get_rendition``, opened inside the cache so an eviction cannot pull it away.
+
+    Another process may still evict the file between the render and the
+    open; it is then rendered once more before giving up.
+    """
+    cache = get_render_cache()
+    key = rendition_key(photo.checksum, width, height, fmt)
+    for _ in range(2):
+        cached = cache.open(key)
+        if cached is not None:
+            return cached
+        get_rendition(photo, width, height, fmt)
+    cached = cache.open(key)
+    if cached is None:
+        raise RenditionUnavailable(key)
+    return cached
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+
+from django.db import transaction
+
+from photos.models import PhotoTag, Tag, TagSource, tag_key
+from photos.signals import photos_changed, tags_changed
+
+TAG_NAME_MAX_LENGTH = Tag._meta.get_field("name").max_length
+
+
+def normalize_tag_name(name: str) -> str:
+    return " ".join(str(name).strip().lstrip("#").split())[:TAG_NAME_MAX_LENGTH]
+
+
+def normalize_tag_names(names: Iterable[str]) -> list[str]:
+    """Normalize ``names``, dropping blanks and case-insensitive repeats, keeping order."""
+    normalized = {}
+    for name in names:
+        name = normalize_tag_name(name)
+        if name:
+            normalized.setdefault(tag_key(name), name)
+    return list(normalized.values())
+
+
+def resolve_tags(names: Iterable[str]) -> dict[str, Tag]:
+    """Map each normalized name to its Tag, creating the missing ones in bulk.
+
+    Names are matched on their casefolded key, so "Travel" resolves to an
+    existing "travel" tag; a new tag keeps the first spelling it was given.
+    """
+    names_by_key = {}
+    for name in names:
+        names_by_key.setdefault(tag_key(name), []).append(name)
+    if not names_by_key:
+        return {}
+    tags = {tag.key: tag for tag in Tag.objects.filter(key__in=names_by_key)}
+    missing = names_by_key.keys() - tags.keys()
+    if missing:
+        # ignore_conflicts leaves pks unset (and tolerates a concurrent insert
+        # of the same key), so the new rows are read back.
+        Tag.objects.bulk_create(
+            [Tag(name=names_by_key[key][0], key=key) for key in missing], ignore_conflicts=True
+        )
+        tags.update((tag.key, tag) for tag in Tag.objects.filter(key__in=missing))
+    return {name: tags[key] for key, spellings in names_by_key.items() for name in spellings}
+
+
+def sync_photo_tags(
+    tag_names_by_photo: Mapping[int, Iterable[str]],
+    source: str = TagSource.MANUAL,
+    replace: bool = True,
+) -> tuple[int, int]:
+    """Bring each photo's ``source`` tags in line with its names in bulk.
+
+    With ``replace`` the photos end up with exactly the given tags (for that
+    source); without it the names are only added. The statement count does
+    not depend on how many photos or tags are involved. Returns
+    ``(created, deleted)``.
+    """
+    names_by_photo = {
+        photo_id: normalize_tag_names(names) for photo_id, names in tag_names_by_photo.items()
+    }
+    with transaction.atomic(savepoint=False):
+        tags = resolve_tags(name for names in names_by_photo.values() for name in names)
+        wanted = {
+            (photo_id, tags[name].pk)
+            for photo_id, names in names_by_photo.items()
+            for name in names
+        }
+        existing = {
+            (photo_id, tag_id): link_id
+            for link_id, photo_id, tag_id in PhotoTag.objects.filter(
+                photo_id__in=names_by_photo, source=source
+            )
+            .order_by()
+            .values_list("id", "photo_id", "tag_id")
+        }
+        stale = (
+            [link_id for key, link_id in existing.items() if key not in wanted] if replace else []
+        )
+        if stale:
+            PhotoTag.objects.filter(pk__in=stale).delete()
+        missing = wanted - existing.keys()
+        if missing:
+            PhotoTag.objects.bulk_create(
+                [
+                    PhotoTag(photo_id=photo_id, tag_id=tag_id, source=source)
+                    for photo_id, tag_id in missing
+                ],
+                ignore_conflicts=True,
+            )
+        if missing or stale:
+            removed = {key for key, link_id in existing.items() if link_id in stale}
+            changed = missing | removed
+            photos_changed.send(sender=PhotoTag, photo_ids={photo_id for photo_id, _ in changed})
+            tags_changed.send(sender=PhotoTag, tag_ids={tag_id for _, tag_id in changed})
+    return len(missing), len(stale)
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import logging
+import os
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import UnidentifiedImageError
+
+from photos.models import Photo
+from photos.services.imaging import render_thumbnails
+from photos.services.pool import get_process_pool
+
+logger = logging.getLogger(__name__)
+
+THUMBNAILS_DIR = os.path.join("photos", "thumbnails")
+
+
+def thumbnail_name(checksum: str, size_name: str) -> str:
+    return os.path.join(THUMBNAILS_DIR, size_name, checksum[:2], f"{checksum}.jpg")
+
+
+def default_size_name() -> str:
+    sizes = settings.PHOTO_THUMBNAIL_SIZES
+    return min(sizes, key=sizes.get)
+
+
+def thumbnails_exist(checksum: str) -> bool:
+    return all(
+        default_storage.exists(thumbnail_name(checksum, name))
+        for name in settings.PHOTO_THUMBNAIL_SIZES
+    )
+
+
+def render_source(photo: Photo):
+    """Return something a worker process can open: a local path, or the bytes."""
+    try:
+        return default_storage.path(photo.file.name)
+    except NotImplementedError:
+        with default_storage.open(photo.file.name, "rb") as original:
+            return original.read()
+
+
+def render_args(photo: Photo) -> tuple:
+    return (
+        render_source(photo),
+        settings.PHOTO_THUMBNAIL_SIZES,
+        settings.PHOTO_THUMBNAIL_QUALITY,
+    )
+
+
+def save_thumbnails(photo: Photo, rendered: dict[str, bytes] | None = None) -> None:
+    # Thumbnails are addressed by checksum, so duplicate uploads share them.
+    for name, content in (rendered or {}).items():
+        path = thumbnail_name(photo.checksum, name)
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(content))
+    photo.thumbnail.name = thumbnail_name(photo.checksum, default_size_name())
+    Photo.objects.filter(pk=photo.pk).update(thumbnail=photo.thumbnail.name)
+
+
+def generate_thumbnails(photo: Photo, force: bool = False) -> bool:
+    if not photo.file:
+        return False
+    if not force and thumbnails_exist(photo.checksum):
+        save_thumbnails(photo)
+        return True
+    try:
+        rendered = render_thumbnails(*render_args(photo))
+    except (UnidentifiedImageError, OSError):
+        logger.warning("Could not render thumbnails for photo %s", photo.pk, exc_info=True)
+        return False
+    save_thumbnails(photo, rendered)
+    return True
+
+
+def _store_pooled_result(photo: Photo, future) -> None:
+    # Runs on the executor's result thread, which needs its own DB connection.
+    try:
+        save_thumbnails(photo, future.result())
+    except Exception:
+        logger.warning("Could not render thumbnails for photo %s", photo.pk, exc_info=True)
+    finally:
+        connection.close()
+
+
+def enqueue_thumbnails(photo_id: int) -> None:
+    """Render thumbnails for a freshly uploaded photo off the request thread."""
+    photo = Photo.objects.filter(pk=photo_id).only("id", "file", "checksum").first()
+    if photo is None or not photo.file:
+        return
+    pool = get_process_pool()
+    if pool is None or thumbnails_exist(photo.checksum):
+        generate_thumbnails(photo)
+        return
+    future = pool.submit(render_thumbnails, *render_args(photo))
+    future.add_done_callback(partial(_store_pooled_result, photo))
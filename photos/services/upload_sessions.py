@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import os
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+from typing import BinaryIO
+
+from django.conf import settings
+from django.core.files.base import File
+from django.db.models import F
+from django.utils import timezone
+
+from photos.models import UploadSession
+from photos.services.uploads import store_local_file
+
+# Whole-file SHA-256 of sessions received in order by this process, keyed by
+# session id as ``(generation, offset, hasher)``. A write by any other process
+# bumps the session's generation, which retires the entry. Bounded so
+# abandoned sessions age out.
+_running_digests: dict = {}
+MAX_RUNNING_DIGESTS = 1024
+
+
+class UploadSessionError(Exception):
+    pass
+
+
+class RangeNotSatisfiable(UploadSessionError):
+    pass
+
+
+class ChunkChecksumMismatch(UploadSessionError):
+    pass
+
+
+class UploadIncomplete(UploadSessionError):
+    pass
+
+
+class SessionGone(UploadSessionError):
+    """The session was completed or discarded while this request waited for it."""
+
+
+def staging_path(session: UploadSession) -> Path:
+    return Path(settings.PHOTO_UPLOAD_STAGING_DIR) / f"{session.pk}.part"
+
+
+def _expiry():
+    return timezone.now() + timedelta(seconds=settings.PHOTO_UPLOAD_SESSION_TTL)
+
+
+def open_session(owner, filename: str, total_size: int) -> UploadSession:
+    session = UploadSession.objects.create(
+        owner=owner, filename=filename, total_size=total_size, expires_at=_expiry()
+    )
+    path = staging_path(session)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    return session
+
+
+@contextmanager
+def locked_session(session: UploadSession) -> Iterator[BinaryIO]:
+    """Hold the staged file exclusively, with ``session`` reloaded, and yield it.
+
+    Writes and completion both take this lock, whichever server process
+    handles them, so they never interleave on the staged bytes. (Row locks
+    cannot do this: ``select_for_update`` is a no-op on SQLite.)
+    """
+    try:
+        staged = open(staging_path(session), "r+b")
+    except FileNotFoundError:
+        raise SessionGone() from None
+    with staged:
+        fcntl.flock(staged, fcntl.LOCK_EX)
+        try:
+            session.refresh_from_db()
+        except UploadSession.DoesNotExist:
+            raise SessionGone() from None
+        yield staged
+
+
+def write_range(
+    session: UploadSession,
+    start: int,
+    length: int,
+    stream,
+    expected_sha256: str | None = None,
+) -> UploadSession:
+    """Stage ``length`` bytes from ``stream`` at offset ``start``; return the updated session.
+
+    Ranges may rewrite the tail of what was already received but cannot leave
+    a gap. When the client sends a chunk checksum, a short or corrupted body
+    rolls the session back to ``start``; otherwise whatever arrived is kept so
+    the client can resume from the reported offset.
+    """
+    with locked_session(session) as staged:
+        return _write_locked(session, staged, start, length, stream, expected_sha256)
+
+
+def _write_locked(session, staged, start, length, stream, expected_sha256):
+    if start > session.received_size:
+        raise RangeNotSatisfiable(f"Expected a range starting at or before {session.received_size}")
+    if start + length > session.total_size:
+        raise RangeNotSatisfiable("Range extends past the declared upload size")
+
+    hasher = hashlib.sha256()
+    previous = _running_digests.pop(session.pk, None)
+    running = None
+    if start == 0:
+        running = hashlib.sha256()
+    elif previous is not None and previous[:2] == (session.generation, start):
+        # Only a range continuing exactly where this process's digest stopped extends it.
+        running = previous[2]
+    written = 0
+    staged.seek(start)
+    while written < length:
+        chunk = stream.read(min(settings.PHOTO_UPLOAD_CHUNK_SIZE, length - written))
+        if not chunk:
+            break
+        hasher.update(chunk)
+        if running is not None:
+            running.update(chunk)
+        staged.write(chunk)
+        written += len(chunk)
+
+    verified = expected_sha256 is None or (
+        written == length and hasher.hexdigest() == expected_sha256.lower()
+    )
+    received = start + written if verified else start
+    staged.truncate(received)
+
+    expires_at = _expiry()
+    updated = UploadSession.objects.filter(pk=session.pk, generation=session.generation).update(
+        received_size=received, generation=F("generation") + 1, expires_at=expires_at
+    )
+    if not updated:
+        # Only a purge ignores the lock; the staged bytes are gone with it.
+        raise SessionGone()
+    session.received_size, session.expires_at = received, expires_at
+    session.generation += 1
+    if running is not None and verified:
+        while len(_running_digests) >= MAX_RUNNING_DIGESTS:
+            del _running_digests[next(iter(_running_digests))]
+        _running_digests[session.pk] = (session.generation, received, running)
+    if not verified:
+        raise ChunkChecksumMismatch("Chunk checksum did not match the received bytes")
+    return session
+
+
+def staged_upload(session: UploadSession) -> File:
+    if session.received_size != session.total_size:
+        raise UploadIncomplete(f"Received {session.received_size} of {session.total_size} bytes")
+    return File(open(staging_path(session), "rb"), name=session.filename)
+
+
+def staged_checksum(session: UploadSession) -> str:
+    """SHA-256 of the staged file, from the running digest when it is still current.
+
+    The digest only counts if this process made the session's latest write;
+    otherwise, or after a restart, the staged file is hashed.
+    """
+    running = _running_digests.get(session.pk)
+    if running is not None and running[:2] == (session.generation, session.total_size):
+        return running[2].hexdigest()
+    return _hash_file(staging_path(session))
+
+
+def _hash_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as staged:
+        while chunk := staged.read(settings.PHOTO_UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def promote_staged_file(session: UploadSession, checksum: str) -> str:
+    """Move the staged file of a completed session to its content address."""
+    storage_path = store_local_file(staging_path(session), session.filename, checksum)
+    _running_digests.pop(session.pk, None)
+    return storage_path
+
+
+def discard_session(session: UploadSession) -> None:
+    _running_digests.pop(session.pk, None)
+    try:
+        os.remove(staging_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def purge_expired_sessions(now=None) -> int:
+    expired = UploadSession.objects.filter(expires_at__lte=now or timezone.now())
+    sessions = list(expired.only("pk"))
+    for session in sessions:
+        discard_session(session)
+    return len(sessions)
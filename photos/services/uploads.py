@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import uuid
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from PIL import Image, UnidentifiedImageError
+
+from photos.services.exif import image_metadata, localize
+from photos.services.perceptual import image_dhash
+
+ORIGINALS_DIR = os.path.join("photos", "originals")
+INCOMING_DIR = os.path.join("photos", "incoming")
+
+
+class HashingFile(File):
+    """File proxy that feeds every byte read through SHA-256.
+
+    Storage backends consume uploads through ``read()``/``chunks()``, so the
+    digest is produced in the same pass that writes the file. Rewinding to the
+    start resets the digest, which keeps it correct if a backend retries.
+    """
+
+    def __init__(self, file, name: str | None = None, chunk_size: int | None = None):
+        super().__init__(file, name=name or getattr(file, "name", None))
+        self.DEFAULT_CHUNK_SIZE = chunk_size or settings.PHOTO_UPLOAD_CHUNK_SIZE
+        self._hasher = hashlib.sha256()
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        self._hasher.update(data)
+        self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        position = self.file.seek(offset, whence)
+        if offset == 0 and whence == os.SEEK_SET:
+            self._hasher = hashlib.sha256()
+            self.bytes_read = 0
+        return position
+
+    def hexdigest(self) -> str:
+        return self._hasher.hexdigest()
+
+
+class PrefixHashingFile(File):
+    """File proxy that hashes bytes the first time a read reaches them.
+
+    Readers such as Pillow seek back and forth while parsing; a read only feeds
+    SHA-256 where it extends the contiguous prefix hashed so far, and
+    ``hexdigest()`` reads just what follows that prefix. The file is rewound
+    afterwards.
+    """
+
+    def __init__(self, file, chunk_size: int | None = None):
+        super().__init__(file, name=getattr(file, "name", None))
+        self.DEFAULT_CHUNK_SIZE = chunk_size or settings.PHOTO_UPLOAD_CHUNK_SIZE
+        self._hasher = hashlib.sha256()
+        self._hashed = 0
+
+    def read(self, size: int = -1) -> bytes:
+        start = self.file.tell()
+        data = self.file.read(size)
+        if start <= self._hashed < start + len(data):
+            self._hasher.update(data[self._hashed - start :])
+            self._hashed = start + len(data)
+        return data
+
+    def hexdigest(self) -> str:
+        self.file.seek(self._hashed)
+        while self.read(self.DEFAULT_CHUNK_SIZE):
+            pass
+        self.file.seek(0)
+        return self._hasher.hexdigest()
+
+
+class InspectedUpload(NamedTuple):
+    metadata: dict
+    dhash: int | None
+    hashing_file: PrefixHashingFile
+
+    def checksum(self) -> str:
+        return self.hashing_file.hexdigest()
+
+
+def inspect_upload(uploaded_file) -> InspectedUpload:
+    """Capture metadata and dHash of ``uploaded_file`` from a single open of the image.
+
+    The bytes Pillow reads are hashed on the way through, so ``checksum()``
+    only reads what the decoder skipped. Non-images yield no metadata and no
+    dHash. Leaves the file rewound.
+    """
+    hashing_file = PrefixHashingFile(uploaded_file)
+    metadata, dhash = {}, None
+    try:
+        # Header fields first: decoding for the hash drafts the image smaller.
+        with Image.open(hashing_file) as image:
+            metadata = localize(image_metadata(image))
+            dhash = image_dhash(image)
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        pass
+    hashing_file.seek(0)
+    return InspectedUpload(metadata, dhash, hashing_file)
+
+
+def content_addressed_name(checksum: str, filename: str, directory: str = ORIGINALS_DIR) -> str:
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(directory, checksum[:2], checksum[2:4], f"{checksum}{extension}")
+
+
+def _promote(source: str, target: str) -> str:
+    try:
+        source_path = default_storage.path(source)
+        target_path = default_storage.path(target)
+    except NotImplementedError:
+        with default_storage.open(source) as staged:
+            target = default_storage.save(target, staged)
+        default_storage.delete(source)
+        return target
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    os.replace(source_path, target_path)
+    return target
+
+
+def store_upload(
+    uploaded_file, directory: str = ORIGINALS_DIR, checksum: str | None = None
+) -> tuple[str, str]:
+    """Store ``uploaded_file`` under its content address; return ``(storage_path, sha256)``.
+
+    Bytes that are already stored are not written again. Uploads Django spooled
+    to a temporary file are hashed in place and then moved, so they are never
+    copied; in-memory uploads are hashed while they are streamed to storage.
+    A ``checksum`` the caller already knows is trusted and skips the hashing.
+    """
+    hashing_file = HashingFile(uploaded_file)
+    if checksum is not None or hasattr(uploaded_file, "temporary_file_path"):
+        if checksum is None:
+            for _ in hashing_file.chunks():
+                pass
+            checksum = hashing_file.hexdigest()
+        storage_path = content_addressed_name(checksum, uploaded_file.name, directory)
+        if not default_storage.exists(storage_path):
+            storage_path = default_storage.save(storage_path, uploaded_file)
+        return storage_path, checksum
+
+    incoming = default_storage.save(os.path.join(INCOMING_DIR, uuid.uuid4().hex), hashing_file)
+    checksum = hashing_file.hexdigest()
+    storage_path = content_addressed_name(checksum, uploaded_file.name, directory)
+    if default_storage.exists(storage_path):
+        default_storage.delete(incoming)
+        return storage_path, checksum
+    return _promote(incoming, storage_path), checksum
+
+
+def store_local_file(path, filename: str, checksum: str, directory: str = ORIGINALS_DIR) -> str:
+    """Move a local file whose SHA-256 is already known to its content address.
+
+    On filesystem storage the file is renamed into place rather than copied;
+    if those bytes are already stored the file is simply removed.
+    """
+    storage_path = content_addressed_name(checksum, filename, directory)
+    if default_storage.exists(storage_path):
+        os.remove(path)
+        return storage_path
+    try:
+        target_path = default_storage.path(storage_path)
+    except NotImplementedError:
+        with open(path, "rb") as staged:
+            storage_path = default_storage.save(storage_path, File(staged))
+        os.remove(path)
+        return storage_path
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    shutil.move(path, target_path)
+    return storage_path
@@ -0,0 +1,8 @@
+from django.dispatch import Signal
+
+# Sent with ``photo_ids`` after bulk writes that bypass model signals (tag
+# sync, caption results) but change what a photo shows or is found by.
+photos_changed = Signal()
+
+# Sent with ``tag_ids`` after bulk writes that add or remove uses of those tags.
+tags_changed = Signal()
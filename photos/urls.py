@@ -7,6 +7,7 @@ from photos.views import (
     PhotoTagViewSet,
     PhotoViewSet,
     TagViewSet,
+    UploadSessionViewSet,
 )
 
 app_name = "photos"
@@ -17,6 +18,7 @@ router.register(r"albums", AlbumViewSet, basename="album")
 router.register(r"tags", TagViewSet, basename="tag")
 router.register(r"album-shares", AlbumShareViewSet, basename="albumshare")
 router.register(r"photo-tags", PhotoTagViewSet, basename="phototag")
+router.register(r"upload-sessions", UploadSessionViewSet, basename="uploadsession")
 
 urlpatterns = [
     path("", include(router.urls)),
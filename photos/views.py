@@ -1,23 +1,66 @@
 from __future__ import annotations
 
-from django.db.models import Q
-from rest_framework import filters, permissions, viewsets
-from rest_framework.pagination import PageNumberPagination
+import re
 
-from photos.models import Album, AlbumShare, Photo, PhotoTag, PhotoVisibility, Tag
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.http import FileResponse, HttpResponseNotModified
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.http import parse_etags
+from rest_framework import filters, mixins, permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+from rest_framework.response import Response
+
+from config.pagination import KeysetPagination
+from photos.models import (
+    AlbumShare,
+    Photo,
+    PhotoTag,
+    PhotoVisibility,
+    Tag,
+    UploadSession,
+    tag_key,
+)
+from photos.selectors.facets import facet_counts
+from photos.selectors.geo import cluster_photos, within_box, within_radius
+from photos.selectors.visibility import visible_albums, visible_photos, with_tags
 from photos.serializers import (
     AlbumSerializer,
     AlbumShareSerializer,
+    ChecksumLookupSerializer,
+    ClusterQuerySerializer,
+    GeoFilterSerializer,
+    NearDuplicateQuerySerializer,
     PhotoSerializer,
     PhotoTagSerializer,
+    RenditionQuerySerializer,
+    StagedPhotoSerializer,
     TagSerializer,
+    UploadSessionSerializer,
+)
+from photos.services.duplicates import library_hashes
+from photos.services.renditions import (
+    RENDER_FORMATS,
+    RenditionUnavailable,
+    UnrenderableImage,
+    open_rendition,
+    rendition_etag,
+)
+from photos.services.upload_sessions import (
+    ChunkChecksumMismatch,
+    RangeNotSatisfiable,
+    SessionGone,
+    UploadIncomplete,
+    discard_session,
+    locked_session,
+    staged_upload,
+    write_range,
 )
 
-
-class StandardPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = "page_size"
-    max_page_size = 100
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
 
 
 class PhotoAccessPermission(permissions.BasePermission):
@@ -64,56 +107,178 @@ class PhotoFilterBackend(filters.BaseFilterBackend):
     def filter_queryset(self, request, queryset, view):
         owner_filter = request.query_params.get("owner")
         visibility_filter = request.query_params.get("visibility")
-        tag_filter = request.query_params.get("tag")
+        tag_filters = request.query_params.getlist("tag")
+        tag_match = request.query_params.get("tag_match", "all")
 
         if owner_filter:
             queryset = queryset.filter(owner_id=owner_filter)
         if visibility_filter:
             queryset = queryset.filter(visibility=visibility_filter)
-        if tag_filter:
-            queryset = queryset.filter(photo_tags__tag__name__iexact=tag_filter)
+        if tag_match not in {"all", "any"}:
+            raise ValidationError({"tag_match": "Use 'all' or 'any'."})
+        if tag_filters:
+            queryset = with_tags(queryset, tag_filters, match_all=tag_match == "all")
+        if "bbox" in request.query_params or "near" in request.query_params:
+            geo = GeoFilterSerializer(data=request.query_params)
+            geo.is_valid(raise_exception=True)
+            if "bbox" in geo.validated_data:
+                queryset = within_box(queryset, geo.validated_data["bbox"])
+            if "near" in geo.validated_data:
+                latitude, longitude = geo.validated_data["near"]
+                queryset = within_radius(
+                    queryset, latitude, longitude, geo.validated_data["radius_km"]
+                )
         return queryset
 
 
 class PhotoViewSet(viewsets.ModelViewSet):
     serializer_class = PhotoSerializer
     permission_classes = [PhotoAccessPermission]
-    pagination_class = StandardPagination
+    pagination_class = KeysetPagination
+    keyset_orderings = {"created": ("-created_at", "-id"), "taken": ("-taken_at", "-id")}
     filter_backends = [PhotoFilterBackend]
 
     def get_queryset(self):
-        user = self.request.user
-        visibility_filter = Q(visibility=PhotoVisibility.PUBLIC)
-        shared_filter = Q(visibility=PhotoVisibility.SHARED)
-
-        queryset = Photo.objects.select_related("owner").prefetch_related(
-            "photo_tags__tag"
+        return (
+            visible_photos(self.request.user)
+            .select_related("owner")
+            .prefetch_related(
+                Prefetch("photo_tags", queryset=PhotoTag.objects.select_related("tag"))
+            )
         )
 
-        if user and user.is_authenticated:
-            queryset = queryset.filter(Q(owner=user) | visibility_filter | shared_filter)
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get("facets", "").lower() in {"1", "true"}:
+            response.data["facets"] = facet_counts(self.filter_queryset(self.get_queryset()))
+        return response
+
+    @action(detail=True, methods=["get"])
+    def render(self, request, pk=None):
+        params = RenditionQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        width, height, fmt = (params.validated_data[key] for key in ("w", "h", "fmt"))
+        photo = self.get_object()
+        if not photo.file:
+            raise NotFound("This photo has no original to render")
+
+        etag = rendition_etag(photo.checksum, width, height, fmt)
+        cache_control = "{}, max-age=86400".format(
+            "public" if photo.visibility == PhotoVisibility.PUBLIC else "private"
+        )
+        if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+        if etag in if_none_match or "*" in if_none_match:
+            response = HttpResponseNotModified()
         else:
-            queryset = queryset.filter(visibility_filter)
+            try:
+                rendition = open_rendition(photo, width, height, fmt)
+            except UnrenderableImage:
+                raise NotFound("This photo cannot be rendered as an image")
+            except RenditionUnavailable:
+                # Evicted again straight after a re-render: the cache is thrashing.
+                return Response(
+                    {"detail": "The rendition could not be served; try again shortly."},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={"Retry-After": "1"},
+                )
+            response = FileResponse(rendition, content_type=RENDER_FORMATS[fmt][1])
+        response["ETag"] = etag
+        response["Cache-Control"] = cache_control
+        return response
 
-        return queryset.distinct()
+    @action(detail=False, methods=["get"])
+    def clusters(self, request):
+        params = ClusterQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        queryset = self.filter_queryset(visible_photos(request.user))
+        clusters = cluster_photos(queryset, params.validated_data["zoom"])
+        return Response(
+            {
+                "clusters": [
+                    {
+                        "geohash": cluster["cell"],
+                        "count": cluster["count"],
+                        "latitude": round(cluster["center_latitude"], 6),
+                        "longitude": round(cluster["center_longitude"], 6),
+                        "photo_id": cluster["photo_id"],
+                    }
+                    for cluster in clusters
+                ]
+            }
+        )
+
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path="near-duplicates",
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def near_duplicates(self, request, pk=None):
+        """Photos in the caller's own library that look like this one."""
+        params = NearDuplicateQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        photo = self.get_object()
+        if photo.dhash is None:
+            raise NotFound("This photo has no perceptual hash yet")
+        hits = library_hashes(request.user.pk).near(
+            photo.dhash, params.validated_data["max_distance"]
+        )
+        return Response(
+            {
+                "results": [
+                    {"id": photo_id, "distance": distance}
+                    for photo_id, distance in hits
+                    if photo_id != photo.pk
+                ]
+            }
+        )
+
+    @action(detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated])
+    def duplicates(self, request):
+        """Groups of near-duplicate photos across the caller's library."""
+        params = NearDuplicateQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        groups = library_hashes(request.user.pk).report(
+            params.validated_data["max_distance"], wait=settings.PHOTO_DUPLICATE_REPORT_WAIT
+        )
+        if groups is None:
+            # Large libraries take a while; the report keeps building after this response.
+            return Response(
+                {"status": "pending"},
+                status=status.HTTP_202_ACCEPTED,
+                headers={"Retry-After": str(settings.PHOTO_DUPLICATE_REPORT_RETRY_AFTER)},
+            )
+        return Response({"groups": groups})
+
+    @action(detail=False, methods=["post"], permission_classes=[permissions.IsAuthenticated])
+    def checksums(self, request):
+        serializer = ChecksumLookupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        checksums = serializer.validated_data["checksums"]
+        existing = dict(
+            Photo.objects.filter(owner=request.user, checksum__in=checksums).values_list(
+                "checksum", "id"
+            )
+        )
+        return Response(
+            {
+                "existing": existing,
+                "missing": [checksum for checksum in checksums if checksum not in existing],
+            }
+        )
 
 
 class AlbumViewSet(viewsets.ModelViewSet):
     serializer_class = AlbumSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrSharedReadOnly]
-    pagination_class = StandardPagination
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        user = self.request.user
-        queryset = Album.objects.select_related("owner", "cover_photo").filter(
-            Q(owner=user)
-            | Q(visibility=PhotoVisibility.PUBLIC)
-            | Q(shares__shared_with=user)
-        )
+        queryset = visible_albums(self.request.user).select_related("owner", "cover_photo")
         owner_filter = self.request.query_params.get("owner")
         if owner_filter:
             queryset = queryset.filter(owner_id=owner_filter)
-        return queryset.distinct()
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
@@ -122,7 +287,7 @@ class AlbumViewSet(viewsets.ModelViewSet):
 class AlbumShareViewSet(viewsets.ModelViewSet):
     serializer_class = AlbumShareSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrSharedReadOnly]
-    pagination_class = StandardPagination
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -134,15 +299,115 @@ class AlbumShareViewSet(viewsets.ModelViewSet):
 class TagViewSet(viewsets.ModelViewSet):
     serializer_class = TagSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = StandardPagination
-    queryset = Tag.objects.all()
+    pagination_class = KeysetPagination
+    keyset_orderings = {"name": ("key", "id")}
+
+    def get_queryset(self):
+        queryset = Tag.objects.all()
+        prefix = tag_key(self.request.query_params.get("q", ""))
+        if prefix:
+            # A half-open range on the key is an index seek; LIKE/istartswith
+            # would not use the index on SQLite.
+            queryset = queryset.filter(key__gte=prefix, key__lt=prefix + "\U0010ffff")
+        return queryset
 
 
 class PhotoTagViewSet(viewsets.ModelViewSet):
     serializer_class = PhotoTagSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = StandardPagination
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
         return PhotoTag.objects.select_related("photo", "tag").filter(photo__owner=user)
+
+
+class UploadSessionExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = "Upload session has expired."
+    default_code = "expired"
+
+
+class UploadSessionViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(owner=self.request.user)
+
+    def _get_live_session(self, pk) -> UploadSession:
+        session = get_object_or_404(self.get_queryset(), pk=pk)
+        if session.expires_at <= timezone.now():
+            raise UploadSessionExpired()
+        return session
+
+    def _parse_content_range(self, session: UploadSession) -> tuple[int, int]:
+        match = CONTENT_RANGE_RE.match(self.request.headers.get("Content-Range", ""))
+        if not match:
+            raise ValidationError(
+                {"detail": "A 'Content-Range: bytes start-end/total' header is required"}
+            )
+        start, end, total = match.groups()
+        start, end = int(start), int(end)
+        if end < start:
+            raise ValidationError({"detail": "Invalid byte range"})
+        if total != "*" and int(total) != session.total_size:
+            raise ValidationError({"detail": "Total size does not match the upload session"})
+        return start, end - start + 1
+
+    def _range_error(self, session: UploadSession, exc: Exception, status_code: int) -> Response:
+        return Response(
+            {"detail": str(exc), "received_size": session.received_size}, status=status_code
+        )
+
+    def update(self, request, *args, **kwargs):
+        session = self._get_live_session(kwargs["pk"])
+        start, length = self._parse_content_range(session)
+        try:
+            write_range(
+                session,
+                start,
+                length,
+                request.stream,
+                expected_sha256=request.headers.get("X-Content-SHA256"),
+            )
+        except RangeNotSatisfiable as exc:
+            return self._range_error(session, exc, status.HTTP_409_CONFLICT)
+        except ChunkChecksumMismatch as exc:
+            return self._range_error(session, exc, status.HTTP_400_BAD_REQUEST)
+        except SessionGone:
+            raise NotFound()
+        return Response(self.get_serializer(session).data)
+
+    @action(detail=True, methods=["post"])
+    def complete(self, request, pk=None):
+        session = self._get_live_session(pk)
+        try:
+            # The lock keeps writes out until the staged file has been moved; a
+            # failure inside the transaction leaves the session as it was.
+            with locked_session(session), transaction.atomic():
+                try:
+                    staged = staged_upload(session)
+                except UploadIncomplete as exc:
+                    return self._range_error(session, exc, status.HTTP_409_CONFLICT)
+                UploadSession.objects.filter(pk=session.pk).delete()
+                with staged:
+                    data = request.data.copy()
+                    data["uploaded_file"] = staged
+                    serializer = StagedPhotoSerializer(
+                        data=data,
+                        context={**self.get_serializer_context(), "upload_session": session},
+                    )
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save()
+        except SessionGone:
+            raise NotFound()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        discard_session(instance)
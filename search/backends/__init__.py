@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from search.backends.base import SearchBackend
+
+
+@lru_cache(maxsize=None)
+def get_backend() -> SearchBackend:
+    return import_string(settings.SEARCH_BACKEND)()
+
+
+@receiver(setting_changed)
+def _reset_backend(setting, **kwargs):
+    if setting == "SEARCH_BACKEND":
+        get_backend.cache_clear()
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+from search.services.documents import PhotoDocument
+
+# Text fields of a PhotoDocument and how much a match in each counts.
+FIELD_WEIGHTS = {"title": 10.0, "tags": 6.0, "description": 4.0, "captions": 4.0, "location": 2.0}
+
+Hit = tuple[int, float]
+
+
+class SearchBackend:
+    """Photo search index.
+
+    ``search`` returns ``(photo_id, score)`` hits that contain every query
+    term and are visible to ``user``, best first: higher scores first, ties
+    broken by ascending photo id. ``after`` is the last hit of the previous
+    page. Indexing a photo again replaces its previous document.
+    """
+
+    def index(self, document: PhotoDocument) -> None:
+        self.bulk_index([document])
+
+    def bulk_index(self, documents: Iterable[PhotoDocument]) -> None:
+        raise NotImplementedError
+
+    def delete(self, photo_ids: Iterable[int]) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def search(self, query: str, user=None, limit: int = 20, after: Hit | None = None) -> list[Hit]:
+        raise NotImplementedError
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import heapq
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable
+from typing import NamedTuple
+
+from photos.models import Photo, PhotoVisibility
+from photos.services.batching import iter_batches
+from search.backends.base import FIELD_WEIGHTS, Hit, SearchBackend
+from search.services.documents import PhotoDocument, build_documents
+from search.tokenizer import tokenize
+
+
+class _Entry(NamedTuple):
+    owner_id: int
+    visibility: str
+    length: float
+    terms: tuple[str, ...]
+
+
+class InMemoryBackend(SearchBackend):
+    """Inverted index held in process memory, for tests and small deployments.
+
+    The index is read from the database on first use and then follows the
+    writes made in this process only; changes committed by other processes
+    stay invisible to it until it restarts, so run a single server process.
+    Each term's posting list is a sorted ``array('q')`` of photo ids with the
+    field-weighted term frequencies in a parallel ``array('f')``, about 12
+    bytes per posting. Queries walk the shortest list and probe the others
+    with bisection; hits are ranked with BM25 over field-weighted lengths.
+    """
+
+    k1 = 1.2
+    b = 0.75
+    load_batch_size = 500
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: dict[str, tuple[array, array]] = {}
+        self._entries: dict[int, _Entry] = {}
+        self._total_length = 0.0
+        self._loaded = False
+
+    def bulk_index(self, documents: Iterable[PhotoDocument]) -> None:
+        self._load()
+        with self._lock:
+            for document in documents:
+                self._remove(document.photo_id)
+                self._add(document)
+
+    def delete(self, photo_ids: Iterable[int]) -> None:
+        self._load()
+        with self._lock:
+            for photo_id in photo_ids:
+                self._remove(photo_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings.clear()
+            self._entries.clear()
+            self._total_length = 0.0
+            self._loaded = True
+
+    def search(self, query: str, user=None, limit: int = 20, after: Hit | None = None) -> list[Hit]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        if user is not None and user.is_authenticated:
+            owner_id, listed = user.pk, {PhotoVisibility.PUBLIC, PhotoVisibility.SHARED}
+        else:
+            owner_id, listed = None, {PhotoVisibility.PUBLIC}
+        self._load()
+        with self._lock:
+            postings = [self._postings.get(term) for term in terms]
+            if not all(postings):
+                return []
+            postings.sort(key=lambda posting: len(posting[0]))
+            documents = len(self._entries)
+            average_length = self._total_length / documents or 1.0
+            idfs = [
+                math.log(1 + (documents - len(ids) + 0.5) / (len(ids) + 0.5)) for ids, _ in postings
+            ]
+            (lead_ids, lead_frequencies), others = postings[0], postings[1:]
+            cursors = [0] * len(others)
+            hits = []
+            for lead_position, photo_id in enumerate(lead_ids):
+                frequencies = [lead_frequencies[lead_position]]
+                for index, (ids, other_frequencies) in enumerate(others):
+                    # Photo ids only grow, so each probe starts where the last stopped.
+                    position = cursors[index] = bisect_left(ids, photo_id, cursors[index])
+                    if position == len(ids) or ids[position] != photo_id:
+                        break
+                    frequencies.append(other_frequencies[position])
+                else:
+                    entry = self._entries[photo_id]
+                    if entry.owner_id != owner_id and entry.visibility not in listed:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * entry.length / average_length)
+                    score = sum(
+                        idf * frequency * (self.k1 + 1) / (frequency + norm)
+                        for idf, frequency in zip(idfs, frequencies)
+                    )
+                    if after is None or (-score, photo_id) > (-after[1], after[0]):
+                        hits.append((photo_id, score))
+        return heapq.nsmallest(limit, hits, key=lambda hit: (-hit[1], hit[0]))
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for batch in iter_batches(Photo.objects.only("id"), self.load_batch_size):
+                for document in build_documents(photo.pk for photo in batch).values():
+                    self._add(document)
+            self._loaded = True
+
+    def _add(self, document: PhotoDocument) -> None:
+        frequencies: dict[str, float] = {}
+        length = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            terms = tokenize(getattr(document, field))
+            length += weight * len(terms)
+            for term in terms:
+                frequencies[term] = frequencies.get(term, 0.0) + weight
+        for term, frequency in frequencies.items():
+            ids, term_frequencies = self._postings.setdefault(term, (array("q"), array("f")))
+            position = bisect_left(ids, document.photo_id)
+            ids.insert(position, document.photo_id)
+            term_frequencies.insert(position, frequency)
+        self._entries[document.photo_id] = _Entry(
+            document.owner_id, document.visibility, length, tuple(frequencies)
+        )
+        self._total_length += length
+
+    def _remove(self, photo_id: int) -> None:
+        entry = self._entries.pop(photo_id, None)
+        if entry is None:
+            return
+        self._total_length -= entry.length
+        for term in entry.terms:
+            ids, term_frequencies = self._postings[term]
+            position = bisect_left(ids, photo_id)
+            del ids[position]
+            del term_frequencies[position]
+            if not ids:
+                del self._postings[term]
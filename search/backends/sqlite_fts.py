@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+from django.db import connection
+
+from photos.models import PhotoVisibility
+from search.backends.base import FIELD_WEIGHTS, Hit, SearchBackend
+from search.services.documents import PhotoDocument
+from search.tokenizer import index_text, tokenize
+
+TABLE = "search_photo_fts"
+# Column order is fixed by the migration that created the table.
+TEXT_COLUMNS = ("title", "description", "captions", "location", "tags")
+
+
+def match_expression(query: str) -> str:
+    """An FTS5 MATCH string requiring every query term, with syntax escaped."""
+    return " ".join('"{}"'.format(term.replace('"', '""')) for term in tokenize(query))
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """FTS5 virtual table (created by search/migrations/0001) ranked with bm25.
+
+    Text is stored pre-tokenized (see search.tokenizer), so FTS5 only splits
+    on whitespace and unicode61 keeps Hangul bigrams intact.
+    """
+
+    def delete(self, photo_ids: Iterable[int]) -> None:
+        photo_ids = list(photo_ids)
+        if not photo_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {TABLE} WHERE rowid IN ({', '.join('%s' for _ in photo_ids)})",
+                photo_ids,
+            )
+
+    def bulk_index(self, documents: Iterable[PhotoDocument]) -> None:
+        documents = list(documents)
+        self.delete(document.photo_id for document in documents)
+        if not documents:
+            return
+        rows = [
+            (
+                document.photo_id,
+                *(index_text(getattr(document, column)) for column in TEXT_COLUMNS),
+                document.owner_id,
+                document.visibility,
+            )
+            for document in documents
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (rowid, {', '.join(TEXT_COLUMNS)}, owner_id, visibility) "
+                f"VALUES ({', '.join('%s' for _ in rows[0])})",
+                rows,
+            )
+
+    def clear(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE}")
+
+    def search(self, query: str, user=None, limit: int = 20, after: Hit | None = None) -> list[Hit]:
+        expression = match_expression(query)
+        if not expression:
+            return []
+        # bm25() takes one weight per column, in declaration order; the two
+        # UNINDEXED columns come last.
+        params = [*(FIELD_WEIGHTS[column] for column in TEXT_COLUMNS), 0.0, 0.0, expression]
+        if user is not None and user.is_authenticated:
+            visibility = "(owner_id = %s OR visibility IN (%s, %s))"
+            params += [user.pk, PhotoVisibility.PUBLIC, PhotoVisibility.SHARED]
+        else:
+            visibility = "visibility = %s"
+            params.append(PhotoVisibility.PUBLIC)
+        page = ""
+        if after is not None:
+            page = "WHERE score < %s OR (score = %s AND photo_id > %s)"
+            params += [after[1], after[1], after[0]]
+        weights = ", ".join("%s" for _ in range(len(TEXT_COLUMNS) + 2))
+        # bm25() is lower-is-better; negate it to match the backend contract.
+        sql = (
+            f"SELECT photo_id, score FROM ("
+            f"  SELECT rowid AS photo_id, -bm25({TABLE}, {weights}) AS score FROM {TABLE}"
+            f"  WHERE {TABLE} MATCH %s AND {visibility}"
+            f") {page} ORDER BY score DESC, photo_id LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*params, limit])
+            return [(photo_id, score) for photo_id, score in cursor.fetchall()]
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from search.services.indexing import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the photo full-text search index from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        indexed = rebuild(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} photo(s)."))
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from photos.models import Photo
+from photos.services.batching import iter_batches
+from photos.services.pool import create_process_pool
+from photos.services.thumbnails import render_source
+from search.services.descriptors import read_descriptor
+from search.services.similarity import IndexWriter, index_shape
+
+
+class Command(BaseCommand):
+    help = (
+        "Describe photos added since the last run and append them to the visual similarity "
+        "index. Run it from a single scheduler: the index supports only one writer. Use "
+        "--rebuild to drop deleted photos and re-describe photos whose file was replaced."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.PHOTO_PROCESS_POOL_WORKERS or 1,
+            help="Number of worker processes used for decoding.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--rebuild", action="store_true", help="Describe every photo into a fresh index."
+        )
+
+    def handle(self, *args, **options):
+        added = skipped = 0
+        with IndexWriter(
+            settings.SEARCH_SIMILARITY_DIR, index_shape(), rebuild=options["rebuild"]
+        ) as writer:
+            queryset = (
+                Photo.objects.exclude(Q(file="") | Q(file__isnull=True))
+                .filter(pk__gt=writer.high_water)
+                .only("id", "file")
+            )
+            with create_process_pool(options["workers"]) as pool:
+                for batch in iter_batches(queryset, options["batch_size"]):
+                    sources = [render_source(photo) for photo in batch]
+                    for photo, vector in zip(
+                        batch, pool.map(read_descriptor, sources, chunksize=32)
+                    ):
+                        if vector is None:
+                            skipped += 1
+                        else:
+                            writer.add(photo.pk, vector)
+                            added += 1
+                    writer.flush()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {added} photo(s); {skipped} could not be decoded.")
+        )
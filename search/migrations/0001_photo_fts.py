@@ -0,0 +1,32 @@
+from django.db import migrations
+
+# Text is stored pre-tokenized by search.tokenizer, so FTS5 only has to split
+# on whitespace; unicode61 keeps Hangul bigrams intact.
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_photo_fts USING fts5("
+    "title, description, captions, location, tags, owner_id UNINDEXED, visibility UNINDEXED, "
+    "tokenize = 'unicode61 remove_diacritics 0')"
+)
+DROP_SQL = "DROP TABLE IF EXISTS search_photo_fts"
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("photos", "0008_tag_key"),
+        ("ai", "0006_hot_path_indexes"),
+    ]
+
+    operations = [migrations.RunPython(create_index, drop_index)]
@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections.abc import Iterable
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+
+from photos.models import Photo, PhotoTag, PhotoVisibility, Tag, tag_key
+
+Suggestion = tuple[str, int]
+
+
+class PrefixIndex:
+    """Usage-ranked suggestions for every key starting with a prefix.
+
+    Keys are kept in a sorted list, so a prefix is a bisect range. Prefixes
+    whose range holds more than ``dense_prefix_keys`` keys (short prefixes,
+    but also skewed ones like "img_" or "screenshot") keep their top keys
+    cached and updated as counts change; any other range is cheap to scan.
+    """
+
+    dense_prefix_keys = 1000
+    cached_results = 40
+    # ``top()`` serves at most this many from a cached prefix; the extra
+    # cached keys absorb removals before the range has to be scanned again.
+    served_results = 20
+
+    def __init__(self, entries: Iterable[tuple[str, str, int]] = ()):
+        self._lock = threading.RLock()
+        self._entries = {key: (label, count) for key, label, count in entries}
+        self._keys = sorted(self._entries)
+        self._top_keys: dict[str, list[str]] = {}
+        self._cache_dense("", 0, len(self._keys))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def get(self, key: str) -> Suggestion | None:
+        return self._entries.get(key)
+
+    def put(self, key: str, label: str, count: int) -> None:
+        """Set ``key``'s label and usage; a count of zero removes it."""
+        with self._lock:
+            previous = self._entries.get(key)
+            if count <= 0:
+                if previous is None:
+                    return
+                del self._entries[key]
+                del self._keys[bisect_left(self._keys, key)]
+            else:
+                if previous is None:
+                    insort(self._keys, key)
+                self._entries[key] = (label, count)
+            for length in range(1, len(key) + 1):
+                prefix = key[:length]
+                if prefix in self._top_keys:
+                    self._update_top(prefix, key)
+                elif self._range_size(prefix) > self.dense_prefix_keys:
+                    self._top_keys[prefix] = self._scan(prefix, self.cached_results)
+
+    def top(self, prefix: str, limit: int = 10) -> list[Suggestion]:
+        prefix = tag_key(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            keys = self._top_keys.get(prefix)
+            if keys is None or limit > self.served_results:
+                keys = self._scan(prefix, limit)
+            return [self._entries[key] for key in keys[:limit]]
+
+    def _rank(self, key: str) -> tuple[int, str]:
+        return -self._entries[key][1], key
+
+    def _range(self, prefix: str) -> tuple[int, int]:
+        start = bisect_left(self._keys, prefix)
+        return start, bisect_left(self._keys, prefix + "\U0010ffff", start)
+
+    def _range_size(self, prefix: str) -> int:
+        start, stop = self._range(prefix)
+        return stop - start
+
+    def _scan(self, prefix: str, limit: int) -> list[str]:
+        start, stop = self._range(prefix)
+        return heapq.nsmallest(limit, self._keys[start:stop], key=self._rank)
+
+    def _cache_dense(self, prefix: str, start: int, stop: int) -> list[str]:
+        """Cache every dense prefix below ``prefix`` and return ``prefix``'s own top keys.
+
+        Works bottom-up over child ranges, so each key is ranked once, at its
+        deepest dense prefix; a dense parent only merges its children's tops.
+        """
+        candidates = []
+        position = start
+        while position < stop:
+            key = self._keys[position]
+            if len(key) == len(prefix):
+                candidates.append(key)
+                position += 1
+                continue
+            child = key[: len(prefix) + 1]
+            end = bisect_left(self._keys, child + "\U0010ffff", position, stop)
+            if end - position > self.dense_prefix_keys:
+                self._top_keys[child] = self._cache_dense(child, position, end)
+                candidates += self._top_keys[child]
+            elif prefix:
+                candidates += self._keys[position:end]
+            position = end
+        return heapq.nsmallest(self.cached_results, candidates, key=self._rank)
+
+    def _update_top(self, prefix: str, key: str) -> None:
+        # The cached list is always the true top of the range, just possibly
+        # shorter than ``cached_results``.
+        top_keys = self._top_keys[prefix]
+        if key in top_keys:
+            top_keys.remove(key)
+        size = self._range_size(prefix)
+        if key in self._entries:
+            position = bisect_left(top_keys, self._rank(key), key=self._rank)
+            # Below the last cached key it only belongs if nothing else is missing.
+            if position < len(top_keys) or size <= len(top_keys) + 1:
+                top_keys.insert(position, key)
+                del top_keys[self.cached_results :]
+        if not size:
+            del self._top_keys[prefix]
+        elif len(top_keys) < min(self.served_results, size):
+            self._top_keys[prefix] = self._scan(prefix, self.cached_results)
+
+
+class TagSuggestions:
+    """Tag names ranked by how many photos carry them; unused tags are left out."""
+
+    def __init__(self):
+        self.index = PrefixIndex()
+        self._key_by_id: dict[int, str] = {}
+
+    def load(self) -> None:
+        tags = list(self._usage(Tag.objects.all()))
+        self._key_by_id = {tag_id: key for tag_id, key, _, _ in tags}
+        self.index = PrefixIndex((key, name, uses) for _, key, name, uses in tags if uses)
+
+    def refresh(self, tag_ids: Iterable[int]) -> None:
+        tag_ids = set(tag_ids)
+        current = {tag_id: row for tag_id, *row in self._usage(Tag.objects.filter(pk__in=tag_ids))}
+        for tag_id in tag_ids:
+            old_key = self._key_by_id.pop(tag_id, None)
+            if old_key is not None:
+                self.index.put(old_key, "", 0)
+            if tag_id in current:
+                key, name, uses = current[tag_id]
+                self._key_by_id[tag_id] = key
+                self.index.put(key, name, uses)
+
+    @staticmethod
+    def _usage(tags):
+        return (
+            tags.order_by()
+            .annotate(uses=Count("tagged_photos"))
+            .values_list("id", "key", "name", "uses")
+            .iterator()
+        )
+
+
+class TitleSuggestions:
+    """Titles of public photos, ranked by how many photos share them.
+
+    Only public photos are indexed, so a suggestion never reveals the title
+    of a photo the viewer could not open.
+    """
+
+    def __init__(self):
+        self.index = PrefixIndex()
+        self._key_by_photo: dict[int, str] = {}
+
+    def load(self) -> None:
+        self._key_by_photo = {}
+        entries: dict[str, list] = {}
+        for photo_id, title in self._titles(Photo.objects.all()):
+            key = self._key_by_photo[photo_id] = tag_key(title)
+            entries.setdefault(key, [title, 0])[1] += 1
+        self.index = PrefixIndex((key, title, uses) for key, (title, uses) in entries.items())
+
+    def refresh(self, photo_ids: Iterable[int]) -> None:
+        photo_ids = set(photo_ids)
+        for photo_id in photo_ids:
+            old_key = self._key_by_photo.pop(photo_id, None)
+            if old_key is not None:
+                label, uses = self.index.get(old_key)
+                self.index.put(old_key, label, uses - 1)
+        for photo_id, title in self._titles(Photo.objects.filter(pk__in=photo_ids)):
+            key = self._key_by_photo[photo_id] = tag_key(title)
+            label, uses = self.index.get(key) or (title, 0)
+            self.index.put(key, label, uses + 1)
+
+    @staticmethod
+    def _titles(photos):
+        return (
+            photos.filter(visibility=PhotoVisibility.PUBLIC)
+            .exclude(title="")
+            .order_by()
+            .values_list("id", "title")
+            .iterator()
+        )
+
+
+_lock = threading.Lock()
+_suggestions: tuple[TagSuggestions, TitleSuggestions] | None = None
+_loaded_version: dict[str, tuple[int, int]] = {}
+_checked_at = 0.0
+_pending = threading.local()
+
+# Tag links and photos are append-mostly, so their row count and highest id
+# tell inserts (caught up with) from deletes (which force a reload).
+_WATCHED = {"links": PhotoTag, "photos": Photo}
+# Beyond this many new rows a reload is cheaper than applying them one by one.
+MAX_CATCH_UP_ROWS = 5000
+
+
+def data_version() -> dict[str, tuple[int, int]]:
+    return {
+        name: tuple(
+            model.objects.order_by().aggregate(rows=Count("pk"), last=Max("pk", default=0)).values()
+        )
+        for name, model in _WATCHED.items()
+    }
+
+
+def get_suggestions() -> tuple[TagSuggestions, TitleSuggestions]:
+    """The process-wide tag and title indexes, loaded on first use.
+
+    Writes made in this process are applied as they commit. Other processes
+    (more web workers, the caption worker) are noticed by comparing
+    ``data_version`` at most every ``SEARCH_AUTOCOMPLETE_RECHECK_SECONDS``:
+    rows they inserted are applied, and deletes reload the indexes. Tag
+    renames and title or visibility edits made elsewhere change neither
+    count, so those wait for the next reload or a restart.
+    """
+    global _suggestions, _loaded_version, _checked_at
+    with _lock:
+        now = time.monotonic()
+        recheck = now - _checked_at >= settings.SEARCH_AUTOCOMPLETE_RECHECK_SECONDS
+        if _suggestions is not None and not recheck:
+            return _suggestions
+        _checked_at = now
+        version = data_version()
+        if _suggestions is None or not _catch_up(*_suggestions, _loaded_version, version):
+            tags, titles = TagSuggestions(), TitleSuggestions()
+            tags.load()
+            titles.load()
+            _suggestions = tags, titles
+        _loaded_version = version
+        return _suggestions
+
+
+def _catch_up(
+    tags: TagSuggestions,
+    titles: TitleSuggestions,
+    loaded: dict[str, tuple[int, int]],
+    current: dict[str, tuple[int, int]],
+) -> bool:
+    """Apply rows inserted since ``loaded``; ``False`` if rows were deleted instead."""
+    if current == loaded:
+        return True
+    if any(current[name][0] - loaded[name][0] > MAX_CATCH_UP_ROWS for name in _WATCHED):
+        return False
+    links = list(
+        PhotoTag.objects.filter(pk__gt=loaded["links"][1], pk__lte=current["links"][1])
+        .order_by()
+        .values_list("tag_id", flat=True)
+    )
+    photo_ids = list(
+        Photo.objects.filter(pk__gt=loaded["photos"][1], pk__lte=current["photos"][1])
+        .order_by()
+        .values_list("pk", flat=True)
+    )
+    if (
+        loaded["links"][0] + len(links) != current["links"][0]
+        or loaded["photos"][0] + len(photo_ids) != current["photos"][0]
+    ):
+        return False
+    tags.refresh(set(links))
+    titles.refresh(photo_ids)
+    return True
+
+
+def reset() -> None:
+    global _suggestions, _loaded_version
+    with _lock:
+        _suggestions, _loaded_version = None, {}
+
+
+def schedule_refresh(tag_ids: Iterable[int] = (), photo_ids: Iterable[int] = ()) -> None:
+    """Refresh the given tags and photo titles once the current transaction commits."""
+    if _suggestions is None:
+        return
+    pending = getattr(_pending, "ids", None)
+    if pending is None:
+        pending = _pending.ids = (set(), set())
+    pending[0].update(tag_ids)
+    pending[1].update(photo_ids)
+    transaction.on_commit(_flush)
+
+
+def _flush() -> None:
+    tag_ids, photo_ids = getattr(_pending, "ids", None) or (set(), set())
+    _pending.ids = None
+    if _suggestions is None:
+        return
+    tags, titles = _suggestions
+    with _lock:
+        if tag_ids:
+            tags.refresh(tag_ids)
+        if photo_ids:
+            titles.refresh(photo_ids)
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import math
+
+from PIL import ImageFilter
+
+from photos.services.imaging import downscale, open_for_box
+
+SAMPLE_EDGE = 64
+HUE_BINS, SATURATION_BINS, VALUE_BINS = 8, 2, 2
+ORIENTATION_BINS = 16
+LAYOUT_GRID = 4
+DIMENSIONS = HUE_BINS * SATURATION_BINS * VALUE_BINS + ORIENTATION_BINS + LAYOUT_GRID**2
+
+SOBEL_X = ImageFilter.Kernel((3, 3), [-1, 0, 1, -2, 0, 2, -1, 0, 1], scale=8, offset=128)
+SOBEL_Y = ImageFilter.Kernel((3, 3), [-1, -2, -1, 0, 0, 0, 1, 2, 1], scale=8, offset=128)
+
+
+def describe(source) -> list[float]:
+    """A unit-length colour/texture/layout descriptor of ``DIMENSIONS`` floats.
+
+    A CPU-only stand-in for a learned image embedding: an HSV colour
+    histogram, a gradient orientation histogram and a coarse luminance grid,
+    each normalised on its own so no block dominates the cosine similarity.
+    Runs in worker processes, so it only touches Pillow.
+    """
+    image = downscale(open_for_box(source, (SAMPLE_EDGE, SAMPLE_EDGE)), (SAMPLE_EDGE, SAMPLE_EDGE))
+    image = image.convert("RGB")
+
+    colour = [0.0] * (HUE_BINS * SATURATION_BINS * VALUE_BINS)
+    for hue, saturation, value in image.convert("HSV").getdata():
+        index = (hue * HUE_BINS >> 8) * SATURATION_BINS + (saturation * SATURATION_BINS >> 8)
+        colour[index * VALUE_BINS + (value * VALUE_BINS >> 8)] += 1
+
+    gray = image.convert("L")
+    orientation = [0.0] * ORIENTATION_BINS
+    for dx, dy in zip(gray.filter(SOBEL_X).getdata(), gray.filter(SOBEL_Y).getdata()):
+        dx, dy = dx - 128, dy - 128
+        if dx or dy:
+            angle = math.atan2(dy, dx) % (2 * math.pi)
+            orientation[
+                int(angle / (2 * math.pi) * ORIENTATION_BINS) % ORIENTATION_BINS
+            ] += math.hypot(dx, dy)
+
+    layout = list(gray.resize((LAYOUT_GRID, LAYOUT_GRID), reducing_gap=None).getdata())
+    mean = sum(layout) / len(layout)
+    layout = [cell - mean for cell in layout]
+
+    # Square roots temper dominant bins (Hellinger-style) before normalising.
+    blocks = [[math.sqrt(count) for count in colour], [math.sqrt(m) for m in orientation], layout]
+    return _normalise([value for block in blocks for value in _normalise(block)])
+
+
+def _normalise(vector: list[float]) -> list[float]:
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else vector
+
+
+def read_descriptor(source) -> list[float] | None:
+    """``describe``, or ``None`` when ``source`` cannot be read as an image."""
+    try:
+        return describe(source)
+    except OSError:
+        return None
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from typing import NamedTuple
+
+from ai.models import AICaptionJob, CaptionJobStatus
+from photos.models import Photo, PhotoTag
+
+
+class PhotoDocument(NamedTuple):
+    photo_id: int
+    owner_id: int
+    visibility: str
+    title: str
+    description: str
+    captions: str
+    location: str
+    tags: str
+
+
+def build_documents(photo_ids: Iterable[int]) -> dict[int, PhotoDocument]:
+    """Searchable text for each existing photo in ``photo_ids``, in three queries."""
+    photo_ids = set(photo_ids)
+    tags: dict[int, list[str]] = {}
+    for photo_id, name in (
+        PhotoTag.objects.filter(photo_id__in=photo_ids)
+        .order_by()
+        .values_list("photo_id", "tag__name")
+        .distinct()
+    ):
+        tags.setdefault(photo_id, []).append(name)
+    captions: dict[int, list[str]] = {}
+    for photo_id, caption in (
+        AICaptionJob.objects.filter(photo_id__in=photo_ids, status=CaptionJobStatus.SUCCESS)
+        .exclude(caption_ko="")
+        .order_by()
+        .values_list("photo_id", "caption_ko")
+        .distinct()
+    ):
+        captions.setdefault(photo_id, []).append(caption)
+    photos = Photo.objects.filter(pk__in=photo_ids).values_list(
+        "id", "owner_id", "visibility", "title", "description", "location"
+    )
+    return {
+        photo_id: PhotoDocument(
+            photo_id,
+            owner_id,
+            visibility,
+            title,
+            description,
+            "\n".join(captions.get(photo_id, [])),
+            location,
+            "\n".join(tags.get(photo_id, [])),
+        )
+        for photo_id, owner_id, visibility, title, description, location in photos
+    }
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import threading
+from collections.abc import Iterable
+
+from django.db import transaction
+
+from photos.models import Photo
+from photos.services.batching import iter_batches
+from search.backends import get_backend
+from search.services.documents import build_documents
+
+_pending = threading.local()
+
+
+def reindex_photos(photo_ids: Iterable[int]) -> int:
+    """Rewrite the index rows of ``photo_ids``; photos that no longer exist are dropped."""
+    photo_ids = set(photo_ids)
+    documents = build_documents(photo_ids)
+    backend = get_backend()
+    with transaction.atomic():
+        backend.delete(photo_ids - documents.keys())
+        backend.bulk_index(documents.values())
+    return len(documents)
+
+
+def schedule_reindex(photo_ids: Iterable[int]) -> None:
+    """Reindex ``photo_ids`` once the current transaction commits.
+
+    Changes made in one transaction are coalesced into a single reindex.
+    """
+    pending = getattr(_pending, "ids", None)
+    if pending is None:
+        pending = _pending.ids = set()
+    pending.update(photo_ids)
+    transaction.on_commit(_flush)
+
+
+def _flush() -> None:
+    photo_ids, _pending.ids = getattr(_pending, "ids", set()), set()
+    if photo_ids:
+        reindex_photos(photo_ids)
+
+
+def rebuild(batch_size: int = 500) -> int:
+    get_backend().clear()
+    indexed = 0
+    for batch in iter_batches(Photo.objects.only("id"), batch_size):
+        indexed += reindex_photos(photo.pk for photo in batch)
+    return indexed
@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import heapq
+import json
+import mmap
+import os
+import random
+import struct
+import threading
+from array import array
+from collections import defaultdict
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from pathlib import Path
+from typing import NamedTuple
+
+from django.conf import settings
+
+from search.services.descriptors import DIMENSIONS
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - optional, only speeds up reranking
+    numpy = None
+
+META_FILE = "meta.json"
+IDS_FILE = "ids.i64"
+VECTORS_FILE = "vectors.f16"
+SIGNATURES_FILE = "signatures.u32"
+ID_SIZE = array("q").itemsize
+
+
+class IndexShape(NamedTuple):
+    dims: int
+    tables: int
+    bits: int
+    seed: int = 0
+
+
+def index_shape() -> IndexShape:
+    return IndexShape(
+        DIMENSIONS, settings.SEARCH_SIMILARITY_TABLES, settings.SEARCH_SIMILARITY_BITS
+    )
+
+
+def hyperplanes(shape: IndexShape) -> list[list[list[float]]]:
+    """``shape.bits`` random hyperplanes per table, the same for every process."""
+    rng = random.Random(shape.seed)
+    return [
+        [[rng.gauss(0.0, 1.0) for _ in range(shape.dims)] for _ in range(shape.bits)]
+        for _ in range(shape.tables)
+    ]
+
+
+def signatures(planes: list[list[list[float]]], vector: Sequence[float]) -> list[int]:
+    """One bucket key per table: a bit per hyperplane, set on its positive side."""
+    keys = []
+    for table in planes:
+        key = 0
+        for plane in table:
+            key = key << 1 | (sum(p * v for p, v in zip(plane, vector)) >= 0)
+        keys.append(key)
+    return keys
+
+
+class _SharedMap:
+    """A vector mapping that stays open until it is retired and its last query is done."""
+
+    def __init__(self, mapping: mmap.mmap | bytes = b""):
+        self.mapping = mapping
+        self.closed = False
+        self._users = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.closed:
+                return False
+            self._users += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._users -= 1
+            self._close_if_unused()
+
+    def retire(self) -> None:
+        with self._lock:
+            self._retired = True
+            self._close_if_unused()
+
+    def _close_if_unused(self) -> None:
+        if self._retired and not self._users and not self.closed:
+            self.closed = True
+            if isinstance(self.mapping, mmap.mmap):
+                self.mapping.close()
+
+
+class SimilarityIndex:
+    """Read side of the on-disk index: a float16 vector matrix plus LSH buckets.
+
+    Rows live in parallel files; ``ids.i64`` is written last, so its length
+    decides how many rows are complete. The vector matrix is memory-mapped
+    and only the candidate rows a query probes are ever read. Rows the
+    writer appends later are read by ``extend`` without reloading the rest.
+
+    Rows are never removed: deleted photos stay until ``--rebuild`` and are
+    dropped by the visibility query in the view, and a photo whose file is
+    replaced keeps its old vector until the index is rebuilt.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.shape = IndexShape(**json.loads((self.directory / META_FILE).read_text()))
+        self._vector = struct.Struct(f"<{self.shape.dims}e")
+        self._signature = struct.Struct(f"<{self.shape.tables}I")
+        self._planes = hyperplanes(self.shape)
+        self._buckets = [defaultdict(list) for _ in range(self.shape.tables)]
+        self._map = _SharedMap()
+        self._rows: dict[int, int] = {}
+        self.ids = array("q")
+        self.inode = os.stat(self.directory / IDS_FILE).st_ino
+        self.extend()
+
+    @property
+    def loaded_size(self) -> int:
+        """Bytes of ``ids.i64`` read so far."""
+        return len(self.ids) * ID_SIZE
+
+    def extend(self) -> None:
+        """Read the rows appended since the last load.
+
+        New rows are published in the order queries read them: vectors, then
+        buckets, then ids, so a concurrent query never sees a row it cannot
+        score. Callers serialise ``extend`` with each other.
+        """
+        start = len(self.ids)
+        with open(self.directory / IDS_FILE, "rb") as ids_file:
+            if os.fstat(ids_file.fileno()).st_ino != self.inode:
+                return  # Rebuilt since; ``get_index`` loads the new files.
+            ids_file.seek(start * ID_SIZE)
+            raw_ids = ids_file.read()
+        with open(self.directory / SIGNATURES_FILE, "rb") as signatures_file:
+            signatures_file.seek(start * self._signature.size)
+            raw_signatures = signatures_file.read()
+        with open(self.directory / VECTORS_FILE, "rb") as vectors_file:
+            size = os.fstat(vectors_file.fileno()).st_size
+            rows = min(
+                len(raw_ids) // ID_SIZE,
+                len(raw_signatures) // self._signature.size,
+                size // self._vector.size - start,
+            )
+            if rows <= 0:
+                return
+            previous = self._map
+            self._map = _SharedMap(mmap.mmap(vectors_file.fileno(), 0, access=mmap.ACCESS_READ))
+            # Queries still reading the old mapping keep it open until they finish.
+            previous.retire()
+        for row, keys in enumerate(
+            self._signature.iter_unpack(raw_signatures[: rows * self._signature.size]), start
+        ):
+            for buckets, key in zip(self._buckets, keys):
+                buckets[key].append(row)
+        new_ids = array("q")
+        new_ids.frombytes(raw_ids[: rows * ID_SIZE])
+        self._rows.update((photo_id, row) for row, photo_id in enumerate(new_ids, start))
+        self.ids.extend(new_ids)
+
+    def close(self) -> None:
+        """Unmap the vectors once the queries still using them are done."""
+        self._map.retire()
+
+    @contextmanager
+    def _vectors(self) -> Iterator[mmap.mmap | bytes]:
+        # A mapping retired between reading ``_map`` and acquiring it may have
+        # been closed already; its replacement holds every row it did.
+        shared = self._map
+        while not shared.acquire():
+            if shared is self._map:
+                raise ValueError("The similarity index has been closed")
+            shared = self._map
+        try:
+            yield shared.mapping
+        finally:
+            shared.release()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, photo_id: int) -> bool:
+        return photo_id in self._rows
+
+    def vector(self, photo_id: int) -> tuple[float, ...]:
+        with self._vectors() as vectors:
+            return self._vector.unpack_from(vectors, self._rows[photo_id] * self._vector.size)
+
+    def neighbours(self, photo_id: int, limit: int) -> list[tuple[int, float]]:
+        """Up to ``limit`` ``(photo_id, cosine)`` pairs most like ``photo_id``, best first.
+
+        Candidates come from the query's bucket in every table, widened to
+        buckets one bit away while there are too few; only those rows are
+        reranked by exact cosine similarity. An index no larger than the
+        candidate budget is simply scanned.
+        """
+        # Rows appended while this query runs are left for the next one.
+        count = len(self.ids)
+        source = self._rows[photo_id]
+        query = self.vector(photo_id)
+        keys = signatures(self._planes, query)
+        wanted = settings.SEARCH_SIMILARITY_MAX_CANDIDATES
+        if count <= wanted:
+            # Small enough to rerank every row exactly.
+            candidates = set(range(count))
+        else:
+            candidates = {row for row in self._probe(keys, limit, wanted) if row < count}
+        candidates.discard(source)
+        rows = sorted(candidates)
+        with self._vectors() as vectors:
+            scores = self._scores(rows, query, count, vectors)
+        best = heapq.nsmallest(
+            limit, zip(scores, rows), key=lambda hit: (-hit[0], self.ids[hit[1]])
+        )
+        return [(self.ids[row], score) for score, row in best]
+
+    def _probe(self, keys: list[int], limit: int, wanted: int) -> set[int]:
+        candidates: set[int] = set()
+        probes = [keys]
+        for bit in range(self.shape.bits):
+            probes.append([key ^ 1 << bit for key in keys])
+        for round_keys in probes:
+            for buckets, key in zip(self._buckets, round_keys):
+                candidates.update(buckets.get(key, ()))
+                if len(candidates) >= wanted:
+                    return candidates
+            # One bit flips are only probed while there are too few candidates.
+            if len(candidates) >= 4 * limit:
+                return candidates
+        return candidates
+
+    def _scores(
+        self, rows: list[int], query: Sequence[float], count: int, vectors: mmap.mmap | bytes
+    ) -> list[float]:
+        if numpy is not None and rows:
+            matrix = numpy.frombuffer(vectors, dtype="<f2", count=count * self.shape.dims)
+            matrix = matrix.reshape(count, self.shape.dims)
+            return (
+                matrix[rows].astype(numpy.float32) @ numpy.asarray(query, numpy.float32)
+            ).tolist()
+        size, unpack = self._vector.size, self._vector.unpack_from
+        return [sum(q * v for q, v in zip(query, unpack(vectors, row * size))) for row in rows]
+
+
+class IndexWriter:
+    """Appends photo vectors to the index; there must only ever be one writer.
+
+    Appends go straight into the live files (rows beyond ``ids.i64`` left by
+    an interrupted run are truncated first). A rebuild, or a change of index
+    shape, writes fresh files alongside and swaps them in on exit with
+    ``ids.i64`` last, so readers never load a half-built index.
+    """
+
+    def __init__(self, directory: Path, shape: IndexShape, rebuild: bool = False):
+        self.directory = Path(directory)
+        self.shape = shape
+        self._vector = struct.Struct(f"<{shape.dims}e")
+        self._signature = struct.Struct(f"<{shape.tables}I")
+        self._planes = hyperplanes(shape)
+        self._pending_ids = array("q")
+        self.high_water = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        meta_path = self.directory / META_FILE
+        current = meta_path.exists() and json.loads(meta_path.read_text()) == shape._asdict()
+        self._suffix = "" if current and not rebuild else ".new"
+        if self._suffix:
+            self._path(META_FILE).write_text(json.dumps(shape._asdict()))
+            for name in (IDS_FILE, VECTORS_FILE, SIGNATURES_FILE):
+                self._path(name).write_bytes(b"")
+        raw_ids = self._path(IDS_FILE).read_bytes()
+        ids = array("q")
+        ids.frombytes(raw_ids[: len(raw_ids) - len(raw_ids) % ID_SIZE])
+        if ids:
+            self.high_water = max(ids)
+        self._files = {
+            name: open(self._path(name), "r+b")
+            for name in (IDS_FILE, VECTORS_FILE, SIGNATURES_FILE)
+        }
+        for name, row_size in (
+            (IDS_FILE, ID_SIZE),
+            (VECTORS_FILE, self._vector.size),
+            (SIGNATURES_FILE, self._signature.size),
+        ):
+            self._files[name].truncate(len(ids) * row_size)
+            self._files[name].seek(0, os.SEEK_END)
+
+    def __enter__(self) -> IndexWriter:
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.flush()
+        for handle in self._files.values():
+            handle.close()
+        if not self._suffix:
+            return
+        names = (META_FILE, VECTORS_FILE, SIGNATURES_FILE, IDS_FILE)
+        for name in names:
+            if exc_type is None:
+                os.replace(self._path(name), self.directory / name)
+            else:
+                self._path(name).unlink(missing_ok=True)
+
+    def add(self, photo_id: int, vector: Sequence[float]) -> None:
+        self._files[VECTORS_FILE].write(self._vector.pack(*vector))
+        self._files[SIGNATURES_FILE].write(self._signature.pack(*signatures(self._planes, vector)))
+        self._pending_ids.append(photo_id)
+        self.high_water = max(self.high_water, photo_id)
+
+    def flush(self) -> None:
+        """Make the rows added so far visible to readers."""
+        for name in (VECTORS_FILE, SIGNATURES_FILE):
+            self._files[name].flush()
+            os.fsync(self._files[name].fileno())
+        self._files[IDS_FILE].write(self._pending_ids.tobytes())
+        self._files[IDS_FILE].flush()
+        self._pending_ids = array("q")
+
+    def _path(self, name: str) -> Path:
+        return self.directory / f"{name}{self._suffix}"
+
+
+_index: SimilarityIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> SimilarityIndex | None:
+    """The process-wide index, kept up to date with the writer.
+
+    Appended rows are read incrementally; a rebuild, which swaps in a new
+    ``ids.i64``, is loaded afresh. ``None`` until ``update_similarity_index``
+    has built one.
+    """
+    global _index
+    directory = Path(settings.SEARCH_SIMILARITY_DIR)
+    try:
+        stat = os.stat(directory / IDS_FILE)
+    except FileNotFoundError:
+        return None
+    with _index_lock:
+        index = _index
+        if (
+            index is None
+            or index.directory != directory
+            or index.inode != stat.st_ino
+            or index.loaded_size > stat.st_size
+        ):
+            if index is not None:
+                index.close()
+            index = _index = SimilarityIndex(directory)
+        elif index.loaded_size + ID_SIZE <= stat.st_size:
+            index.extend()
+        return index
+
+
+def reset() -> None:
+    global _index
+    with _index_lock:
+        if _index is not None:
+            _index.close()
+        _index = None
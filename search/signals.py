@@ -0,0 +1,43 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from photos.models import Photo, PhotoTag, Tag
+from photos.signals import photos_changed, tags_changed
+from search.services.autocomplete import schedule_refresh
+from search.services.indexing import schedule_reindex
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Photo)
+def photo_changed(sender, instance, **kwargs):
+    schedule_reindex([instance.pk])
+    schedule_refresh(photo_ids=[instance.pk])
+
+
+@receiver(post_save, sender=PhotoTag)
+@receiver(post_delete, sender=PhotoTag)
+def photo_tag_changed(sender, instance, **kwargs):
+    schedule_reindex([instance.photo_id])
+    schedule_refresh(tag_ids=[instance.tag_id])
+
+
+@receiver(post_save, sender=Tag)
+def tag_renamed(sender, instance, created, **kwargs):
+    schedule_refresh(tag_ids=[instance.pk])
+    if not created:
+        schedule_reindex(instance.tagged_photos.values_list("photo_id", flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    schedule_refresh(tag_ids=[instance.pk])
+
+
+@receiver(photos_changed)
+def photos_bulk_changed(sender, photo_ids, **kwargs):
+    schedule_reindex(photo_ids)
+
+
+@receiver(tags_changed)
+def tags_bulk_changed(sender, tag_ids, **kwargs):
+    schedule_refresh(tag_ids=tag_ids)
@@ -1,3 +1,685 @@
-from django.test import TestCase
+import io
+import math
+import os
+import random
+import tempfile
+from bisect import bisect_left
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from ai.models import AICaptionJob, CaptionJobStatus
+from ai.services import results
+from photos.models import Photo, PhotoTag, PhotoVisibility, Tag
+from photos.services.tags import sync_photo_tags
+from photos.tests import TemporaryMediaMixin, make_scene
+from search.backends import get_backend
+from search.backends.memory import InMemoryBackend
+from search.backends.sqlite_fts import SQLiteFTSBackend, match_expression
+from search.services import autocomplete, similarity
+from search.services.autocomplete import PrefixIndex
+from search.services.descriptors import describe
+from search.services.documents import PhotoDocument
+from search.tokenizer import tokenize
+from users.models import User
+
+
+class TokenizerTests(SimpleTestCase):
+    def test_hangul_becomes_bigrams_and_other_words_stay_whole(self):
+        self.assertEqual(
+            tokenize("바닷가의 노을, Sunset at the BEACH 해 2024년"),
+            ["바닷", "닷가", "가의", "노을", "sunset", "at", "the", "beach", "해", "2024", "년"],
+        )
+
+    def test_match_expression_escapes_fts_syntax(self):
+        self.assertEqual(match_expression('a" OR b*'), '"a" "or" "b"')
+        self.assertEqual(match_expression("  "), "")
+
+
+class SearchAPITests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="testpass", name="Owner"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", password="testpass", name="Other"
+        )
+        self.url = reverse("search:search")
+
+    def create_photo(self, owner=None, **fields):
+        fields.setdefault("visibility", PhotoVisibility.PUBLIC)
+        with self.captureOnCommitCallbacks(execute=True):
+            return Photo.objects.create(
+                owner=owner or self.owner,
+                file=f"p{Photo.objects.count()}.jpg",
+                checksum=f"c{Photo.objects.count()}",
+                **fields,
+            )
+
+    def search(self, q, **params):
+        response = self.client.get(self.url, {"q": q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def ids(self, q, **params):
+        return [hit["id"] for hit in self.search(q, **params).data["results"]]
+
+    def test_korean_words_match_inside_inflected_text(self):
+        photo = self.create_photo(description="제주 바닷가에서 본 노을")
+        self.create_photo(description="서울 야경")
+
+        self.assertEqual(self.ids("바닷가"), [photo.id])
+        self.assertEqual(self.ids("제주 노을"), [photo.id])
+        self.assertEqual(self.ids("부산"), [])
+
+    def test_title_matches_rank_above_location_matches(self):
+        by_location = self.create_photo(location="Jeju Island")
+        by_title = self.create_photo(title="Jeju sunrise")
+
+        self.assertEqual(self.ids("jeju"), [by_title.id, by_location.id])
+
+    def test_hits_are_visibility_filtered(self):
+        private = self.create_photo(title="night market", visibility=PhotoVisibility.PRIVATE)
+        shared = self.create_photo(
+            owner=self.other, title="night market", visibility=PhotoVisibility.SHARED
+        )
+        foreign_private = self.create_photo(
+            owner=self.other, title="night market", visibility=PhotoVisibility.PRIVATE
+        )
+
+        self.assertEqual(self.ids("market"), [])
+        self.client.force_authenticate(self.owner)
+        self.assertCountEqual(self.ids("market"), [private.id, shared.id])
+        self.assertNotIn(foreign_private.id, self.ids("market"))
+
+    def test_stale_index_entries_are_rechecked_against_the_database(self):
+        photo = self.create_photo(title="seoul tower")
+        Photo.objects.filter(pk=photo.pk).update(visibility=PhotoVisibility.PRIVATE)
+
+        self.assertEqual(self.ids("seoul"), [])
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.ids("seoul"), [photo.id])
+
+    def test_tags_and_applied_captions_are_indexed_after_bulk_writes(self):
+        photo = self.create_photo()
+        with self.captureOnCommitCallbacks(execute=True):
+            sync_photo_tags({photo.pk: ["한라산"]})
+        self.assertEqual(self.ids("한라산"), [photo.id])
+
+        AICaptionJob.objects.create(
+            photo=photo, model="llava", status=CaptionJobStatus.SUCCESS, caption_ko="눈 덮인 오름"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            results.apply_pending_results()
+        self.assertEqual(self.ids("오름"), [photo.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.filter(name="한라산").get().delete()
+            photo.delete()
+        self.assertEqual(self.ids("오름"), [])
+
+    def test_cursor_pages_through_ranked_hits(self):
+        photos = [self.create_photo(title=f"harbor {i}") for i in range(5)]
+
+        first = self.search("harbor", page_size=2)
+        ids = [hit["id"] for hit in first.data["results"]]
+        next_url = first.data["next"]
+        while next_url:
+            page = self.client.get(next_url)
+            ids += [hit["id"] for hit in page.data["results"]]
+            next_url = page.data["next"]
+
+        self.assertCountEqual(ids, [photo.id for photo in photos])
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_facets_count_the_matching_photos(self):
+        self.create_photo(title="harbor", camera_make="Canon")
+        self.create_photo(title="harbor lights", camera_make="Canon")
+        self.create_photo(title="harbor", camera_make="Sony", visibility=PhotoVisibility.PRIVATE)
+        self.create_photo(title="forest", camera_make="Sony")
+
+        response = self.search("harbor", page_size=1, facets="true")
+
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["facets"]["camera_make"], [{"value": "Canon", "count": 2}])
+        self.assertNotIn("facets", self.search("harbor").data)
+
+    def test_facets_skip_photos_the_index_still_thinks_are_visible(self):
+        self.create_photo(title="harbor", camera_make="Canon")
+        hidden = self.create_photo(title="harbor", camera_make="Sony")
+        Photo.objects.filter(pk=hidden.pk).update(visibility=PhotoVisibility.PRIVATE)
+
+        response = self.search("harbor", facets="true")
+
+        self.assertEqual(response.data["facets"]["camera_make"], [{"value": "Canon", "count": 1}])
+
+    def test_rebuild_command_restores_the_index(self):
+        photo = self.create_photo(title="lighthouse")
+        get_backend().clear()
+        self.assertEqual(self.ids("lighthouse"), [])
+
+        call_command("rebuild_search_index", stdout=io.StringIO())
+
+        self.assertEqual(self.ids("lighthouse"), [photo.id])
+
+
+class BackendConformanceMixin:
+    backend_class = None
+
+    def setUp(self):
+        self.backend = self.backend_class()
+        self.backend.clear()
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="testpass", name="Owner"
+        )
+
+    def document(self, photo_id, owner_id=None, visibility=PhotoVisibility.PUBLIC, **text):
+        fields = dict.fromkeys(("title", "description", "captions", "location", "tags"), "")
+        return PhotoDocument(photo_id, owner_id or self.owner.pk, visibility, **{**fields, **text})
+
+    def ids(self, query, **kwargs):
+        return [photo_id for photo_id, _ in self.backend.search(query, **kwargs)]
+
+    def test_index_replaces_and_delete_removes(self):
+        self.backend.index(self.document(1, title="old harbor"))
+        self.backend.index(self.document(1, title="new harbor"))
+        self.backend.bulk_index([self.document(2, tags="harbor"), self.document(3, title="pier")])
+
+        self.assertEqual(self.ids("old"), [])
+        self.assertEqual(self.ids("new"), [1])
+        self.assertCountEqual(self.ids("harbor"), [1, 2])
+
+        self.backend.delete([1, 99])
+        self.assertEqual(self.ids("harbor"), [2])
+        self.backend.clear()
+        self.assertEqual(self.ids("pier"), [])
+
+    def test_every_term_must_match(self):
+        self.backend.bulk_index(
+            [
+                self.document(1, description="제주 바닷가에서 본 노을"),
+                self.document(2, description="부산 바닷가"),
+            ]
+        )
+
+        self.assertCountEqual(self.ids("바닷가"), [1, 2])
+        self.assertEqual(self.ids("제주 노을"), [1])
+        self.assertEqual(self.ids("제주 부산"), [])
+        self.assertEqual(self.ids("  "), [])
+
+    def test_title_matches_rank_above_location_matches(self):
+        self.backend.bulk_index(
+            [self.document(1, location="Jeju Island"), self.document(2, title="Jeju sunrise")]
+        )
+
+        hits = self.backend.search("jeju")
+        self.assertEqual([photo_id for photo_id, _ in hits], [2, 1])
+        self.assertGreater(hits[0][1], hits[1][1])
+
+    def test_hits_are_visibility_filtered(self):
+        other = User.objects.create_user(email="other@example.com", password="x", name="Other")
+        self.backend.bulk_index(
+            [
+                self.document(1, title="market", visibility=PhotoVisibility.PRIVATE),
+                self.document(2, other.pk, PhotoVisibility.SHARED, title="market"),
+                self.document(3, other.pk, PhotoVisibility.PRIVATE, title="market"),
+                self.document(4, other.pk, title="market"),
+            ]
+        )
+
+        self.assertEqual(self.ids("market"), [4])
+        self.assertEqual(self.ids("market", user=self.owner), [1, 2, 4])
+
+    def test_after_continues_from_the_last_hit(self):
+        self.backend.bulk_index(
+            [self.document(photo_id, title="harbor") for photo_id in range(1, 6)]
+            + [self.document(6, description="harbor")]
+            + [self.document(photo_id, title="pier") for photo_id in range(7, 31)]
+        )
+
+        pages, after = [], None
+        while hits := self.backend.search("harbor", limit=2, after=after):
+            pages.append([photo_id for photo_id, _ in hits])
+            after = hits[-1]
+
+        self.assertEqual(pages, [[1, 2], [3, 4], [5, 6]])
+
+    words = ["harbor", "market", "sunset", "forest", "temple", "bridge", "노을", "바다"]
+
+    def index_thousands_of_documents(self):
+        words = self.words
+        self.backend.bulk_index(
+            self.document(
+                photo_id,
+                title=f"{words[photo_id % 8]} {words[photo_id % 7]}",
+                description=" ".join(words[(photo_id + offset) % 8] for offset in range(3)),
+                tags=words[photo_id % 5],
+            )
+            for photo_id in range(1, 5001)
+        )
+
+    def test_search_over_thousands_of_documents(self):
+        self.index_thousands_of_documents()
+
+        for query in ("harbor", "market sunset", "노을 바다", "temple bridge forest"):
+            self.assertTrue(self.backend.search(query, user=self.owner))
+
+
+class SQLiteFTSBackendTests(BackendConformanceMixin, TestCase):
+    backend_class = SQLiteFTSBackend
+
+
+class InMemoryBackendTests(BackendConformanceMixin, TestCase):
+    backend_class = InMemoryBackend
+
+    def test_multi_term_queries_only_probe_from_the_shortest_posting_list(self):
+        self.index_thousands_of_documents()
+        query = ["temple", "bridge", "forest"]
+        shortest = min(len(self.backend._postings[term][0]) for term in query)
+
+        with mock.patch("search.backends.memory.bisect_left", wraps=bisect_left) as probe:
+            self.assertTrue(self.backend.search(" ".join(query), user=self.owner))
+
+        # One probe per other list for each lead id at most, whatever the library size.
+        self.assertLessEqual(probe.call_count, shortest * (len(query) - 1))
+        self.assertLess(shortest, 5000)
+
+    def test_a_new_backend_loads_existing_photos_from_the_database(self):
+        public = Photo.objects.create(
+            owner=self.owner, title="lighthouse", visibility=PhotoVisibility.PUBLIC
+        )
+        Photo.objects.create(owner=self.owner, title="lighthouse", checksum="private")
+
+        backend = InMemoryBackend()
+
+        self.assertEqual([photo_id for photo_id, _ in backend.search("lighthouse")], [public.pk])
+
+
+@override_settings(SEARCH_BACKEND="search.backends.memory.InMemoryBackend")
+class InMemorySearchAPITests(SearchAPITests):
+    pass
+
+
+class PrefixIndexTests(SimpleTestCase):
+    def test_top_ranks_prefix_matches_by_usage(self):
+        index = PrefixIndex(
+            [("sea", "Sea", 5), ("seoul", "Seoul", 9), ("sunset", "sunset", 7), ("서울", "서울", 3)]
+        )
+
+        self.assertEqual(index.top("SE"), [("Seoul", 9), ("Sea", 5)])
+        self.assertEqual(index.top("seo"), [("Seoul", 9)])
+        self.assertEqual(index.top("s", limit=2), [("Seoul", 9), ("sunset", 7)])
+        self.assertEqual(index.top("서"), [("서울", 3)])
+        self.assertEqual(index.top(" "), [])
+
+    def test_put_updates_cached_prefixes(self):
+        index = PrefixIndex([("sea", "Sea", 5)])
+        self.assertEqual(index.top("s"), [("Sea", 5)])
+
+        index.put("seoul", "Seoul", 9)
+        index.put("sea", "Sea", 0)
+        index.put("sea", "Sea", 0)
+
+        self.assertEqual(index.top("s"), [("Seoul", 9)])
+        self.assertEqual(index.top("se"), [("Seoul", 9)])
+        self.assertEqual(len(index), 1)
+
+    def test_top_k_over_many_keys_ranks_a_bounded_number_of_keys(self):
+        rng = random.Random(7)
+        letters = "abcdefghijklmnopqrstuvwxyz"
+        index = PrefixIndex(
+            ("".join(rng.choices(letters, k=8)) + str(number), "", rng.randrange(1, 10_000))
+            for number in range(200_000)
+        )
+        prefixes = [letters[i % 26] + letters[i * 7 % 26] + letters[i * 3 % 26] for i in range(50)]
+        prefixes += [letters[i % 26] for i in range(50)]
+
+        for prefix in prefixes:
+            with mock.patch.object(index, "_rank", wraps=index._rank) as rank:
+                self.assertTrue(index.top(prefix))
+            self.assertLessEqual(rank.call_count, PrefixIndex.dense_prefix_keys, prefix)
+
+    def test_top_k_over_skewed_prefixes_ranks_a_bounded_number_of_keys(self):
+        rng = random.Random(8)
+        keys = [f"img_{number:07d}" for number in range(150_000)]
+        keys += [f"screenshot 2024-{number:06d}" for number in range(50_000)]
+        keys += ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=8)) for _ in range(50_000)]
+        index = PrefixIndex((key, key, rng.randrange(1, 10_000)) for key in keys)
+        prefixes = ["i", "img", "img_", "img_00", "img_01", "screenshot", "screenshot 2024-0"]
+
+        for prefix in prefixes:
+            with mock.patch.object(index, "_rank", wraps=index._rank) as rank:
+                self.assertEqual(len(index.top(prefix, 20)), 20)
+            # Dense ranges are served from their cached top keys without ranking.
+            self.assertLessEqual(rank.call_count, PrefixIndex.dense_prefix_keys, prefix)
+
+    def test_cached_dense_prefixes_match_a_full_scan_after_updates(self):
+        rng = random.Random(9)
+        counts = {f"img_{number:04d}": rng.randrange(1, 100) for number in range(3000)}
+        index = PrefixIndex((key, key, count) for key, count in counts.items())
+        for _ in range(2000):
+            key = f"img_{rng.randrange(3200):04d}"
+            counts[key] = rng.choice([0, rng.randrange(1, 100)])
+            index.put(key, key, counts[key])
+
+        for prefix in ("i", "img_", "img_1", "img_2"):
+            expected = sorted(
+                (key for key, count in counts.items() if count and key.startswith(prefix)),
+                key=lambda key: (-counts[key], key),
+            )[:20]
+            self.assertEqual(index.top(prefix, 20), [(key, counts[key]) for key in expected])
+
+
+class AutocompleteAPITests(APITestCase):
+    def setUp(self):
+        autocomplete.reset()
+        self.addCleanup(autocomplete.reset)
+        self.user = User.objects.create_user(
+            email="owner@example.com", password="testpass", name="Owner"
+        )
+        self.client.force_authenticate(self.user)
+        self.url = reverse("search:autocomplete")
+
+    def create_photo(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Photo.objects.create(
+                owner=self.user,
+                file=f"p{Photo.objects.count()}.jpg",
+                checksum=f"c{Photo.objects.count()}",
+                **fields,
+            )
+
+    def suggest(self, q, **params):
+        response = self.client.get(self.url, {"q": q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_tags_and_public_titles_rank_by_usage(self):
+        photos = [self.create_photo(visibility=PhotoVisibility.PUBLIC) for _ in range(3)]
+        self.create_photo(title="Seoul tower", visibility=PhotoVisibility.PUBLIC)
+        self.create_photo(title="Seoul secret", visibility=PhotoVisibility.PRIVATE)
+        sync_photo_tags(
+            {photos[0].pk: ["Seaside"], photos[1].pk: ["Seoul"], photos[2].pk: ["Seoul"]}
+        )
+
+        data = self.suggest("se")
+
+        self.assertEqual(
+            data["tags"], [{"name": "Seoul", "uses": 2}, {"name": "Seaside", "uses": 1}]
+        )
+        self.assertEqual(data["titles"], [{"title": "Seoul tower", "uses": 1}])
+        self.assertEqual(len(self.suggest("se", limit=1)["tags"]), 1)
+
+    def test_index_follows_tag_and_title_changes(self):
+        photo = self.create_photo(title="Busan", visibility=PhotoVisibility.PUBLIC)
+        self.assertEqual(self.suggest("b"), {"tags": [], "titles": [{"title": "Busan", "uses": 1}]})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sync_photo_tags({photo.pk: ["beach"]})
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.title = "Jeju"
+            photo.save()
+        self.assertEqual(self.suggest("b"), {"tags": [{"name": "beach", "uses": 1}], "titles": []})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.filter(name="beach").update(name="bay")
+            Tag.objects.get(name="bay").save()
+        self.assertEqual(self.suggest("be")["tags"], [])
+        self.assertEqual(self.suggest("ba")["tags"], [{"name": "bay", "uses": 1}])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sync_photo_tags({photo.pk: []})
+        self.assertEqual(self.suggest("ba")["tags"], [])
+
+    @override_settings(SEARCH_AUTOCOMPLETE_RECHECK_SECONDS=0)
+    def test_rows_written_by_other_processes_are_picked_up(self):
+        photo = self.create_photo(title="Busan", visibility=PhotoVisibility.PUBLIC)
+        self.assertEqual(self.suggest("b")["titles"], [{"title": "Busan", "uses": 1}])
+
+        # Nothing is committed here, so no on_commit refresh runs: only the
+        # version check can notice these rows, as if another process wrote them.
+        tag = Tag.objects.create(name="beach")
+        PhotoTag.objects.bulk_create([PhotoTag(photo=photo, tag=tag)])
+        Photo.objects.bulk_create(
+            [
+                Photo(
+                    owner=self.user,
+                    checksum="other",
+                    title="Bukchon",
+                    visibility=PhotoVisibility.PUBLIC,
+                )
+            ]
+        )
+        with mock.patch.object(autocomplete.TagSuggestions, "load") as load:
+            data = self.suggest("b")
+        load.assert_not_called()
+        self.assertEqual(data["tags"], [{"name": "beach", "uses": 1}])
+        self.assertCountEqual(
+            data["titles"], [{"title": "Busan", "uses": 1}, {"title": "Bukchon", "uses": 1}]
+        )
+
+        PhotoTag.objects.all().delete()
+        Photo.objects.filter(title="Bukchon").delete()
+        self.assertEqual(self.suggest("b"), {"tags": [], "titles": [{"title": "Busan", "uses": 1}]})
+
+        with override_settings(SEARCH_AUTOCOMPLETE_RECHECK_SECONDS=60):
+            Photo.objects.filter(pk=photo.pk).delete()
+            self.assertEqual(self.suggest("b")["titles"], [{"title": "Busan", "uses": 1}])
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(self.url, {"q": "se"})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+def unit(vector):
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector]
+
+
+class SimilarityIndexTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(SEARCH_SIMILARITY_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        similarity.reset()
+        self.addCleanup(similarity.reset)
+        self.shape = similarity.index_shape()
+        rng = random.Random(5)
+        self.vectors = {
+            photo_id: unit([rng.gauss(0, 1) for _ in range(self.shape.dims)])
+            for photo_id in range(1, 1001)
+        }
+
+    def write(self, items, rebuild=False):
+        with similarity.IndexWriter(settings.SEARCH_SIMILARITY_DIR, self.shape, rebuild) as writer:
+            for photo_id, vector in items:
+                writer.add(photo_id, vector)
+
+    def test_descriptor_ranks_a_resized_copy_above_other_scenes(self):
+        original = describe(make_scene(1))
+        copy = describe(make_scene(1, size=(320, 240), quality=40))
+
+        def cosine(a, b):
+            return sum(x * y for x, y in zip(a, b))
+
+        self.assertAlmostEqual(cosine(original, original), 1.0)
+        for seed in range(2, 6):
+            self.assertGreater(cosine(original, copy), cosine(original, describe(make_scene(seed))))
+
+    @override_settings(SEARCH_SIMILARITY_MAX_CANDIDATES=300)
+    def test_lsh_candidates_hold_the_nearest_neighbours(self):
+        rng = random.Random(6)
+        near = {
+            photo_id + 1000: unit([v + rng.gauss(0, 0.02) for v in self.vectors[photo_id]])
+            for photo_id in range(1, 21)
+        }
+        self.write([*self.vectors.items(), *near.items()])
+        index = similarity.get_index()
+        self.assertEqual(len(index), 1020)
+
+        for photo_id in range(1, 21):
+            hits = index.neighbours(photo_id, 5)
+            self.assertEqual(hits[0][0], photo_id + 1000)
+            self.assertAlmostEqual(
+                hits[0][1],
+                sum(a * b for a, b in zip(self.vectors[photo_id], near[photo_id + 1000])),
+                places=2,
+            )
+            self.assertEqual(
+                [score for _, score in hits], sorted((s for _, s in hits), reverse=True)
+            )
+
+    def test_appends_are_picked_up_and_a_rebuild_replaces_the_index(self):
+        self.assertIsNone(similarity.get_index())
+        self.write(list(self.vectors.items())[:500])
+        index = similarity.get_index()
+        self.assertIs(similarity.get_index(), index)
+        self.assertNotIn(700, index)
+
+        self.write(list(self.vectors.items())[500:])
+        self.assertIs(similarity.get_index(), index)
+        self.assertEqual(len(index), 1000)
+        fresh = similarity.SimilarityIndex(settings.SEARCH_SIMILARITY_DIR)
+        for photo_id in (1, 700):
+            self.assertEqual(index.neighbours(photo_id, 10), fresh.neighbours(photo_id, 10))
+        self.assertEqual(
+            [round(value, 2) for value in index.vector(700)],
+            [round(value, 2) for value in self.vectors[700]],
+        )
+
+        self.write([(2000, self.vectors[1])], rebuild=True)
+        self.assertIsNot(similarity.get_index(), index)
+        self.assertEqual(list(similarity.get_index().ids), [2000])
+
+    def test_replaced_vector_maps_are_closed_once_no_query_uses_them(self):
+        self.write(list(self.vectors.items())[:500])
+        index = similarity.get_index()
+        first = index._map.mapping
+
+        with index._vectors() as held:
+            self.write(list(self.vectors.items())[500:700])
+            self.assertIs(similarity.get_index(), index)
+            self.assertFalse(held.closed)
+            self.assertIs(held, first)
+        self.assertTrue(first.closed)
+
+        self.write(list(self.vectors.items())[700:])
+        self.assertTrue(similarity.get_index().neighbours(900, 5))
+        latest = index._map.mapping
+        self.write([(2000, self.vectors[1])], rebuild=True)
+        self.assertIsNot(similarity.get_index(), index)
+        self.assertTrue(latest.closed)
+        with self.assertRaises(ValueError):
+            index.vector(900)
+
+    def test_rows_without_an_id_are_discarded_by_the_next_writer(self):
+        self.write([(1, self.vectors[1])])
+        with self.assertRaises(RuntimeError):
+            with similarity.IndexWriter(settings.SEARCH_SIMILARITY_DIR, self.shape) as writer:
+                writer.add(2, self.vectors[2])
+                raise RuntimeError
+        self.assertEqual(list(similarity.get_index().ids), [1])
+
+        self.write([(3, self.vectors[3])])
+        index = similarity.get_index()
+        self.assertEqual(list(index.ids), [1, 3])
+        self.assertEqual(index.neighbours(1, 5)[0][0], 3)
+
+    @override_settings(SEARCH_SIMILARITY_MAX_CANDIDATES=500)
+    def test_queries_over_many_photos_rerank_a_bounded_number_of_rows(self):
+        rng = random.Random(7)
+        self.write(
+            (photo_id, unit([rng.gauss(0, 1) for _ in range(self.shape.dims)]))
+            for photo_id in range(1, 5001)
+        )
+        index = similarity.get_index()
+
+        with mock.patch.object(index, "_scores", wraps=index._scores) as rerank:
+            for photo_id in range(1, 101):
+                self.assertEqual(len(index.neighbours(photo_id, 20)), 20)
+        # Probing stops once the budget is reached, at most one bucket past it.
+        largest_bucket = max(len(rows) for table in index._buckets for rows in table.values())
+        for call in rerank.call_args_list:
+            self.assertLessEqual(len(call.args[0]), 500 + largest_bucket)
+
+
+class SimilarPhotosAPITests(TemporaryMediaMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(
+            SEARCH_SIMILARITY_DIR=os.path.join(settings.MEDIA_ROOT, "similarity")
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        similarity.reset()
+        self.addCleanup(similarity.reset)
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="testpass", name="Owner"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", password="testpass", name="Other"
+        )
+
+    def create_photo(self, content, owner=None, visibility=PhotoVisibility.PUBLIC):
+        path = default_storage.save("photos/originals/scene.jpg", io.BytesIO(content))
+        return Photo.objects.create(
+            owner=owner or self.owner,
+            file=path,
+            checksum=path,
+            visibility=visibility,
+        )
+
+    def update_index(self):
+        out = io.StringIO()
+        call_command("update_similarity_index", workers=1, stdout=out)
+        return out.getvalue()
+
+    def similar(self, photo, **params):
+        return self.client.get(reverse("search:similar", args=[photo.pk]), params)
+
+    def test_neighbours_are_ranked_and_visibility_filtered(self):
+        original = self.create_photo(make_scene(1))
+        copy = self.create_photo(make_scene(1, size=(320, 240), quality=40))
+        hidden = self.create_photo(
+            make_scene(1, quality=60), owner=self.other, visibility=PhotoVisibility.PRIVATE
+        )
+        others = [self.create_photo(make_scene(seed)) for seed in range(2, 6)]
+        self.update_index()
+
+        response = self.similar(original)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [hit["id"] for hit in response.data["results"]]
+        self.assertEqual(ids[0], copy.pk)
+        self.assertNotIn(hidden.pk, ids)
+        self.assertCountEqual(ids, [copy.pk, *(photo.pk for photo in others)])
+        self.assertEqual(len(self.similar(original, limit=2).data["results"]), 2)
+
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.similar(original).data["results"][0]["id"], hidden.pk)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.similar(hidden).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_update_only_describes_new_photos(self):
+        original = self.create_photo(make_scene(1))
+        self.create_photo(make_scene(2))
+        Photo.objects.create(owner=self.owner, file="photos/originals/missing.jpg", checksum="gone")
+        self.assertIn("Indexed 2 photo(s); 1 could not be decoded.", self.update_index())
+        self.assertLess(self.similar(original).data["results"][0]["score"], 0.9)
+
+        copy = self.create_photo(make_scene(1, size=(320, 240)))
+        self.assertEqual(self.similar(copy).data["results"], [])
+        # Unreadable photos past the last indexed one are retried.
+        self.assertIn("Indexed 1 photo(s); 1 could not be decoded.", self.update_index())
+
+        self.assertEqual(self.similar(original).data["results"][0]["id"], copy.pk)
+        self.assertEqual(self.similar(copy).data["results"][0]["id"], original.pk)
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+
+# Hangul syllables and jamo. Korean is agglutinative ("바닷가의", "바닷가에서"),
+# so whole words rarely match a query; overlapping syllable bigrams do.
+HANGUL = "ᄀ-ᇿ㄰-㆏가-힣"
+WORD_RE = re.compile(rf"[{HANGUL}]+|[^\W{HANGUL}]+")
+HANGUL_RE = re.compile(rf"[{HANGUL}]")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split ``text`` into casefolded index terms.
+
+    Hangul runs become overlapping syllable bigrams (a lone syllable stays a
+    unigram); every other word is kept whole.
+    """
+    tokens = []
+    for word in WORD_RE.findall(unicodedata.normalize("NFKC", text or "").casefold()):
+        if HANGUL_RE.match(word) and len(word) > 1:
+            tokens.extend(word[index : index + 2] for index in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def index_text(text: str) -> str:
+    """``text`` as space-separated terms, ready for a whitespace tokenizer."""
+    return " ".join(tokenize(text))
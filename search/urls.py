@@ -0,0 +1,11 @@
+from django.urls import path
+
+from search.views import AutocompleteView, SearchView, SimilarPhotosView
+
+app_name = "search"
+
+urlpatterns = [
+    path("", SearchView.as_view(), name="search"),
+    path("autocomplete/", AutocompleteView.as_view(), name="autocomplete"),
+    path("similar/<int:photo_id>/", SimilarPhotosView.as_view(), name="similar"),
+]
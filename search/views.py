@@ -1,3 +1,137 @@
-from django.shortcuts import render
+from __future__ import annotations
 
-# Create your views here.
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Prefetch, QuerySet
+from rest_framework import permissions
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
+
+from photos.models import Photo, PhotoTag
+from photos.selectors.facets import facet_counts
+from photos.selectors.visibility import visible_photos
+from photos.serializers import PhotoSerializer
+from search.backends import get_backend
+from search.serializers import (
+    AutocompleteQuerySerializer,
+    SearchQuerySerializer,
+    SimilarQuerySerializer,
+)
+from search.services.autocomplete import get_suggestions
+from search.services.similarity import get_index
+
+
+def encode_cursor(photo_id: int, score: float) -> str:
+    payload = json.dumps([photo_id, score]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[int, float]:
+    try:
+        photo_id, score = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return int(photo_id), float(score)
+    except (ValueError, TypeError):
+        raise NotFound("Invalid cursor")
+
+
+def serialize_hits(request, queryset: QuerySet[Photo], hits: list[tuple[int, float]]) -> list:
+    """Hits of ``queryset`` in ranked order, each serialized with its score."""
+    photos = queryset.select_related("owner").prefetch_related(
+        Prefetch("photo_tags", queryset=PhotoTag.objects.select_related("tag"))
+    )
+    photos = photos.in_bulk([photo_id for photo_id, _ in hits])
+    results = []
+    for photo_id, score in hits:
+        if photo_id in photos:
+            data = PhotoSerializer(photos[photo_id], context={"request": request}).data
+            results.append({"score": score, **data})
+    return results
+
+
+class SearchView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        params = SearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        page_size = params.validated_data["page_size"]
+        cursor = params.validated_data.get("cursor")
+        hits = get_backend().search(
+            params.validated_data["q"],
+            user=request.user,
+            limit=page_size + 1,
+            after=decode_cursor(cursor) if cursor else None,
+        )
+        has_next = len(hits) > page_size
+        hits = hits[:page_size]
+
+        # The index keeps its own copy of each photo's visibility, which can
+        # lag behind the database; what is returned is checked again here.
+        results = serialize_hits(request, visible_photos(request.user), hits)
+        next_link = None
+        if has_next:
+            next_link = replace_query_param(
+                request.build_absolute_uri(), "cursor", encode_cursor(*hits[-1])
+            )
+        payload = {"next": next_link, "results": results}
+        if params.validated_data["facets"]:
+            matches = get_backend().search(
+                params.validated_data["q"], user=request.user, limit=settings.SEARCH_FACET_MAX_HITS
+            )
+            payload["facets"] = facet_counts(
+                visible_photos(request.user).filter(pk__in=[photo_id for photo_id, _ in matches])
+            )
+        return Response(payload)
+
+
+class AutocompleteView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        params = AutocompleteQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        prefix, limit = params.validated_data["q"], params.validated_data["limit"]
+        tags, titles = get_suggestions()
+        return Response(
+            {
+                "tags": [
+                    {"name": name, "uses": uses} for name, uses in tags.index.top(prefix, limit)
+                ],
+                "titles": [
+                    {"title": title, "uses": uses}
+                    for title, uses in titles.index.top(prefix, limit)
+                ],
+            }
+        )
+
+
+class SimilarPhotosView(APIView):
+    """Photos that look like ``photo_id``, from the visual similarity index.
+
+    Only photos indexed by ``update_similarity_index`` are found; a photo saved
+    since its last run has no results and appears in no one else's.
+    """
+
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, photo_id):
+        params = SimilarQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        visible = visible_photos(request.user)
+        if not visible.filter(pk=photo_id).exists():
+            raise NotFound()
+        index = get_index()
+        if index is None or photo_id not in index:
+            return Response({"results": []})
+        # Neighbours are ranked over every photo; those the user may not see
+        # are dropped by a single query over the candidates.
+        hits = index.neighbours(photo_id, settings.SEARCH_SIMILARITY_MAX_CANDIDATES)
+        allowed = set(
+            visible.filter(pk__in=[hit_id for hit_id, _ in hits]).values_list("pk", flat=True)
+        )
+        hits = [hit for hit in hits if hit[0] in allowed][: params.validated_data["limit"]]
+        return Response({"results": serialize_hits(request, visible, hits)})